@@ -1,6 +1,25 @@
+import os
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_mail import Mail
+from sqlalchemy.orm import configure_mappers
 from app.extensions import db, migrate, jwt
+from app.db_pool import configure_pool_metrics
+from app.db_routing import configure_replicas, init_replica_routing
+from app.instrumentation import init_instrumentation
+from app.profiling import init_profiling
+from app.json_provider import init_json_provider
+from app.compression import init_compression
+from app.customer_stats import init_customer_stats
+from app.analytics import init_analytics
+from app.exports import init_exports
+from app.soft_delete import init_soft_delete
+from app.user_import import init_user_import
+from app.rate_limit import init_rate_limit
+from app.idempotency import init_idempotency
+from app.token_blocklist import init_token_blocklist
+from app.jwt_keys import init_jwt_keys
+from app.jwt_cache import init_jwt_cache
 from app.controllers.auth.auth_controller import auth
 from app.controllers.users.users_controller import users
 from app.controllers.bookings.bookings_controller import bookings
@@ -8,22 +27,84 @@ from app.controllers.services.services_controller import services
 from app.controllers.gallery.gallery_controller import galleries
 from app.controllers.messages.messages_controller import messages
 from app.controllers.feedbacks.feedback_controller import feedbacks
+from app.controllers.metrics.metrics_controller import metrics
+from app.controllers.profiles.profiles_controller import profiles
+from app.controllers.analytics.analytics_controller import analytics
 
-def create_app():
+def create_app(config_name=None):
     # Application factory function
     app = Flask(__name__)
     # Registering the config class within the factory function.
-    app.config.from_object('config.Config')
+    # The environment (development, testing, production) is picked with the FLASK_CONFIG environment variable.
+    from config import config_by_name
+    config_name = config_name or os.environ.get('FLASK_CONFIG', 'default')
+    app.config.from_object(config_by_name[config_name])
+
+    # JSON encoder of the responses, dates and times are written in ISO format.
+    init_json_provider(app)
+
+    # Client address and scheme taken from the X-Forwarded-* headers of the proxies in front of the app (PROXY_FIX_*).
+    if app.config['PROXY_FIX_X_FOR'] or app.config['PROXY_FIX_X_PROTO'] or app.config['PROXY_FIX_X_HOST']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'],
+                                x_proto=app.config['PROXY_FIX_X_PROTO'], x_host=app.config['PROXY_FIX_X_HOST'])
+
+    # Timing connection checkouts from the pool, has to be set up before the engine is created.
+    configure_pool_metrics(app)
+
+    # Read replicas are added as extra binds before the engines are created.
+    replica_binds = configure_replicas(app)
 
     # Initialization of the app instance
     db.init_app(app)
 
+    # Routing the reads of GET requests to the replicas.
+    init_replica_routing(app, db, replica_binds)
+
     # initializing the migrate app and db instance
     migrate.init_app(app, db)
 
     # Initializing the jwt object in the app.
     jwt.init_app(app)
 
+    # Signing the tokens with the key ring and publishing its public keys, when JWT_KEYS_PATH is set.
+    init_jwt_keys(app)
+
+    # Cache of the claims of recently verified tokens, when JWT_VERIFY_CACHE_SIZE is set.
+    init_jwt_cache(app)
+
+    # Refusing revoked tokens, checked in memory (see app/token_blocklist.py).
+    init_token_blocklist(app)
+
+    # Request latency and SQL query metrics, served on /metrics.
+    init_instrumentation(app)
+
+    # Sampled and on demand request profiling, browsable on /api/profiles.
+    init_profiling(app)
+
+    # gzip/brotli compression of the JSON and text responses.
+    init_compression(app)
+
+    # Booking counters behind the customer dashboard, and the command rebuilding them.
+    init_customer_stats(app)
+
+    # Daily service rollups behind the analytics endpoints, and the command rebuilding them.
+    init_analytics(app)
+
+    # Command exporting the bookings to csv/parquet/feather files.
+    init_exports(app)
+
+    # Soft deleted users and services left out of the queries, and the job purging them.
+    init_soft_delete(app)
+
+    # Command importing users in bulk from a csv or ndjson file.
+    init_user_import(app)
+
+    # Per client and per endpoint request limits, and concurrency caps on the expensive endpoints.
+    init_rate_limit(app)
+
+    # Responses of the create endpoints stored by Idempotency-Key, replayed to the retries.
+    init_idempotency(app)
+
     # initializing the email extensions in the app.
     mail = Mail()
     mail.init_app(app)
@@ -35,6 +116,12 @@ def create_app():
     from app.models.gallery import Gallery
     from app.models.bookings import Booking
     from app.models.messages import Message
+    from app.models.customer_stats import CustomerStats
+    from app.models.service_daily_stats import ServiceDailyStats
+    from app.models.token_revocations import TokenRevocation
+
+    # Setting up the model relationships now so backrefs such as User.bookings can be used in query options.
+    configure_mappers()
 
     # Registering blueprints
     # auth blueprint
@@ -58,6 +145,15 @@ def create_app():
     # message blueprint
     app.register_blueprint(messages)
 
+    # metrics blueprint
+    app.register_blueprint(metrics)
+
+    # profiles blueprint
+    app.register_blueprint(profiles)
+
+    # analytics blueprint
+    app.register_blueprint(analytics)
+
     @app.route("/")
     def home():
         return "Kask API Setup"
@@ -0,0 +1,240 @@
+from collections import defaultdict
+from datetime import date, datetime
+import click
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect as sa_inspect
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app.booking_changes import as_date, as_time, changed, previous_value, track_previous
+from app.db_routing import RoutingSession
+
+# Revenue and utilisation analytics.
+# service_daily_stats holds one row per service and booking day (bookings, booked hours, revenue, cancellations,
+# misses). A before_flush listener adds the difference every booking insert, change and delete makes, so the reports
+# read a few rollup rows instead of the bookings. "flask rebuild-analytics" recomputes the rollups from the bookings,
+# run it once after creating the table and after bulk deletes (Query.delete() skips the listener).
+
+# Booking attributes the rollups depend on.
+TRACKED = ('service_id', 'booking_date', 'start_time', 'end_time', 'booking_status', 'total_unit_price')
+
+# Rollup columns, summed by the reports.
+COUNTERS = ('bookings_count', 'booked_hours', 'revenue', 'cancelled_count', 'missed_count', 'completed_count')
+FLOAT_COUNTERS = ('booked_hours', 'revenue')
+
+
+def _typed(counter, value):
+    return value if counter in FLOAT_COUNTERS else int(value)
+
+
+def _hours(start, end):
+    start, end = as_time(start), as_time(end)
+    if start is None or end is None:
+        return 0.0
+    return (datetime.combine(date.min, end) - datetime.combine(date.min, start)).total_seconds() / 3600
+
+
+# What one booking adds to the rollup of its service and day.
+def contribution(status, start, end, price):
+    status = (status or '').lower()
+    values = {'bookings_count': 1}
+    if status == 'cancelled':
+        values['cancelled_count'] = 1
+        return values
+    values['booked_hours'] = _hours(start, end)
+    values['revenue'] = price or 0.0
+    if status == 'missed':
+        values['missed_count'] = 1
+    elif status == 'completed':
+        values['completed_count'] = 1
+    return values
+
+
+def _add(deltas, service_id, day, start, end, status, price, sign):
+    if service_id is None or day is None:
+        return
+    delta = deltas[(service_id, as_date(day))]
+    for counter, value in contribution(status, start, end, price).items():
+        delta[counter] += sign * value
+
+
+def _booking_values(booking):
+    return [getattr(booking, name) for name in TRACKED]
+
+
+def _previous_values(state):
+    return [previous_value(state, name) for name in TRACKED]
+
+
+# Rollups computed from the stored bookings matching the filters: {(service_id, day): {counter: value}}.
+def aggregate_bookings(session, *filters):
+    from app.models.bookings import Booking
+
+    columns = [getattr(Booking, name) for name in TRACKED]
+    totals = defaultdict(lambda: defaultdict(float))
+    # Time arithmetic is not portable between MySQL and SQLite, the hours are added up here.
+    for row in session.query(*columns).filter(*filters).yield_per(1000):
+        _add(totals, *row, 1)
+    return totals
+
+
+def _fill(stats, values):
+    for counter in COUNTERS:
+        setattr(stats, counter, _typed(counter, values.get(counter, 0)))
+
+
+# Creates the rollup of a service and day from the stored bookings plus delta, in one INSERT ... ON DUPLICATE KEY
+# UPDATE (ON CONFLICT DO UPDATE): when another request created the row meanwhile, only delta is added to it, so two
+# first bookings of the same day neither fail on the primary key nor count the stored bookings twice.
+def upsert_rollup(session, service_id, day, stored, delta):
+    from app.models.service_daily_stats import ServiceDailyStats
+
+    table = ServiceDailyStats.__table__
+    values = {counter: _typed(counter, stored.get(counter, 0) + delta[counter]) for counter in COUNTERS}
+    increments = {counter: table.c[counter] + _typed(counter, delta[counter]) for counter in COUNTERS if delta[counter]}
+    increments['updated_at'] = datetime.now()
+
+    dialect = session.connection().dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table).values(service_id=service_id, day=day, **values).on_duplicate_key_update(**increments)
+    else:
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = (insert(table).values(service_id=service_id, day=day, **values)
+                     .on_conflict_do_update(index_elements=['service_id', 'day'], set_=increments))
+    session.execute(statement)
+
+
+# Runs before every flush: turns the new, changed and deleted bookings into rollup updates.
+def _update_rollups(session, flush_context, instances):
+    if not has_app_context() or not current_app.config.get('ANALYTICS_ROLLUPS_ENABLED'):
+        return
+
+    from app.models.bookings import Booking
+    from app.models.service_daily_stats import ServiceDailyStats
+
+    deltas = defaultdict(lambda: defaultdict(float))
+    for booking in session.new:
+        if isinstance(booking, Booking):
+            _add(deltas, *_booking_values(booking), 1)
+    for booking in session.deleted:
+        if isinstance(booking, Booking):
+            _add(deltas, *_previous_values(sa_inspect(booking)), -1)
+    for booking in session.dirty:
+        if not isinstance(booking, Booking) or booking in session.deleted:
+            continue
+        state = sa_inspect(booking)
+        if not changed(state, TRACKED):
+            continue
+        _add(deltas, *_previous_values(state), -1)
+        _add(deltas, *_booking_values(booking), 1)
+
+    for (service_id, day), delta in deltas.items():
+        if not any(delta.values()):
+            continue
+        stats = session.get(ServiceDailyStats, (service_id, day))
+        if stats is None:
+            # First write for this service and day: starting from the bookings already stored.
+            stored = aggregate_bookings(session, Booking.service_id == service_id, Booking.booking_date == day)
+            upsert_rollup(session, service_id, day, stored.get((service_id, day), {}), delta)
+            continue
+
+        # Incrementing in SQL (revenue = revenue + x) so concurrent requests do not overwrite each other.
+        for counter in COUNTERS:
+            if delta[counter]:
+                setattr(stats, counter, getattr(ServiceDailyStats, counter) + _typed(counter, delta[counter]))
+
+
+# Recomputes the rollups of the days between start and end (every day when not given).
+def rebuild_rollups(start=None, end=None):
+    from app.extensions import db
+    from app.models.bookings import Booking
+    from app.models.service_daily_stats import ServiceDailyStats
+
+    booking_filters, stats_filters = [], []
+    if start:
+        booking_filters.append(Booking.booking_date >= start)
+        stats_filters.append(ServiceDailyStats.day >= start)
+    if end:
+        booking_filters.append(Booking.booking_date <= end)
+        stats_filters.append(ServiceDailyStats.day <= end)
+
+    totals = aggregate_bookings(db.session, *booking_filters)
+    db.session.query(ServiceDailyStats).filter(*stats_filters).delete()
+    for (service_id, day), values in totals.items():
+        stats = ServiceDailyStats(service_id, day)
+        _fill(stats, values)
+        db.session.add(stats)
+    db.session.commit()
+    return len(totals)
+
+
+def _row(values, days, open_hours):
+    row = {
+        'bookings': int(values['bookings_count'] or 0),
+        'booked_hours': round(values['booked_hours'] or 0.0, 2),
+        'revenue': round(values['revenue'] or 0.0, 2),
+        'cancelled': int(values['cancelled_count'] or 0),
+        'missed': int(values['missed_count'] or 0),
+        'completed': int(values['completed_count'] or 0),
+    }
+    # Share of the bookable hours (ANALYTICS_OPEN_HOURS a day) that were booked.
+    row['occupancy'] = round(row['booked_hours'] / (open_hours * days), 4) if open_hours and days else None
+    return row
+
+
+# Revenue and occupancy of every service for every day of the range, read from the rollups.
+def daily_report(start, end, service_id=None):
+    from app.extensions import db
+    from app.models.services import Service
+    from app.models.service_daily_stats import ServiceDailyStats
+
+    query = (db.session.query(ServiceDailyStats, Service.service_name)
+             .join(Service, Service.id == ServiceDailyStats.service_id)
+             .filter(ServiceDailyStats.day >= start, ServiceDailyStats.day <= end))
+    if service_id is not None:
+        query = query.filter(ServiceDailyStats.service_id == service_id)
+
+    open_hours = current_app.config['ANALYTICS_OPEN_HOURS']
+    report = []
+    for stats, service_name in query.order_by(ServiceDailyStats.day, ServiceDailyStats.service_id):
+        row = {'day': stats.day, 'service_id': stats.service_id, 'service_name': service_name}
+        row.update(_row({counter: getattr(stats, counter) for counter in COUNTERS}, 1, open_hours))
+        report.append(row)
+    return report
+
+
+# Totals of every service over the range, one GROUP BY over the rollups.
+def services_report(start, end):
+    from app.extensions import db
+    from app.models.services import Service
+    from app.models.service_daily_stats import ServiceDailyStats
+
+    sums = [func.sum(getattr(ServiceDailyStats, counter)) for counter in COUNTERS]
+    rows = (db.session.query(Service.id, Service.service_name, *sums)
+            .outerjoin(ServiceDailyStats, (ServiceDailyStats.service_id == Service.id)
+                       & (ServiceDailyStats.day >= start) & (ServiceDailyStats.day <= end))
+            .group_by(Service.id, Service.service_name)
+            .order_by(Service.id))
+
+    days = (end - start).days + 1
+    open_hours = current_app.config['ANALYTICS_OPEN_HOURS']
+    report = []
+    for service_id, service_name, *values in rows:
+        row = {'service_id': service_id, 'service_name': service_name}
+        row.update(_row(dict(zip(COUNTERS, values)), days, open_hours))
+        report.append(row)
+    return report
+
+
+def init_analytics(app):
+    from app.models.bookings import Booking
+
+    if not event.contains(RoutingSession, 'before_flush', _update_rollups):
+        event.listen(RoutingSession, 'before_flush', _update_rollups)
+        track_previous(*(getattr(Booking, name) for name in TRACKED))
+
+    @app.cli.command('rebuild-analytics')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='first booking day to rebuild')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='last booking day to rebuild')
+    def rebuild_analytics_command(start, end):
+        # Recompute the daily service rollups from the bookings table.
+        count = rebuild_rollups(start.date() if start else None, end.date() if end else None)
+        print(f"Rebuilt {count} daily service rollups.")
@@ -0,0 +1,38 @@
+from datetime import date, time
+from sqlalchemy import event
+
+# Helpers for the listeners that keep counters in step with booking writes (app/customer_stats.py, app/analytics.py).
+# A listener takes off what a booking counted for before the flush and adds what it counts for after it.
+
+
+def _keep_value(target, value, oldvalue, initiator):
+    return value
+
+
+# Makes SQLAlchemy load the stored value of these attributes before they are replaced, even on an expired object
+# (e.g. after a commit), so previous_value() knows what the booking counted for.
+def track_previous(*attributes):
+    for attribute in attributes:
+        if not event.contains(attribute, 'set', _keep_value):
+            event.listen(attribute, 'set', _keep_value, active_history=True, retval=True)
+
+
+# Value of an attribute before the changes being flushed.
+def previous_value(state, attribute):
+    history = state.attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return state.attrs[attribute].value
+
+
+def changed(state, attributes):
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+# The bookings controllers may assign ISO strings to the date and time columns before they are flushed.
+def as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def as_time(value):
+    return time.fromisoformat(value) if isinstance(value, str) else value
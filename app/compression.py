@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request
+
+# Response compression.
+# JSON and text responses are compressed with the best encoding the client accepts (br, then gzip) once they are
+# larger than COMPRESSION_MIN_SIZE. Streamed responses are compressed chunk by chunk as they are sent.
+# Views marked with @precompressed (the catalog endpoints, whose body is the same for every client) keep their
+# compressed body in memory, keyed by the hash of the uncompressed body, so the same bytes are compressed only once.
+
+try:
+    import brotli
+except ImportError: # brotli is optional, only gzip is offered without it.
+    brotli = None
+
+# Status codes that never carry a body worth compressing.
+SKIPPED_STATUSES = (204, 206, 304)
+
+
+class CompressedCache:
+    # Least recently used compressed bodies, limited by their total size.
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body, limit):
+        if len(body) > limit:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > limit:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+compressed_cache = CompressedCache()
+
+
+# Marks a view whose response can be reused by every client, its compressed body is cached.
+def precompressed(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.precompressed = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESSION_BROTLI_QUALITY'])
+    # mtime=0 gives the same bytes for the same body, so the cached copies stay comparable.
+    return gzip.compress(data, compresslevel=config['COMPRESSION_GZIP_LEVEL'], mtime=0)
+
+
+# Compresses the chunks of a streamed body as they are produced.
+def compress_stream(chunks, encoding, config):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['COMPRESSION_BROTLI_QUALITY'])
+        flush, finish = compressor.flush, compressor.finish
+        process = compressor.process
+    else:
+        compressor = zlib.compressobj(config['COMPRESSION_GZIP_LEVEL'], zlib.DEFLATED, 31) # 31: gzip container.
+        process = compressor.compress
+        flush, finish = (lambda: compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = process(chunk)
+            # Flushing every chunk so the client receives rows as soon as the server produces them.
+            data += flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _compress_response(response):
+    config = current_app.config
+    if (response.status_code < 200 or response.status_code in SKIPPED_STATUSES
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in config['COMPRESSION_MIMETYPES']):
+        return response
+
+    # Caches must keep one copy per encoding, whether or not this response is compressed.
+    response.vary.add('Accept-Encoding')
+
+    encoding = request.accept_encodings.best_match(_encodings())
+    if encoding is None or request.method == 'HEAD':
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESSION_MIN_SIZE']:
+            return response
+
+        if g.get('precompressed'):
+            key = (encoding, hashlib.sha256(data).digest())
+            body = compressed_cache.get(key)
+            if body is None:
+                body = compress(data, encoding, config)
+                compressed_cache.put(key, body, config['COMPRESSION_CACHE_BYTES'])
+        else:
+            body = compress(data, encoding, config)
+        response.set_data(body)
+
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names exact bytes, the compressed body gets a tag of its own.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_compression(app):
+    if not app.config.get('COMPRESSION_ENABLED'):
+        return
+    app.after_request(_compress_response)
@@ -0,0 +1,115 @@
+import tempfile
+from datetime import date, timedelta
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context
+from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_200_OK, HTTP_500_INTERNAL_SERVER_ERROR
+from app.models.users import User
+from app.analytics import daily_report, services_report
+from app.exports import MIMETYPES, formats, iter_chunks, iter_csv, write_export
+from app.extensions import db
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+# Analytics blueprint: revenue and occupancy per service, read from the daily rollups (see app/analytics.py).
+analytics = Blueprint('analytics', __name__, url_prefix='/api/analytics')
+
+# Range used when start and end are not given.
+DEFAULT_DAYS = 30
+
+
+# Start and end dates (YYYY-MM-DD) of the report, the last 30 days by default.
+def report_range():
+    end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+    start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=DEFAULT_DAYS - 1)
+    if start > end:
+        raise ValueError('The start date is after the end date.')
+    return start, end
+
+
+def is_admin():
+    loggedInUser = User.query.filter_by(id=get_jwt_identity()).first()
+    return loggedInUser is not None and loggedInUser.user_type == 'admin'
+
+
+# Daily revenue and occupancy of every service (or of one with ?service_id=).
+@analytics.get('/daily')
+@jwt_required()
+def getDailyAnalytics():
+    try:
+         if not is_admin():
+              return jsonify({"Error": "You are not authorised to view the analytics."}), HTTP_401_UNAUTHORIZED
+
+         try:
+              start, end = report_range()
+              service_id = request.args.get('service_id', type=int)
+         except ValueError as e:
+              return jsonify({'Error':'Invalid date range, use YYYY-MM-DD. ' + str(e)}), HTTP_400_BAD_REQUEST
+
+         report = daily_report(start, end, service_id)
+
+         return jsonify({
+             'Message':'Daily analytics retrieved successfully',
+             'Start': start,
+             'End': end,
+             'Days': report
+         }), HTTP_200_OK
+
+    except Exception as e:
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
+# Revenue and occupancy of every service over the whole range.
+@analytics.get('/services')
+@jwt_required()
+def getServicesAnalytics():
+    try:
+         if not is_admin():
+              return jsonify({"Error": "You are not authorised to view the analytics."}), HTTP_401_UNAUTHORIZED
+
+         try:
+              start, end = report_range()
+         except ValueError as e:
+              return jsonify({'Error':'Invalid date range, use YYYY-MM-DD. ' + str(e)}), HTTP_400_BAD_REQUEST
+
+         report = services_report(start, end)
+
+         return jsonify({
+             'Message':'Service analytics retrieved successfully',
+             'Start': start,
+             'End': end,
+             'Services': report
+         }), HTTP_200_OK
+
+    except Exception as e:
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
+# Bookings with their service between start and end as a file (?format=csv, parquet or feather).
+# The csv is streamed as it is read from the database, the columnar formats are written to a temporary file first.
+@analytics.get('/export')
+@jwt_required()
+def exportBookings():
+    try:
+         if not is_admin():
+              return jsonify({"Error": "You are not authorised to export the bookings."}), HTTP_401_UNAUTHORIZED
+
+         try:
+              start, end = report_range()
+         except ValueError as e:
+              return jsonify({'Error':'Invalid date range, use YYYY-MM-DD. ' + str(e)}), HTTP_400_BAD_REQUEST
+
+         export_format = request.args.get('format', 'csv')
+         if export_format not in formats():
+              return jsonify({'Error':f"Unsupported export format, use one of: {', '.join(formats())}"}), HTTP_400_BAD_REQUEST
+
+         chunks = iter_chunks(db.session, start, end, current_app.config['EXPORT_CHUNK_SIZE'])
+         filename = f"bookings_{start}_{end}.{export_format}"
+
+         if export_format == 'csv':
+              response = Response(stream_with_context(iter_csv(chunks)), mimetype=MIMETYPES['csv'])
+              response.headers['Content-Disposition'] = f"attachment; filename={filename}"
+              return response
+
+         export_file = tempfile.TemporaryFile() # Deleted when send_file closes it.
+         write_export(chunks, export_file, export_format)
+         export_file.seek(0)
+         return send_file(export_file, mimetype=MIMETYPES[export_format], as_attachment=True, download_name=filename)
+
+    except Exception as e:
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
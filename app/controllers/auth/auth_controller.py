@@ -3,12 +3,19 @@ from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_500_I
 import validators
 from app.models.users import User
 from app.extensions import db, bcrypt
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt, decode_token
+from app.rate_limit import rate_limited, client_ip, json_field
+from app.idempotency import idempotent
+from app.token_blocklist import revoke_token, revoke_user_tokens
 
 auth = Blueprint('auth', __name__, url_prefix='/api')
 
 # User registration
+# Limited per client IP and per email before anything is hashed or looked up.
 @auth.route('/register', methods=['POST'])
+@rate_limited(('register_ip', 'RATE_LIMIT_REGISTER_IP', client_ip),
+              ('register_identifier', 'RATE_LIMIT_REGISTER_IDENTIFIER', json_field('email')))
+@idempotent # A retried registration gets the first response back instead of "Email is already in use."
 def register_user():
     data = request.json
     # Getting values from the incoming request
@@ -29,10 +36,11 @@ def register_user():
     if not validators.email(email):
         return jsonify({'Error':'Invalid email address.'}), HTTP_400_BAD_REQUEST
     
-    if User.query.filter_by(email = email).first() is not None: # Email should not be already in use.
+    # Deleted users not purged yet still hold their email and phone.
+    if User.query.filter_by(email = email).execution_options(include_deleted=True).first() is not None: # Email should not be already in use.
         return jsonify({"Error":"Email is already in use."}), HTTP_409_CONFLICT
     
-    if User.query.filter_by(phone = phone).first() is not None: # Contact should not be already in use. Name of value in model = variable name in controller.
+    if User.query.filter_by(phone = phone).execution_options(include_deleted=True).first() is not None: # Contact should not be already in use. Name of value in model = variable name in controller.
         return jsonify({"Error":"Contact is already in use."}), HTTP_409_CONFLICT
     
     # Logic that stores the new user to the database.
@@ -71,7 +79,10 @@ def register_user():
     
 
 # User login based on their credentials (email/phone and password).
+# Limited per client IP and per email/phone, so a credential stuffing burst is turned away before any bcrypt check.
 @auth.post('/login')
+@rate_limited(('login_ip', 'RATE_LIMIT_LOGIN_IP', client_ip),
+              ('login_identifier', 'RATE_LIMIT_LOGIN_IDENTIFIER', json_field('identifier')))
 def login():
      # This makes a request body containing the following (email/phone and password), necessary in post man.
      # Let the email or phone be cslled the identifier.
@@ -128,3 +139,49 @@ def refresh():
     identity = get_jwt_identity()
     access_token = create_access_token(identity=identity)
     return jsonify(access_token=access_token) # Response is to return the refresh token whenever we return the user.
+
+
+# Logout: revokes the token sent (access or refresh), and the refresh token given in the body if any.
+@auth.post('/logout')
+@jwt_required(verify_type=False)
+def logout():
+    try:
+        revoke_token(get_jwt())
+
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            try:
+                refresh_token = decode_token(data['refresh_token'], allow_expired=True)
+            except Exception:
+                # Malformed, badly signed or already revoked.
+                db.session.rollback()
+                return jsonify({'Error':'Invalid refresh token.'}), HTTP_400_BAD_REQUEST
+            if refresh_token.get('type') != 'refresh':
+                db.session.rollback()
+                return jsonify({'Error':'Invalid refresh token.'}), HTTP_400_BAD_REQUEST
+            # Only the caller's own refresh token can be revoked this way.
+            if str(refresh_token['sub']) != str(get_jwt_identity()):
+                db.session.rollback()
+                return jsonify({'Error':'The refresh token belongs to another user.'}), HTTP_400_BAD_REQUEST
+            revoke_token(refresh_token)
+
+        db.session.commit()
+        return jsonify({'Message':'You have successfully logged out.'}), HTTP_200_OK
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
+
+# Logout everywhere: revokes every access and refresh token of the user issued so far.
+@auth.post('/logout/all')
+@jwt_required(verify_type=False)
+def logoutEverywhere():
+    try:
+        revoke_user_tokens(get_jwt_identity())
+        db.session.commit()
+        return jsonify({'Message':'You have been logged out of every device.'}), HTTP_200_OK
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
@@ -6,6 +6,8 @@ from app.models.services import Service
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import and_, or_
+from app.serializers import FieldsetError, booking_schema, user_booking_schema, fieldset
+from app.idempotency import idempotent
 from datetime import datetime, date
 
 # Booking blueprint
@@ -14,6 +16,7 @@ bookings = Blueprint('bookings', __name__, url_prefix='/api/bookings')
 # Create booking
 @bookings.route('/create', methods=['POST'])
 @jwt_required()
+@idempotent # Retries sent with the same Idempotency-Key get the first response, no second booking.
 def createBooking():
     data = request.json
     # Getting values from the incoming request
@@ -25,7 +28,7 @@ def createBooking():
     service_name = data.get('service_name')
 
     # Request body must include the following.
-    if not start_time_str or not end_time_str  or not booking_date or not service_name:
+    if not start_time_str or not end_time_str  or not booking_date_str or not service_name:
         return jsonify({'Error':'All fields are required'}),HTTP_400_BAD_REQUEST  # response returned in json format
     
     # Booking date should be in the future
@@ -57,7 +60,7 @@ def createBooking():
     end = datetime.combine(datetime.today(), end_time)
 
     if end <= start:
-        return jsonify({'End time must be after start time.'}), HTTP_400_BAD_REQUEST
+        return jsonify({'Error':'End time must be after start time.'}), HTTP_400_BAD_REQUEST
     duration = (end - start).total_seconds() / 3600 # Converting seconds to hours
 
     total_unit_price = service.price_per_hour * duration
@@ -79,8 +82,8 @@ def createBooking():
             booking_date=booking_date,
             start_time=start_time,
             end_time=end_time,
-            total_unit_price=total_unit_price,
-            # booking_status=booking_status,
+            total_price=total_unit_price,
+            booking_status='confirmed',
             user_id=get_jwt_identity(),
             service_id=service.id
         )
@@ -90,8 +93,8 @@ def createBooking():
         return jsonify({'Message': 'Booking created successfully', 
                         'Booking':{
                          "id":new_booking.id,
-                         "start_time":new_booking.start_time.strftime('%H:%M'), 
-                         "end_time":new_booking.end_time.strftime('%H:%M'),
+                         "start_time":new_booking.start_time, 
+                         "end_time":new_booking.end_time,
                          "total_unit_price":new_booking.total_unit_price,
                          "booking_status":new_booking.booking_status,
                          "user_id":new_booking.user_id,
@@ -114,39 +117,14 @@ def createBooking():
 def getAllBookings():
      try:
        # Creating a serialized variable: one that can be easily converted to a json
-       all_bookings = Booking.query.order_by(Booking.booking_date.desc()).all()
+       # Only the fields asked for with ?fields= and ?include= are selected and returned.
+       schema = fieldset(booking_schema)
+
+       # Users and services are joined in the same query instead of being loaded one booking at a time.
+       all_bookings = Booking.query.options(*schema.load_options(Booking)).order_by(Booking.booking_date.desc()).all()
        
-       bookings_data = []
-
-       # Looping through all bookings in the database.
-       for booking in all_bookings:
-           booking_info = {
-                 "id":booking.id,
-                 "start_time":booking.start_time, 
-                 "end_time":booking.end_time,
-                 "total_unit_price":booking.total_unit_price,
-                 "booking_status":booking.booking_status,
-                 "user":{
-                     'id':booking.user.id,
-                     'username':booking.user.name,
-                     'email':booking.user.email,
-                     'phone':booking.user.phone,
-                     'user_type':booking.user.user_type,
-                     'created_at':booking.user.created_at
-                 },
-                 "service":{
-                     'id':booking.service.id,
-                     'service_type':booking.service.service_type,
-                     'service_name':booking.service.service_name,
-                     'description':booking.service.description,
-                     'price_per_hour':booking.service.price_per_hour,
-                     'availability_status':booking.service.availability_status,
-                     'created_at':booking.service.created_at
-                 },
-                 "created_at":booking.created_at
-           }
-           # Adding data to that list, the booking info dictionary.
-           bookings_data.append(booking_info)
+       # Converting the bookings (with their user and service) to dictionaries.
+       bookings_data = schema.dump_many(all_bookings)
 
        return jsonify({
            'Message':'All bookings retrieved successfully',
@@ -154,6 +132,9 @@ def getAllBookings():
            'Bookings': bookings_data
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -168,7 +149,7 @@ def getAllBookingsOfUser(user_id):
 
          loggedInUser = User.query.filter_by(id=current_user).first()
 
-         user = User.query.filter_by(id=id).first()
+         user = User.query.filter_by(id=user_id).first()
 
          if not user:
              return jsonify({"Error":"User not found"}), HTTP_404_NOT_FOUND
@@ -177,36 +158,21 @@ def getAllBookingsOfUser(user_id):
              return jsonify({"Error":"You are not authorised to retrieve the user's booking details"}), HTTP_401_UNAUTHORIZED
          
          else:
-             user_bookings = Booking.query.filter_by(user_id=user_id).order_by(Booking.booking_date.desc()).all()
-
-             user_bookings_data = []
-
-             for booking in user_bookings:
-                 bookings_info={
-                     "id":booking.id,
-                     "start_time":booking.start_time, 
-                     "end_time":booking.end_time,
-                     "total_unit_price":booking.total_unit_price,
-                     "booking_status":booking.booking_status,
-                     "service":{
-                                 'id':booking.service.id,
-                                 'service_type':booking.service.service_type,
-                                 'service_name':booking.service.service_name,
-                                 'description':booking.service.description,
-                                 'price_per_hour':booking.service.price_per_hour,
-                                 'availability_status':booking.service.availability_status,
-                                 'created_at':booking.service.created_at
-                              },
-                     "created_at":booking.created_at
-                     }
-             user_bookings_data.append(bookings_info)
+             schema = fieldset(user_booking_schema)
+
+             user_bookings = Booking.query.options(*schema.load_options(Booking)).filter_by(user_id=user_id).order_by(Booking.booking_date.desc()).all()
+
+             user_bookings_data = schema.dump_many(user_bookings)
 
              return jsonify({
-                              'Message':'All bookings for user with id, ' + user_id + ' retrieved successfully',
+                              'Message':'All bookings for user with id, ' + str(user_id) + ' retrieved successfully',
                               'Total_bookings':len(user_bookings_data),
                               'Bookings': user_bookings_data
              }), HTTP_200_OK
      
+    except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
     except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -218,7 +184,8 @@ def getAllBookingsOfUser(user_id):
 def getBooking(booking_id):
      try:
        # Creating a serialized variable: one that can be easily converted to a json
-       booking = Booking.query.filter_by(id=booking_id).first()
+       schema = fieldset(booking_schema)
+       booking = Booking.query.options(*schema.load_options(Booking)).filter_by(id=booking_id).first()
 
        # For no booking with that id
        if not booking:
@@ -226,33 +193,12 @@ def getBooking(booking_id):
 
        return jsonify({
            'Message':'Booking details retrieved successfully',
-           'Booking':{
-                 "id":booking.id,
-                 "start_time":booking.start_time, 
-                 "end_time":booking.end_time,
-                 "total_unit_price":booking.total_unit_price,
-                 "booking_status":booking.booking_status,
-                 "user":{
-                     'id':booking.user.id,
-                     'username':booking.user.name,
-                     'email':booking.user.email,
-                     'phone':booking.user.phone,
-                     'user_type':booking.user.user_type,
-                     'created_at':booking.user.created_at
-                 },
-                 "service":{
-                     'id':booking.service.id,
-                     'service_type':booking.service.service_type,
-                     'service_name':booking.service.service_name,
-                     'description':booking.service.description,
-                     'price_per_hour':booking.service.price_per_hour,
-                     'availability_status':booking.service.availability_status,
-                     'created_at':booking.service.created_at
-                 },
-                 "created_at":booking.created_at
-           }
+           'Booking': schema.dump(booking)
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
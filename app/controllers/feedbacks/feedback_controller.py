@@ -4,6 +4,7 @@ from app.models.feedback import Feedback
 from app.models.users import User
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.serializers import feedback_schema
 
 # Feedbacks blueprint
 feedbacks = Blueprint('feedbacks', __name__, url_prefix='/api/feedbacks')
@@ -30,18 +31,11 @@ def createFeedback():
            message = message
        )
 
-       db.session.sdd(new_feedback)
+       db.session.add(new_feedback)
        db.session.commit()
 
        return jsonify({'Message':'Feedback submitted successfully.',
-                       'Feedback':{
-                           "id":new_feedback.id,
-                           "name":new_feedback.name,
-                           "phone_number":new_feedback.phone_number,
-                           "email":new_feedback.email,
-                           "message":new_feedback.message,
-                           "created_at":new_feedback.created_at
-                       }}), HTTP_201_CREATED
+                       'Feedback': feedback_schema.dump(new_feedback)}), HTTP_201_CREATED
 
     except Exception as e:
          return jsonify({
@@ -55,18 +49,7 @@ def getAllFeedback():
     try:
         all_feedbacks = Feedback.query.all()
 
-        feedbacks_data = []
-
-        for feedback in all_feedbacks:
-            feedback_info = {
-                "id":feedback.id,
-                "name":feedback.name,
-                "phone_number":feedback.phone_number,
-                "email":feedback.email,
-                "message":feedback.message,
-                "created_at":feedback.created_at
-            }
-            feedbacks_data.append(feedback_info)
+        feedbacks_data = feedback_schema.dump_many(all_feedbacks)
 
         return jsonify({
             'Message':'All feedback retrieved successfully',
@@ -91,14 +74,7 @@ def getFeedback(id):
       
            return jsonify({
                'Message': 'Feedback details retrieved successfully',
-               'Feedback':{
-                      "id":feedback.id,
-                      "name":feedback.name,
-                      "phone_number":feedback.phone_number,
-                      "email":feedback.email,
-                      "message":feedback.message,
-                      "created_at":feedback.created_at
-                 }
+               'Feedback': feedback_schema.dump(feedback)
            }), HTTP_200_OK
       
       except Exception as e:
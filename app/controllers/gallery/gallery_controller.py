@@ -1,10 +1,15 @@
-from flask import Blueprint, request, jsonify
-from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_201_CREATED, HTTP_401_UNAUTHORIZED, HTTP_200_OK, HTTP_404_NOT_FOUND
+import os
+from flask import Blueprint, request, jsonify, current_app, abort
+from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_413_REQUEST_ENTITY_TOO_LARGE, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_201_CREATED, HTTP_202_ACCEPTED, HTTP_401_UNAUTHORIZED, HTTP_200_OK, HTTP_404_NOT_FOUND
 from app.models.users import User
 from app.models.services import Service
 from app.models.gallery import Gallery
 from app.extensions import db
+from app.media_storage import MediaError, store_upload, submit_variants, media_url, media_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.compression import precompressed
+from app.serializers import gallery_schema
 
 # Gallery blueprint
 galleries = Blueprint('galleries', __name__, url_prefix='/api/gallery')
@@ -60,27 +65,98 @@ def createGallery():
          
     except Exception as e:
          return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+# Upload a gallery image (multipart/form-data with the fields image, caption and service_name).
+# The file is streamed into the content addressed media store and the resized/webp variants are generated in the background.
+@galleries.route('/upload', methods=['POST'])
+@jwt_required()
+def uploadGalleryImage():
+    try:
+         # ID of the currently logged in user
+         current_user = get_jwt_identity()
+
+         loggedInUser = User.query.filter_by(id=current_user).first()
+
+         # Checked before the body is read, so only administrators get an upload spooled to disk.
+         if loggedInUser.user_type != 'admin':
+              return jsonify({"Error": "You are not authorised to create a gallery."}), HTTP_401_UNAUTHORIZED
+
+         image = request.files.get('image')
+         caption = request.form.get('caption')
+         service_name = request.form.get('service_name')
+
+         # Request body must include the following
+         if not image or not caption or not service_name:
+             return jsonify({'Error':'All fields are required'}), HTTP_400_BAD_REQUEST
+
+         service = Service.query.filter_by(service_name=service_name).first()
+
+         if not service:
+             return jsonify({'Error': 'Service not found'}), HTTP_400_BAD_REQUEST
+
+         app = current_app._get_current_object()
+
+         # Saving the original, an image that is already stored is not written again.
+         try:
+              content_hash, original_path = store_upload(app, image)
+         except MediaError as e:
+              return jsonify({'Error': str(e)}), HTTP_400_BAD_REQUEST
+
+         new_gallery = Gallery(
+              image_url=media_url(app, content_hash, os.path.basename(original_path)),
+              caption=caption,
+              service_id=service.id,
+              content_hash=content_hash
+         )
+         db.session.add(new_gallery)
+         db.session.commit()
+
+         # Thumbnails and webp versions are created off the request thread and saved on the gallery when ready.
+         submit_variants(app, new_gallery.id, content_hash, original_path)
+
+         return jsonify({'Message':'Gallery image uploaded successfully, variants are being generated',
+                         'Gallery':{
+                              "id":new_gallery.id,
+                              "image_url":new_gallery.image_url,
+                              "content_hash":new_gallery.content_hash,
+                              "caption":new_gallery.caption,
+                              "service_id":new_gallery.service_id,
+                              "created_at":new_gallery.created_at
+                         }
+         }), HTTP_202_ACCEPTED
+
+    # Body above MAX_CONTENT_LENGTH, refused by werkzeug while reading it.
+    except RequestEntityTooLarge:
+         return jsonify({'Error': 'Image is too large.'}), HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    except Exception as e:
+         db.session.rollback()
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
+# Serve a stored gallery image or one of its variants.
+# Supports Range requests and conditional requests (ETag is the content hash), responses are cached as immutable.
+@galleries.get('/media/<string:content_hash>/<string:filename>')
+def getGalleryMedia(content_hash, filename):
+     # Hashes are 64 lowercase hex characters, anything else cannot be in the store.
+     if len(content_hash) != 64 or any(c not in '0123456789abcdef' for c in content_hash):
+          abort(HTTP_404_NOT_FOUND)
+
+     # The store is checked directly, serving an image never queries the database.
+     response = media_response(current_app._get_current_object(), content_hash, filename)
+     if response is None:
+          abort(HTTP_404_NOT_FOUND)
+
+     return response
     
 # Get all galleries
 @galleries.get('/all')
 @jwt_required()
+@precompressed # The catalog is the same for every client, its compressed body is reused.
 def getAllGalleries():
      try:
        # Creating a serialized variable: one that can be easily converted to a json
        all_galleries = Gallery.query.all()
        
-       galleries_data = []
-
-       # Looping through all galleries in the database.
-       for gallery in all_galleries:
-           gallery_info = {
-               "image_url":gallery.image_url,
-               "caption":gallery.caption,
-               "service_id":gallery.service_id,
-               "created_at":gallery.created_at
-           }
-           # Adding data to the gallery info dictionary
-           galleries_data.append(gallery_info)
+       galleries_data = gallery_schema.dump_many(all_galleries)
 
        return  jsonify({
            'Message':'All galleries retrieved successfully',
@@ -98,7 +174,7 @@ def getAllGalleries():
 @jwt_required()
 def getGallery(id):
     try:
-         gallery = Gallery.query.filter_by(id=id).first
+         gallery = Gallery.query.filter_by(id=id).first()
 
          # No gallery with this id
          if not gallery:
@@ -106,12 +182,7 @@ def getGallery(id):
     
          return jsonify({
              'Message':'Gallery details retrieved successfully',
-             'Gallery':{
-                     "image_url":gallery.image_url,
-                     "caption":gallery.caption,
-                     "service_id":gallery.service_id,
-                     "created_at":gallery.created_at
-             }
+             'Gallery': gallery_schema.dump(gallery)
          }),HTTP_200_OK
          
     except Exception as e:
@@ -128,7 +199,7 @@ def updateGalleryDetails(id):
          # Variable to store the id itself
          loggedInUser = User.query.filter_by(id=current_user).first()
 
-         gallery = Gallery.query.filter_by(id=id).first
+         gallery = Gallery.query.filter_by(id=id).first()
 
          # No gallery with this id
          if not gallery:
@@ -186,7 +257,7 @@ def deleteGallery(id):
          # Variable to store the id itself
          loggedInUser = User.query.filter_by(id=current_user).first()
 
-         gallery = Gallery.query.filter_by(id=id).first
+         gallery = Gallery.query.filter_by(id=id).first()
 
          # No gallery with this id
          if not gallery:
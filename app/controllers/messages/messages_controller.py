@@ -7,6 +7,8 @@ from app.models.bookings import Booking
 from app.extensions import db
 from datetime import datetime
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.serializers import FieldsetError, message_schema, fieldset
+from app.idempotency import idempotent
 
 # Messages blueprint
 messages = Blueprint('messages', __name__, url_prefix='/api/messages')
@@ -14,6 +16,7 @@ messages = Blueprint('messages', __name__, url_prefix='/api/messages')
 # Create/ send a message
 @messages.route('/send', methods=['POST'])
 @jwt_required()
+@idempotent # Retries sent with the same Idempotency-Key get the first response, no second message or email.
 def createMessage():
     data = request.json
     sender_id = get_jwt_identity()
@@ -131,7 +134,7 @@ def getAllUserMessages(user_id):
 
          loggedInUser = User.query.filter_by(id=current_user).first()
 
-         user = User.query.filter_by(id=id).first()
+         user = User.query.filter_by(id=user_id).first()
 
          if not user:
              return jsonify({"Error":"User not found"}), HTTP_404_NOT_FOUND
@@ -140,19 +143,10 @@ def getAllUserMessages(user_id):
              return jsonify({"Error":"You are not authorised to retrieve the user's booking details"}), HTTP_401_UNAUTHORIZED
          
          else:
-             user_messages = Message.query.filter_by(recipient_id=user_id).order_by(Message.timestamp.desc()).all()
+             schema = fieldset(message_schema)
+             user_messages = Message.query.options(*schema.load_options(Message)).filter_by(recipient_id=user_id).order_by(Message.time_stamp.desc()).all()
 
-             user_messages_data = []
-
-             for message in user_messages:
-                 messages_info={
-                     "id":message.id,
-                     "sender_id":message.sender_id, 
-                     "recipient_id":message.recipient_id,
-                     "content":message.content,
-                     "timestamp":message.timestamp
-                     }
-             user_messages_data.append(messages_info)
+             user_messages_data = schema.dump_many(user_messages)
 
              return jsonify({
                               'Message':'All messages retrieved successfully',
@@ -160,6 +154,9 @@ def getAllUserMessages(user_id):
                               'Messages': user_messages_data
              }), HTTP_200_OK
      
+    except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
     except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -171,7 +168,8 @@ def getAllUserMessages(user_id):
 def getMessage(id):
      try:
        # Creating a serialized variable: one that can be easily converted to a json
-       message = Message.query.filter_by(id=id).first()
+       schema = fieldset(message_schema)
+       message = Message.query.options(*schema.load_options(Message)).filter_by(id=id).first()
 
        # For no booking with that id
        if not message:
@@ -179,15 +177,12 @@ def getMessage(id):
 
        return jsonify({
            'Notification':'Message details retrieved successfully',
-           'Message':{
-                 "id":message.id,
-                 "sender_id":message.sender_id, 
-                 "recipient_id":message.recipient_id,
-                 "content":message.content,
-                 "timestamp":message.timestamp
-           }
+           'Message': schema.dump(message)
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -220,20 +215,14 @@ def updateMessages(id):
             recipient_id = request.get_json().get('recipient_id', message.recipient_id)
             content = request.get_json().get('content', message.content)
 
-            message.reecipient_id = recipient_id
+            message.recipient_id = recipient_id
             message.content = content
 
             db.session.commit()
 
          return jsonify({
             'Notification':'Message details updated successfully',
-            'Message':{
-                 "id":message.id,
-                 "sender_id":message.sender_id, 
-                 "recipient_id":message.recipient_id,
-                 "content":message.content,
-                 "timestamp":message.timestamp
-            }
+            'Message': message_schema.dump(message)
         }), HTTP_200_OK
 
      except Exception as e:
@@ -0,0 +1,29 @@
+from flask import Blueprint, jsonify
+from app.status_codes import HTTP_401_UNAUTHORIZED, HTTP_200_OK, HTTP_500_INTERNAL_SERVER_ERROR
+from app.models.users import User
+from app.extensions import db
+from app.db_pool import pool_status
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+# Metrics blueprint
+metrics = Blueprint('metrics', __name__, url_prefix='/api/metrics')
+
+# Database connection pool usage and checkout wait times (admins only).
+@metrics.get('/db-pool')
+@jwt_required()
+def getDbPoolMetrics():
+    try:
+         current_user = get_jwt_identity()
+
+         loggedInUser = User.query.filter_by(id=current_user).first()
+
+         if loggedInUser.user_type != 'admin':
+              return jsonify({"Error": "You are not authorised to view the metrics."}), HTTP_401_UNAUTHORIZED
+
+         return jsonify({
+             'Message':'Database pool metrics retrieved successfully',
+             'Pools': pool_status(db)
+         }), HTTP_200_OK
+
+    except Exception as e:
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
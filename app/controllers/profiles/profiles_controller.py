@@ -0,0 +1,63 @@
+from flask import Blueprint, request, jsonify, Response
+from app.status_codes import HTTP_401_UNAUTHORIZED, HTTP_200_OK, HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR
+from app.models.users import User
+from app.profiling import profile_store, folded
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+# Profiles blueprint: browsing the request profiles recorded by app/profiling.py (admins only).
+profiles = Blueprint('profiles', __name__, url_prefix='/api/profiles')
+
+def is_admin():
+    loggedInUser = User.query.filter_by(id=get_jwt_identity()).first()
+    return loggedInUser is not None and loggedInUser.user_type == 'admin'
+
+# List the stored profiles, newest first (optionally ?endpoint=users.getAllCustomers).
+@profiles.get('/all')
+@jwt_required()
+def getAllProfiles():
+    try:
+         if not is_admin():
+              return jsonify({"Error": "You are not authorised to view the profiles."}), HTTP_401_UNAUTHORIZED
+
+         endpoint = request.args.get('endpoint')
+
+         profiles_data = []
+
+         for profile in profile_store.all():
+             if endpoint and profile['endpoint'] != endpoint:
+                 continue
+             profile_info = {key: value for key, value in profile.items() if key != 'samples'}
+             profiles_data.append(profile_info)
+
+         return jsonify({
+             'Message':'All profiles retrieved successfully',
+             'Total_profiles':len(profiles_data),
+             'Profiles': profiles_data
+         }), HTTP_200_OK
+
+    except Exception as e:
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
+# Get a profile by id. ?format=folded returns the folded stacks as text, ready for flamegraph.pl or speedscope.
+@profiles.get('/<int:id>')
+@jwt_required()
+def getProfile(id):
+    try:
+         if not is_admin():
+              return jsonify({"Error": "You are not authorised to view the profiles."}), HTTP_401_UNAUTHORIZED
+
+         profile = profile_store.get(id)
+
+         if not profile:
+             return jsonify({"Error":"Profile not found"}), HTTP_404_NOT_FOUND
+
+         if request.args.get('format') == 'folded':
+             return Response(folded(profile), mimetype='text/plain')
+
+         return jsonify({
+             'Message':'Profile retrieved successfully',
+             'Profile': profile
+         }), HTTP_200_OK
+
+    except Exception as e:
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
@@ -2,9 +2,11 @@ from flask import Blueprint, request, jsonify
 from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_201_CREATED, HTTP_401_UNAUTHORIZED, HTTP_200_OK
 from app.models.services import Service
 from app.models.users import User
-from app.models.gallery import Gallery
+from app.soft_delete import soft_delete, submit_purge
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.compression import precompressed
+from app.serializers import FieldsetError, service_schema, fieldset
 
 # Services blueprint
 services = Blueprint('services', __name__, url_prefix='/api/services')
@@ -50,15 +52,7 @@ def createService():
               db.session.commit()
 
               return jsonify({'Message': 'Service created successfully',
-                              'Service':{
-                                   "id":new_service.id,
-                                   "service_type":new_service.service_type,
-                                   "service_name":new_service.service_name,
-                                   "description":new_service.description,
-                                   "price_per_hour":new_service.price_per_hour,
-                                   "availability_status":new_service.availability_status,
-                                   "created_at":new_service.created_at
-                              }
+                              'Service': service_schema.dump(new_service)
               }), HTTP_201_CREATED
 
     except Exception as e:
@@ -69,26 +63,14 @@ def createService():
 # Get all services
 @services.get('/all')
 @jwt_required()
+@precompressed # The catalog is the same for every client, its compressed body is reused.
 def getAllServices():
      try:
          # json serialized variable
-         all_services = Service.query.all()
+         schema = fieldset(service_schema)
+         all_services = Service.query.options(*schema.load_options(Service)).all()
 
-         services_data = []
-
-         #Looping through all the services in the database
-         for service in all_services:
-             service_info = {
-                 "id":service.id,
-                 "service_type":service.service_type,
-                 "service_name":service.service_name,
-                 "description":service.description,
-                 "price_per_hour":service.price_per_hour,
-                 "availability_status":service.availability_status,
-                 "created_at":service.created_at
-             }
-             # Adding the service_info dictionary to the services_data list.
-             services_data.append(service_info)
+         services_data = schema.dump_many(all_services)
 
          return jsonify({
              'Message':'All services retrieved successfully',
@@ -96,6 +78,9 @@ def getAllServices():
              'Services': services_data 
            }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -107,7 +92,8 @@ def getAllServices():
 def getService(id):
       try:
            # Creating a serialized variable: one that can be easily converted to a json
-           service = Service.query.filter_by(id=id).first()
+           schema = fieldset(service_schema)
+           service = Service.query.options(*schema.load_options(Service)).filter_by(id=id).first()
 
            # For no service with that id
            if not service:
@@ -115,17 +101,12 @@ def getService(id):
       
            return jsonify({
                'Message': 'Service details retrieved successfully',
-               'Service':{
-                     "id":service.id,
-                     "service_type":service.service_type,
-                     "service_name":service.service_name,
-                     "description":service.description,
-                     "price_per_hour":service.price_per_hour,
-                     "availability_status":service.availability_status,
-                     "created_at":service.created_at
-                 }
+               'Service': schema.dump(service)
            }), HTTP_200_OK
       
+      except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
       except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -208,16 +189,14 @@ def deleteServiceDetails(id):
               return jsonify({"Error": "You are not authorised to create a service."}), HTTP_401_UNAUTHORIZED
          
          else:
-             # Corresponding gallery to be deleted.
-             Gallery.query.filter_by(service_id=service.id).delete()
-
-             # Deleting the service
-             db.session.delete(service)
+             # Marking the service as deleted, its galleries are removed in the background a batch at a time.
+             soft_delete(service)
              db.session.commit()
+             submit_purge()
 
              # Response after the service and it's corresponding gallery have been deleted.
              return jsonify({
-                 'Message':service.name + "'s details and its associated gallery has been successfully deleted"
+                 'Message':service.service_name + "'s details and its associated gallery has been successfully deleted"
              }), HTTP_200_OK
          
      except Exception as e:
@@ -235,7 +214,8 @@ def searchService():
            search_query = request.args.get('query', '') # Args are the query parameters in the url
 
            # Search for a service based on its name or it's type.
-           services = Service.query.filter((Service.service_name.ilike(f"%search_query"))
+           schema = fieldset(service_schema)
+           services = Service.query.options(*schema.load_options(Service)).filter((Service.service_name.ilike(f"%search_query"))
                                             | (Service.service_type.ilike(f"%Search_query")) ).all()
            
            # When no results retrieved on searching.
@@ -246,22 +226,7 @@ def searchService():
        
            else:
                 
-                services_data = []
-
-                # Looping through all services in the db.
-                for service in services:
-                     service_info = {
-                          "id":service.id,
-                          "service_type":service.service_type,
-                          "service_name":service.service_name,
-                          "description":service.description,
-                          "price_per_hour":service.price_per_hour,
-                          "availability_status":service.availability_status,
-                          "created_at":service.created_at 
-                     }
-
-                # Adding data to the service data
-                services_data.append(service_info)
+                services_data = schema.dump_many(services)
 
            return jsonify({
                 'Message':'Customers with name {search_query} retrieved successfully',
@@ -269,6 +234,9 @@ def searchService():
                 'Customers_data': services_data
            }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
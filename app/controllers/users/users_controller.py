@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_201_CREATED, HTTP_401_UNAUTHORIZED, HTTP_200_OK, HTTP_404_NOT_FOUND
 import validators
 from app.models.users import User
-from app.models.bookings import Booking
+from app.customer_stats import customer_dashboard
+from app.token_blocklist import revoke_user_tokens
+from app.soft_delete import soft_delete, submit_purge
+from app.user_import import UserImportError, guess_format, import_users
 from app.extensions import db, bcrypt
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.serializers import FieldsetError, user_schema, customer_schema, user_detail_schema, fieldset
 
 # Users blueprint
 users = Blueprint('users', __name__, url_prefix='/api/users')
@@ -15,22 +19,10 @@ users = Blueprint('users', __name__, url_prefix='/api/users')
 def getAllUsers():
      try:
        # Creating a serialized variable: one that can be easily converted to a json
-       all_users = User.query.all()
+       schema = fieldset(user_schema)
+       all_users = User.query.options(*schema.load_options(User)).all()
        
-       users_data = []
-
-       # Looping through all users in the database.
-       for user in all_users:
-           user_info = {
-                'id':user.id,
-                'username':user.name,
-                'email':user.email,
-                'phone':user.phone,
-                'user_type':user.user_type,
-                'created_at':user.created_at
-           }
-           # Adding data to that list, the user info dictionary.
-           users_data.append(user_info)
+       users_data = schema.dump_many(all_users)
 
        return jsonify({
            'Message':'All users retrieved successfully',
@@ -38,6 +30,9 @@ def getAllUsers():
            'Users': users_data
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -49,37 +44,12 @@ def getAllUsers():
 def getAllCustomers():
      try:
        # Creating a serialized variable: one that can be easily converted to a json
-       all_customers = User.query.filter_by(user_type='customer').all()
+       # The bookings of all customers are loaded in one extra query instead of one query per customer.
+       schema = fieldset(customer_schema)
+       all_customers = User.query.options(*schema.load_options(User)).filter_by(user_type='customer').all()
        
-       customers_data = []
-
-       # Looping through all customers in the database.
-       for customer in all_customers:
-            customer_info = {
-                'id':customer.id,
-                'customername':customer.name,
-                'email':customer.email,
-                'phone':customer.phone,
-                'address':customer.address,
-                'created_at':customer.created_at,
-                'bookings':[], # Retrieving the customers with their info on the bookings made.
-            }
-
-            # Checking if an attribute/ object has data
-            if hasattr(customer, 'bookings'):
-                customer_info['bookings']=[{
-                    'id': booking.id,
-                    'booking_status': booking.booking_status,
-                    'amount': booking.amount,
-                    'booking_date':booking.booking_date,
-                    'start_time':booking.start_time,
-                    'end_time':booking.end_time,
-                    'user_id':booking.user_id,
-                    'service_id':booking.service_id}
-                    for booking in customer.bookings ]
-
-            # Adding data to that list, the customer info dictionary.
-            customers_data.append(customer_info)
+       # The customers and their bookings are turned into dictionaries by the shared customer schema.
+       customers_data = schema.dump_many(all_customers)
 
        return jsonify({
            'Message':'All customers retrieved successfully',
@@ -87,6 +57,33 @@ def getAllCustomers():
            'customers': customers_data
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
+     except Exception as e:
+         return jsonify({
+             'Error':str(e)
+         }), HTTP_500_INTERNAL_SERVER_ERROR
+     
+# Customer dashboard: booking counts by status, total spend and next upcoming booking of every customer.
+# One row per customer whatever the number of bookings, instead of every booking inlined (see app/customer_stats.py).
+@users.get('/customers/dashboard')
+@jwt_required()
+def getCustomersDashboard():
+     try:
+       # Only administrators can see the bookings and spend of every customer.
+       loggedInUser = User.query.filter_by(id=get_jwt_identity()).first()
+       if loggedInUser.user_type != 'admin':
+           return jsonify({"Error":"You are not authorised to view the customer dashboard"}), HTTP_401_UNAUTHORIZED
+
+       customers_data = customer_dashboard()
+
+       return jsonify({
+           'Message':'Customer dashboard retrieved successfully',
+           'Total customers':len(customers_data),
+           'customers': customers_data
+       }), HTTP_200_OK
+     
      except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -98,37 +95,18 @@ def getAllCustomers():
 def getUser(id):
      try:
        # Creating a serialized variable: one that can be easily converted to a json
-       user = User.query.filter_by(id=id).first()
+       schema = fieldset(user_detail_schema)
+       user = User.query.options(*schema.load_options(User)).filter_by(id=id).first()
 
        # For customers we return their bookings.
-       bookings = []
-       
-       # Checking if an object has data for the defined attributes.
-       if hasattr(user, 'bookings'):
-           bookings =[{
-                'id': booking.id,
-                'booking_status': booking.booking_status,
-                'amount': booking.amount,
-                'booking_date':booking.booking_date,
-                'start_time':booking.start_time,
-                'end_time':booking.end_time,
-                'user_id':booking.user_id,
-                'service_id':booking.service_id}
-                for booking in user.bookings ]
-            
        return jsonify({
            'Message':'User retrieved successfully',
-           'User':{
-                'id':user.id,
-                'username':user.name,
-                'email':user.email,
-                'phone':user.phone,
-                'user_type':user.user_type,
-                'created_at':user.created_at,
-                'bookings':bookings
-           }
+           'User': schema.dump(user)
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
@@ -223,16 +201,16 @@ def deleteUserDetails(id):
          
          # For user type of 'admin' and/or the id of thr request matches the id of the currently logged in user.
          else:
-             # Delete the user with his associated bookings.
-             # For booking
-             Booking.query.filter_by(user_id=user.id).delete()
-
-             # Deleting the user
-             db.session.delete(user)
+             # Marking the user as deleted, the tokens already issued to the user stop working.
+             soft_delete(user)
+             revoke_user_tokens(user.id)
 
              # Committing the changes to the db.
              db.session.commit()
 
+             # The bookings and messages of the user are removed in the background, a batch at a time.
+             submit_purge()
+
              # Returning a personalised response
              return jsonify({
                  'Message':user.name + "'s details and associated books and payements have been successfully deleted"
@@ -242,7 +220,67 @@ def deleteUserDetails(id):
          return jsonify({
              'Error':str(e)
          }), HTTP_500_INTERNAL_SERVER_ERROR
-     
+
+# Revoking every token of a user (admins only), e.g. for a stolen device or a suspended account.
+@users.post('/revoke-tokens/<int:id>')
+@jwt_required()
+def revokeUserTokens(id):
+     try:
+         loggedInUser = User.query.filter_by(id=get_jwt_identity()).first()
+
+         if loggedInUser.user_type != 'admin':
+             return jsonify({"Error":"You are not authorised to revoke the tokens of users"}), HTTP_401_UNAUTHORIZED
+
+         user = User.query.filter_by(id=id).first()
+         if not user:
+             return jsonify({"Error":"User not found"}), HTTP_404_NOT_FOUND
+
+         revoke_user_tokens(user.id)
+         db.session.commit()
+
+         return jsonify({'Message':user.name + "'s tokens have been revoked."}), HTTP_200_OK
+
+     except Exception as e:
+         db.session.rollback()
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
+# Importing users in bulk (admins only), e.g. the customers of a partner hotel.
+# A csv or ndjson file, uploaded as the "file" field of a multipart form or as the request body. The format comes from
+# ?format=, else from the file name or the content type. Every row is imported or reported (see app/user_import.py).
+# At most IMPORT_MAX_ROWS users, hashed in this worker so the request ends before the proxy's timeout and no process
+# pool is started per request. Bigger files go through "flask import-users".
+@users.post('/import')
+@jwt_required()
+def importUsers():
+     try:
+         loggedInUser = User.query.filter_by(id=get_jwt_identity()).first()
+
+         if loggedInUser.user_type != 'admin':
+             return jsonify({"Error":"You are not authorised to import users"}), HTTP_401_UNAUTHORIZED
+
+         upload = request.files.get('file')
+         if upload is not None:
+             stream, filename, content_type = upload.stream, upload.filename, upload.content_type
+         else:
+             stream, filename, content_type = request.stream, None, request.content_type
+         file_format = request.args.get('format') or guess_format(filename, content_type)
+
+         try:
+             report = import_users(stream, file_format, current_app.config['IMPORT_MAX_ROWS'], workers=0)
+         except UserImportError as e:
+             return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
+         return jsonify({
+             'Message':f"{report['imported']} users imported, {report['failed']} rows failed.",
+             'Imported':report['imported'],
+             'Failed':report['failed'],
+             'Errors':report['errors']
+         }), HTTP_201_CREATED if report['imported'] else HTTP_400_BAD_REQUEST
+
+     except Exception as e:
+         db.session.rollback()
+         return jsonify({'Error':str(e)}), HTTP_500_INTERNAL_SERVER_ERROR
+
 # Searching for a customer
 @users.get('/search')
 @jwt_required()
@@ -253,7 +291,8 @@ def searchCustomers():
        search_query = request.args.get('query', '') # Args are the query parameters in the url
 
        # seaarch for users based on their name, ilike() makes the search case insensitive
-       customers = User.query.filter((User.name.ilike(f"%{search_query}"))
+       schema = fieldset(customer_schema)
+       customers = User.query.options(*schema.load_options(User)).filter((User.name.ilike(f"%{search_query}"))
                                      & (User.user_type.ilike('customer'))).all()
        
        # When no results are retrieved on searching.
@@ -263,37 +302,7 @@ def searchCustomers():
            }), HTTP_404_NOT_FOUND
        
        else:
-           
-       
-        customers_data = []
-
-        # Looping through all customers in the database.
-        for customer in customers:
-            customer_info = {
-                'id':customer.id,
-                'customername':customer.name,
-                'email':customer.email,
-                'phone':customer.phone,
-                'address':customer.address,
-                'created_at':customer.created_at,
-                'bookings':[] # Retrieving the customers with their info on the bookings made.
-            }
-
-            # Checking if an attribute/ object has data
-            if hasattr(customer, 'bookings'):
-                customer_info['bookings']=[{
-                    'id': booking.id,
-                    'booking_status': booking.booking_status,
-                    'amount': booking.amount,
-                    'booking_date':booking.booking_date,
-                    'start_time':booking.start_time,
-                    'end_time':booking.end_time,
-                    'user_id':booking.user_id,
-                    'service_id':booking.service_id}
-                    for booking in customer.bookings ]
-                
-            # Adding data to that list, the customer info dictionary.
-            customers_data.append(customer_info)
+           customers_data = schema.dump_many(customers)
 
        return jsonify({
            'Message':'Customers with name {search_query} retrieved successfully',
@@ -301,6 +310,9 @@ def searchCustomers():
            'Customers_data': customers_data
        }), HTTP_200_OK
      
+     except FieldsetError as e:
+         return jsonify({'Error':str(e)}), HTTP_400_BAD_REQUEST
+
      except Exception as e:
          return jsonify({
              'Error':str(e)
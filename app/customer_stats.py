@@ -0,0 +1,251 @@
+from collections import defaultdict
+from datetime import date, datetime
+from flask import current_app, has_app_context
+from sqlalchemy import and_, case, event, func, inspect as sa_inspect
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app.booking_changes import changed, previous_value, track_previous
+from app.db_routing import RoutingSession
+
+# Customer dashboard aggregates: bookings by status, total spend and next upcoming booking per customer.
+# By default they are computed with one GROUP BY over the bookings joined to the users. With CUSTOMER_STATS_COUNTERS on,
+# the counts and the spend are read from the customer_stats table instead, which is updated on every booking
+# insert, status change and delete, so the dashboard does not scan the bookings at all (only the upcoming ones).
+# Bulk deletes (Query.delete()) skip the counters, "flask rebuild-customer-stats" recomputes them from the bookings.
+
+# Booking statuses with a counter of their own.
+STATUSES = ('confirmed', 'cancelled', 'completed', 'missed')
+
+
+# Bookings that count towards the spend of a customer.
+def _spent(status):
+    return (status or '').lower() != 'cancelled'
+
+
+def _upcoming(booking):
+    return and_(booking.booking_status == 'confirmed', booking.booking_date >= date.today())
+
+
+def _empty(user_id, name, email, phone):
+    return {
+        'id': user_id,
+        'customername': name,
+        'email': email,
+        'phone': phone,
+        'bookings_total': 0,
+        'bookings_by_status': {status: 0 for status in STATUSES},
+        'total_spend': 0.0,
+        'next_booking_date': None,
+    }
+
+
+# One GROUP BY (customer, status) over the bookings, folded into one row per customer.
+def grouped_dashboard():
+    from app.extensions import db
+    from app.models.users import User
+    from app.models.bookings import Booking
+
+    rows = (db.session.query(User.id, User.name, User.email, User.phone, Booking.booking_status,
+                             func.count(Booking.id),
+                             func.sum(Booking.total_unit_price),
+                             func.min(case((_upcoming(Booking), Booking.booking_date))))
+            .outerjoin(Booking, Booking.user_id == User.id)
+            .filter(User.user_type == 'customer')
+            .group_by(User.id, User.name, User.email, User.phone, Booking.booking_status)
+            .order_by(User.id))
+
+    customers = {}
+    for user_id, name, email, phone, status, count, spend, next_date in rows:
+        customer = customers.get(user_id)
+        if customer is None:
+            customer = customers[user_id] = _empty(user_id, name, email, phone)
+        if status is None: # Customer without bookings (outer join).
+            continue
+        customer['bookings_total'] += count
+        customer['bookings_by_status'][status.lower()] = customer['bookings_by_status'].get(status.lower(), 0) + count
+        if _spent(status):
+            customer['total_spend'] += spend or 0.0
+        if next_date is not None and (customer['next_booking_date'] is None or next_date < customer['next_booking_date']):
+            customer['next_booking_date'] = next_date
+    return list(customers.values())
+
+
+# Counters from customer_stats, plus the next booking from the upcoming bookings only.
+def counted_dashboard():
+    from app.extensions import db
+    from app.models.users import User
+    from app.models.bookings import Booking
+    from app.models.customer_stats import CustomerStats
+
+    next_booking = (db.session.query(Booking.user_id.label('user_id'), func.min(Booking.booking_date).label('booking_date'))
+                    .filter(_upcoming(Booking))
+                    .group_by(Booking.user_id)
+                    .subquery())
+    rows = (db.session.query(User.id, User.name, User.email, User.phone, CustomerStats, next_booking.c.booking_date)
+            .outerjoin(CustomerStats, CustomerStats.user_id == User.id)
+            .outerjoin(next_booking, next_booking.c.user_id == User.id)
+            .filter(User.user_type == 'customer')
+            .order_by(User.id))
+
+    customers = []
+    for user_id, name, email, phone, stats, next_date in rows:
+        customer = _empty(user_id, name, email, phone)
+        if stats is not None:
+            customer['bookings_total'] = stats.bookings_total
+            customer['bookings_by_status'] = {status: getattr(stats, f"{status}_count") for status in STATUSES}
+            customer['total_spend'] = stats.total_spend
+        customer['next_booking_date'] = next_date
+        customers.append(customer)
+    return customers
+
+
+def customer_dashboard():
+    if current_app.config.get('CUSTOMER_STATS_COUNTERS'):
+        return counted_dashboard()
+    return grouped_dashboard()
+
+
+# Counts and spend of one customer computed from the bookings table.
+def _count_bookings(session, user_id):
+    from app.models.bookings import Booking
+
+    rows = (session.query(Booking.booking_status, func.count(Booking.id), func.sum(Booking.total_unit_price))
+            .filter(Booking.user_id == user_id)
+            .group_by(Booking.booking_status))
+    counts = defaultdict(int)
+    total, spend = 0, 0.0
+    for status, count, price in rows:
+        counts[(status or '').lower()] += count
+        total += count
+        if _spent(status):
+            spend += price or 0.0
+    return counts, total, spend
+
+
+def _fill(stats, counts, total, spend):
+    for status in STATUSES:
+        setattr(stats, f"{status}_count", counts.get(status, 0))
+    stats.bookings_total = total
+    stats.total_spend = spend
+
+
+# Adds the difference made by a booking (sign +1 for its current state, -1 for its previous one).
+def _add(deltas, user_id, status, price, sign):
+    if user_id is None:
+        return
+    delta = deltas[user_id]
+    delta['total'] += sign
+    delta[(status or '').lower()] += sign
+    if _spent(status):
+        delta['spend'] += sign * (price or 0.0)
+
+
+# Creates the counters row of a customer from what was stored before plus the change, or adds the change to the row
+# another request created meanwhile, in one INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT on SQLite/PostgreSQL).
+# Two first bookings of a customer at the same time then make one row counting both, instead of a primary key error.
+def upsert_customer_stats(session, user_id, stored, delta):
+    from app.models.customer_stats import CustomerStats
+
+    table = CustomerStats.__table__
+    counts, total, spend = stored
+    values = {f"{status}_count": counts.get(status, 0) + int(delta[status]) for status in STATUSES}
+    values.update(bookings_total=total + int(delta['total']), total_spend=spend + delta['spend'], updated_at=datetime.now())
+    increments = {f"{status}_count": table.c[f"{status}_count"] + int(delta[status]) for status in STATUSES if delta[status]}
+    if delta['total']:
+        increments['bookings_total'] = table.c.bookings_total + int(delta['total'])
+    if delta['spend']:
+        increments['total_spend'] = table.c.total_spend + delta['spend']
+    increments['updated_at'] = datetime.now()
+
+    dialect = session.connection().dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(table).values(user_id=user_id, **values).on_duplicate_key_update(**increments)
+    else:
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = (insert(table).values(user_id=user_id, **values)
+                     .on_conflict_do_update(index_elements=['user_id'], set_=increments))
+    session.execute(statement)
+
+
+# Runs before every flush: turns the new, changed and deleted bookings into counter updates.
+def _update_counters(session, flush_context, instances):
+    if not has_app_context() or not current_app.config.get('CUSTOMER_STATS_COUNTERS'):
+        return
+
+    from app.models.bookings import Booking
+    from app.models.customer_stats import CustomerStats
+
+    deltas = defaultdict(lambda: defaultdict(float))
+    for booking in session.new:
+        if isinstance(booking, Booking):
+            _add(deltas, booking.user_id, booking.booking_status, booking.total_unit_price, 1)
+    for booking in session.deleted:
+        if isinstance(booking, Booking):
+            state = sa_inspect(booking)
+            _add(deltas, previous_value(state, 'user_id'), previous_value(state, 'booking_status'),
+                 previous_value(state, 'total_unit_price'), -1)
+    for booking in session.dirty:
+        if not isinstance(booking, Booking) or booking in session.deleted:
+            continue
+        state = sa_inspect(booking)
+        if not changed(state, ('user_id', 'booking_status', 'total_unit_price')):
+            continue
+        _add(deltas, previous_value(state, 'user_id'), previous_value(state, 'booking_status'),
+             previous_value(state, 'total_unit_price'), -1)
+        _add(deltas, booking.user_id, booking.booking_status, booking.total_unit_price, 1)
+
+    for user_id, delta in deltas.items():
+        stats = session.get(CustomerStats, user_id)
+        if stats is None:
+            # First booking change of this customer since the counters were turned on: counting what is already stored.
+            upsert_customer_stats(session, user_id, _count_bookings(session, user_id), delta)
+            continue
+
+        # Incrementing in SQL (count = count + 1) so concurrent requests do not overwrite each other.
+        for status in STATUSES:
+            if delta[status]:
+                column = getattr(CustomerStats, f"{status}_count")
+                setattr(stats, f"{status}_count", column + int(delta[status]))
+        if delta['total']:
+            stats.bookings_total = CustomerStats.bookings_total + int(delta['total'])
+        if delta['spend']:
+            stats.total_spend = CustomerStats.total_spend + delta['spend']
+
+
+# Recomputes every customer's counters from the bookings table, with one GROUP BY (customer, status).
+def rebuild_customer_stats():
+    from app.extensions import db
+    from app.models.bookings import Booking
+    from app.models.customer_stats import CustomerStats
+
+    rows = (db.session.query(Booking.user_id, Booking.booking_status, func.count(Booking.id), func.sum(Booking.total_unit_price))
+            .filter(Booking.user_id.isnot(None))
+            .group_by(Booking.user_id, Booking.booking_status))
+    grouped = defaultdict(lambda: (defaultdict(int), [0, 0.0]))
+    for user_id, status, count, price in rows:
+        counts, totals = grouped[user_id]
+        counts[(status or '').lower()] += count
+        totals[0] += count
+        if _spent(status):
+            totals[1] += price or 0.0
+
+    db.session.query(CustomerStats).delete()
+    for user_id, (counts, (total, spend)) in grouped.items():
+        stats = CustomerStats(user_id)
+        _fill(stats, counts, total, spend)
+        db.session.add(stats)
+    db.session.commit()
+    return len(grouped)
+
+
+def init_customer_stats(app):
+    from app.models.bookings import Booking
+
+    if not event.contains(RoutingSession, 'before_flush', _update_counters):
+        event.listen(RoutingSession, 'before_flush', _update_counters)
+        track_previous(Booking.user_id, Booking.booking_status, Booking.total_unit_price)
+
+    @app.cli.command('rebuild-customer-stats')
+    def rebuild_customer_stats_command():
+        # Recompute the customer booking counters from the bookings table.
+        count = rebuild_customer_stats()
+        print(f"Rebuilt the booking counters of {count} customers.")
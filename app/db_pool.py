@@ -0,0 +1,93 @@
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Connection pool instrumentation.
+# Records how long requests wait to check a connection out of the pool so workers can be sized against the database.
+
+# Upper bounds (in seconds) of the checkout wait histogram buckets.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def _stats(self, name):
+        stats = self.pools.get(name)
+        if stats is None:
+            stats = self.pools[name] = {
+                'checkouts': 0,
+                'timeouts': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+                'buckets': [0] * len(WAIT_BUCKETS),
+            }
+        return stats
+
+    def record_wait(self, name, seconds):
+        with self.lock:
+            stats = self._stats(name)
+            stats['checkouts'] += 1
+            stats['wait_seconds_total'] += seconds
+            stats['wait_seconds_max'] = max(stats['wait_seconds_max'], seconds)
+            for index, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][index] += 1
+                    break
+
+    def record_timeout(self, name):
+        with self.lock:
+            self._stats(name)['timeouts'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stats, buckets=list(stats['buckets'])) for name, stats in self.pools.items()}
+
+
+pool_metrics = PoolMetrics()
+
+
+# QueuePool that times every checkout, including the time spent waiting for a free connection.
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        name = self._orig_logging_name or 'default'
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout(name)
+            raise
+        pool_metrics.record_wait(name, time.perf_counter() - start)
+        return connection
+
+
+# Uses the timed pool for every engine configured with a sized (queue) pool.
+# Must run before db.init_app so the engines are created with it.
+def configure_pool_metrics(app):
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    if 'pool_size' in options and 'poolclass' not in options:
+        # Copied: the dictionary loaded by from_object is the config class attribute, shared by every app.
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, poolclass=TimedQueuePool)
+
+
+# Current pool usage of every engine together with the recorded wait times.
+def pool_status(db):
+    waits = pool_metrics.snapshot()
+    status = {}
+    for bind_key, engine in db.engines.items():
+        name = bind_key or 'default'
+        pool = engine.pool
+        info = {'pool_class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            info.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+            })
+        info['wait'] = waits.get(name, {})
+        status[name] = info
+    return status
@@ -0,0 +1,163 @@
+import itertools
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+# Read replica routing.
+# GET/HEAD requests read from one of the replicas listed in SQLALCHEMY_REPLICA_URIS, everything else uses the primary.
+# Once a request has written to the database its remaining queries go to the primary (read your writes), and a short lived
+# cookie keeps the same client on the primary for DB_REPLICA_STICKY_SECONDS so it does not read data older than its own write.
+# A read that fails on its replica (connection lost, replica broken) is run again on the primary, and the replica is
+# skipped by the next requests for DB_REPLICA_RETRY_SECONDS.
+
+# Cookie sent back to a client that has just written to the database.
+STICKY_COOKIE = 'db_primary'
+
+# Request methods that can be served from a replica.
+READ_METHODS = ('GET', 'HEAD')
+
+
+class ReplicaRouter:
+    def __init__(self, app, bind_keys):
+        self.bind_keys = bind_keys
+        self.check_interval = app.config['DB_REPLICA_CHECK_INTERVAL']
+        self.retry_after = app.config['DB_REPLICA_RETRY_SECONDS']
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.down_until = {key: 0.0 for key in bind_keys} # A failed replica is skipped until this time.
+        self.checked_at = {key: 0.0 for key in bind_keys} # Last time the replica answered a health check.
+
+    def mark_down(self, bind_key):
+        with self.lock:
+            self.down_until[bind_key] = time.monotonic() + self.retry_after
+            self.checked_at[bind_key] = 0.0
+
+    def is_healthy(self, bind_key, engine):
+        now = time.monotonic()
+        if self.down_until[bind_key] > now:
+            return False
+        if now - self.checked_at[bind_key] < self.check_interval:
+            return True
+
+        # Checking the replica at most once every check interval instead of on every request.
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception as e:
+            current_app.logger.warning('Read replica %s is unavailable, using the primary: %s', bind_key, e)
+            self.mark_down(bind_key)
+            return False
+
+        with self.lock:
+            self.checked_at[bind_key] = now
+        return True
+
+    # Round robin over the healthy replicas, None means the primary should be used.
+    def pick(self, engines):
+        start = next(self.counter)
+        for offset in range(len(self.bind_keys)):
+            bind_key = self.bind_keys[(start + offset) % len(self.bind_keys)]
+            engine = engines[bind_key]
+            if self.is_healthy(bind_key, engine):
+                return bind_key, engine
+        return None, None
+
+
+# Session that sends the queries of read only requests to a replica.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_read_only'):
+            engine = _replica_engine(self._db)
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_engine(db):
+    # The replica is chosen once per request so all its reads see the same snapshot.
+    if 'db_replica' not in g:
+        router = current_app.extensions.get('db_router')
+        bind_key, engine = router.pick(db.engines) if router else (None, None)
+        g.db_replica = bind_key
+        g.db_replica_engine = engine
+    return g.db_replica_engine
+
+
+# Any write (flush) sends the rest of the request to the primary.
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    if has_request_context():
+        g.db_read_only = False
+        g.db_wrote = True
+
+
+# Runs every ORM statement of a request reading from a replica: a failed read is retried on the primary, which then
+# serves the rest of the request.
+def _retry_on_primary(execute_state):
+    if not execute_state.is_select or not has_request_context() or not g.get('db_read_only'):
+        return None
+    if _replica_engine(execute_state.session._db) is None:
+        return None
+    try:
+        return execute_state.invoke_statement()
+    except OperationalError as e:
+        bind_key = g.db_replica
+        current_app.logger.warning('Read on replica %s failed, retrying on the primary: %s', bind_key, e)
+        current_app.extensions['db_router'].mark_down(bind_key)
+        g.db_replica = None
+        g.db_replica_engine = None
+        execute_state.session.rollback() # Read only request: nothing is lost, the replica connection is released.
+        return execute_state.invoke_statement()
+
+
+# Adds one bind per replica url. Must run before db.init_app so the engines are created.
+def configure_replicas(app):
+    from config import engine_options
+    from app.db_pool import TimedQueuePool
+
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    bind_keys = []
+    for index, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or []):
+        bind_key = f"replica_{index}"
+        options = {'url': uri}
+        # SQLite stand-ins (used for local testing) keep their default pool.
+        if not uri.startswith('sqlite'):
+            options.update(engine_options(uri))
+            options['poolclass'] = TimedQueuePool
+            options['pool_logging_name'] = bind_key # Pool metrics are reported per replica.
+        binds[bind_key] = options
+        bind_keys.append(bind_key)
+    return bind_keys
+
+
+# Installs the router and the request hooks. Runs after db.init_app.
+def init_replica_routing(app, db, bind_keys):
+    if not bind_keys:
+        return
+
+    router = ReplicaRouter(app, bind_keys)
+    app.extensions['db_router'] = router
+    if not event.contains(RoutingSession, 'do_orm_execute', _retry_on_primary):
+        event.listen(RoutingSession, 'do_orm_execute', _retry_on_primary)
+
+    # A replica that loses its connection is skipped until it has had time to recover.
+    with app.app_context():
+        for bind_key in bind_keys:
+            def handle_error(context, bind_key=bind_key):
+                if context.is_disconnect or context.connection is None:
+                    router.mark_down(bind_key)
+            event.listen(db.engines[bind_key], 'handle_error', handle_error)
+
+    @app.before_request
+    def route_reads_to_replica():
+        g.db_read_only = request.method in READ_METHODS and not request.cookies.get(STICKY_COOKIE)
+
+    @app.after_request
+    def keep_writer_on_primary(response):
+        if g.get('db_wrote'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=app.config['DB_REPLICA_STICKY_SECONDS'], httponly=True)
+        return response
@@ -0,0 +1,225 @@
+import csv
+import gzip
+import io
+import json
+from collections import defaultdict
+import click
+from sqlalchemy import select
+
+# Bookings export for offline analysis.
+# The bookings joined with their service are read in chunks of EXPORT_CHUNK_SIZE rows through a server side cursor
+# (stream_results), each chunk is turned into columns and written out straight away, so the memory used does not
+# depend on the number of bookings exported.
+# Formats: csv (gzip compressed), and parquet / feather (zstd compressed) when pyarrow is installed.
+# The per service summary is computed over the columns of each chunk with numpy when it is installed.
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError: # pyarrow is optional, only csv is offered without it.
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError: # numpy is optional, the summary falls back to a loop.
+    numpy = None
+
+# Exported columns, in order.
+COLUMNS = ('booking_id', 'booking_date', 'start_time', 'end_time', 'hours', 'booking_status', 'total_unit_price',
+           'user_id', 'service_id', 'service_name', 'service_type', 'created_at')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file',
+}
+
+
+class ExportError(Exception):
+    # Raised for an export that cannot be produced (unknown format, missing library...).
+    pass
+
+
+def formats():
+    return ('csv', 'parquet', 'feather') if pyarrow is not None else ('csv',)
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second if value is not None else 0
+
+
+# Columns of the bookings between start and end, one dictionary of lists per chunk.
+def iter_chunks(session, start=None, end=None, chunk_size=5000):
+    from app.models.bookings import Booking
+    from app.models.services import Service
+
+    statement = (select(Booking.id, Booking.booking_date, Booking.start_time, Booking.end_time, Booking.booking_status,
+                        Booking.total_unit_price, Booking.user_id, Booking.service_id, Service.service_name,
+                        Service.service_type, Booking.created_at)
+                 .outerjoin(Service, Service.id == Booking.service_id)
+                 .order_by(Booking.id))
+    if start:
+        statement = statement.where(Booking.booking_date >= start)
+    if end:
+        statement = statement.where(Booking.booking_date <= end)
+
+    # stream_results keeps the rows on the database side (server side cursor) until each chunk is fetched.
+    result = session.execute(statement.execution_options(stream_results=True, yield_per=chunk_size))
+    for rows in result.partitions():
+        (ids, days, starts, ends, statuses, prices, user_ids, service_ids, service_names, service_types,
+         created) = zip(*rows)
+        yield {
+            'booking_id': list(ids),
+            'booking_date': list(days),
+            'start_time': list(starts),
+            'end_time': list(ends),
+            'hours': [(_seconds(e) - _seconds(s)) / 3600 for s, e in zip(starts, ends)],
+            'booking_status': list(statuses),
+            'total_unit_price': [price or 0.0 for price in prices],
+            'user_id': list(user_ids),
+            'service_id': list(service_ids),
+            'service_name': list(service_names),
+            'service_type': list(service_types),
+            'created_at': list(created),
+        }
+
+
+class ServiceSummary:
+    # Bookings, hours, revenue and cancellations per service, added up chunk by chunk.
+    def __init__(self):
+        self.totals = defaultdict(lambda: {'bookings': 0, 'hours': 0.0, 'revenue': 0.0, 'cancelled': 0})
+        self.names = {}
+
+    def add(self, chunk):
+        service_ids = chunk['service_id']
+        for service_id, name in zip(service_ids, chunk['service_name']):
+            self.names.setdefault(service_id, name)
+
+        cancelled = [(status or '').lower() == 'cancelled' for status in chunk['booking_status']]
+        if numpy is not None:
+            self._add_vectorized(service_ids, chunk['hours'], chunk['total_unit_price'], cancelled)
+        else:
+            for service_id, hours, price, is_cancelled in zip(service_ids, chunk['hours'], chunk['total_unit_price'], cancelled):
+                totals = self.totals[service_id]
+                totals['bookings'] += 1
+                totals['cancelled'] += is_cancelled
+                if not is_cancelled:
+                    totals['hours'] += hours
+                    totals['revenue'] += price
+
+    def _add_vectorized(self, service_ids, hours, prices, cancelled):
+        keys = numpy.array([-1 if service_id is None else service_id for service_id in service_ids])
+        cancelled = numpy.array(cancelled, dtype=bool)
+        kept = ~cancelled
+        # One pass per column: every row is added to the slot of its service.
+        services, slots = numpy.unique(keys, return_inverse=True)
+        bookings = numpy.bincount(slots, minlength=len(services))
+        cancelled_counts = numpy.bincount(slots, weights=cancelled, minlength=len(services))
+        hours_sums = numpy.bincount(slots, weights=numpy.array(hours) * kept, minlength=len(services))
+        revenue_sums = numpy.bincount(slots, weights=numpy.array(prices, dtype=float) * kept, minlength=len(services))
+        for index, key in enumerate(services.tolist()):
+            totals = self.totals[None if key == -1 else key]
+            totals['bookings'] += int(bookings[index])
+            totals['cancelled'] += int(cancelled_counts[index])
+            totals['hours'] += float(hours_sums[index])
+            totals['revenue'] += float(revenue_sums[index])
+
+    def rows(self):
+        return [dict(service_id=service_id, service_name=self.names.get(service_id),
+                     bookings=totals['bookings'], cancelled=totals['cancelled'],
+                     hours=round(totals['hours'], 2), revenue=round(totals['revenue'], 2))
+                for service_id, totals in sorted(self.totals.items(), key=lambda item: (item[0] is None, item[0] or 0))]
+
+
+# Dates and times in ISO format, like the JSON responses.
+def _csv_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _csv_rows(chunk):
+    columns = [chunk[name] for name in COLUMNS]
+    for row in zip(*columns):
+        yield [_csv_value(value) for value in row]
+
+
+# CSV text of the chunks, produced as it is read (used by the streamed download).
+def iter_csv(chunks, summary=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for chunk in chunks:
+        if summary is not None:
+            summary.add(chunk)
+        writer.writerows(_csv_rows(chunk))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _arrow_schema():
+    return pyarrow.schema([
+        ('booking_id', pyarrow.int64()),
+        ('booking_date', pyarrow.date32()),
+        ('start_time', pyarrow.time64('us')),
+        ('end_time', pyarrow.time64('us')),
+        ('hours', pyarrow.float64()),
+        ('booking_status', pyarrow.string()),
+        ('total_unit_price', pyarrow.float64()),
+        ('user_id', pyarrow.int64()),
+        ('service_id', pyarrow.int64()),
+        ('service_name', pyarrow.string()),
+        ('service_type', pyarrow.string()),
+        ('created_at', pyarrow.timestamp('us')),
+    ])
+
+
+# Writes the chunks to a file object in the given format and returns the per service summary.
+def write_export(chunks, fileobj, export_format):
+    if export_format not in formats():
+        raise ExportError(f"Unsupported export format: {export_format}. Available: {', '.join(formats())}")
+
+    summary = ServiceSummary()
+    if export_format == 'csv':
+        with gzip.GzipFile(fileobj=fileobj, mode='wb') as compressed:
+            for text in iter_csv(chunks, summary):
+                compressed.write(text.encode('utf-8'))
+        return summary
+
+    schema = _arrow_schema()
+    if export_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(fileobj, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(fileobj, schema, options=pyarrow.ipc.IpcWriteOptions(compression='zstd'))
+    try:
+        for chunk in chunks:
+            summary.add(chunk)
+            batch = pyarrow.RecordBatch.from_arrays([pyarrow.array(chunk[name], type=schema.field(name).type)
+                                                     for name in COLUMNS], schema=schema)
+            writer.write_batch(batch)
+    finally:
+        writer.close()
+    return summary
+
+
+def init_exports(app):
+    @app.cli.command('export-bookings')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='first booking day exported')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='last booking day exported')
+    @click.option('--format', 'export_format', default='csv', help='csv, parquet or feather')
+    @click.option('--output', required=True, help='file written (csv files are gzip compressed)')
+    @click.option('--chunk-size', type=int, default=None, help='rows read from the database at a time')
+    def export_bookings_command(start, end, export_format, output, chunk_size):
+        # Export the bookings with their service to a columnar or csv file and print the per service summary.
+        from app.extensions import db
+
+        chunks = iter_chunks(db.session, start.date() if start else None, end.date() if end else None,
+                             chunk_size or app.config['EXPORT_CHUNK_SIZE'])
+        try:
+            with open(output, 'wb') as export_file:
+                summary = write_export(chunks, export_file, export_format)
+        except ExportError as e:
+            raise click.ClickException(str(e))
+        print(json.dumps(summary.rows(), indent=2))
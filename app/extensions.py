@@ -1,9 +1,24 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager
+from sqlite3 import Connection as SQLiteConnection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.db_routing import RoutingSession
+from app.jwt_cache import CachingJWTManager
 
-db = SQLAlchemy()
+# The routing session sends the reads of GET requests to the read replicas when they are configured.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 bcrypt = Bcrypt()
-jwt = JWTManager()
\ No newline at end of file
+# Can skip decoding the tokens it verified recently (JWT_VERIFY_CACHE_SIZE).
+jwt = CachingJWTManager()
+
+
+# SQLite (used for local testing) only enforces the foreign keys and their ON DELETE rules when asked to, per connection.
+@event.listens_for(Engine, 'connect')
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, SQLiteConnection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
@@ -0,0 +1,237 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from app.instrumentation import registry
+from app.rate_limit import client_key
+from app.status_codes import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_422_UNPROCESSABLE_ENTITY, HTTP_503_SERVICE_UNAVAILABLE
+
+# Idempotency keys for the create endpoints.
+# A client sends an Idempotency-Key header (any unique string, e.g. a UUID) with a POST and sends the same key again
+# when it retries. The first request runs the view and its response is stored under (client, endpoint, key) for
+# IDEMPOTENCY_TTL seconds; a retry gets the stored response back (with Idempotent-Replayed: true) without running the
+# view again, so no second booking, message, email or password hash.
+# - a retry arriving while the first request still runs gets a 409 with Retry-After,
+# - the same key sent with a different body gets a 422,
+# - 5xx responses are not stored, the request can be retried for real.
+# Requests without the header run as before.
+# The responses are kept in Redis (IDEMPOTENCY_STORAGE_URL, RATE_LIMIT_STORAGE_URL by default) so a retry reaching
+# another worker or host finds them. The in memory store only sees the requests of its own process: it is refused
+# (the header is then ignored, with an error in the log) when the app runs in more than one worker process.
+# A store that fails (Redis down) must not take the create endpoints down with it: the request then runs without
+# idempotency, like the rate limiter lets requests through when its backend fails.
+
+try:
+    import redis
+except ImportError: # redis is optional, only needed for the shared store.
+    redis = None
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Response headers kept with the stored response.
+STORED_HEADERS = ('Content-Type', 'Location')
+
+idempotency_requests = registry.counter('idempotency_requests_total', 'Requests sent with an Idempotency-Key.', ('endpoint', 'result'))
+store_errors = registry.counter('idempotency_store_errors_total', 'Idempotency store calls that failed.', ('endpoint', 'call'))
+
+
+class MemoryStore:
+    # Stored responses of one worker process, dropped after their TTL or, past max_keys, oldest finished first.
+    def __init__(self, max_keys=10000):
+        self.entries = OrderedDict() # key -> [expires, fingerprint, response or None while running]
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def _evict(self, now):
+        # Every entry gets the same TTL, so the oldest entries are the first to expire.
+        while self.entries and next(iter(self.entries.values()))[0] <= now:
+            self.entries.popitem(last=False)
+        # Past max_keys the oldest finished responses go. A running entry is kept, without it a retry would run the view
+        # a second time.
+        extra = len(self.entries) - self.max_keys
+        if extra > 0:
+            for key in [key for key, entry in self.entries.items() if entry[2] is not None][:extra]:
+                del self.entries[key]
+
+    # Claims the key for a new request, or returns what is already stored under it:
+    # ('new', None), ('running', None), ('mismatch', None) or ('replay', response).
+    # ('full', None) when max_keys requests are running at once and the key cannot be claimed.
+    def begin(self, key, fingerprint, ttl):
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = [now + ttl, fingerprint, None]
+                self._evict(now)
+                if len(self.entries) > self.max_keys:
+                    del self.entries[key]
+                    return 'full', None
+                return 'new', None
+            if entry[1] != fingerprint:
+                return 'mismatch', None
+            if entry[2] is None:
+                return 'running', None
+            return 'replay', entry[2]
+
+    def finish(self, key, response):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[2] = response
+
+    def abandon(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RedisStore:
+    # Stored responses shared by every worker: the key is claimed with SET NX and expires with the TTL.
+    def __init__(self, client, prefix='idempotency:'):
+        self.client = client
+        self.prefix = prefix
+
+    @staticmethod
+    def _dump(fingerprint, response):
+        if response is not None:
+            status, body, headers = response
+            response = [status, base64.b64encode(body).decode('ascii'), headers]
+        return json.dumps([fingerprint, response])
+
+    def begin(self, key, fingerprint, ttl):
+        key = self.prefix + key
+        for _ in range(2):
+            if self.client.set(key, self._dump(fingerprint, None), nx=True, ex=max(1, int(ttl))):
+                return 'new', None
+            value = self.client.get(key)
+            if value is None:
+                continue # Expired or abandoned in between, claimed on the second try.
+            stored_fingerprint, response = json.loads(value)
+            if stored_fingerprint != fingerprint:
+                return 'mismatch', None
+            if response is None:
+                return 'running', None
+            status, body, headers = response
+            return 'replay', (status, base64.b64decode(body), headers)
+        return 'running', None
+
+    def finish(self, key, response):
+        # The fingerprint is read back so a finished request keeps it, XX/KEEPTTL leave the claim and its TTL as they are.
+        value = self.client.get(self.prefix + key)
+        if value is not None:
+            fingerprint = json.loads(value)[0]
+            self.client.set(self.prefix + key, self._dump(fingerprint, response), xx=True, keepttl=True)
+
+    def abandon(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class Idempotency:
+    def __init__(self):
+        self.store = MemoryStore()
+
+    def init_app(self, app, store=None):
+        if store is None:
+            url = app.config.get('IDEMPOTENCY_STORAGE_URL')
+            if url:
+                if redis is None:
+                    raise RuntimeError('IDEMPOTENCY_STORAGE_URL is set but the redis package is not installed.')
+                store = RedisStore(redis.Redis.from_url(url))
+            elif app.config.get('IDEMPOTENCY_ENABLED') and app.config.get('WORKER_PROCESSES', 1) > 1:
+                # A retry sent to another worker would run the view again: no replays rather than unreliable ones.
+                app.logger.error('Idempotency-Key support is off: %s worker processes and no IDEMPOTENCY_STORAGE_URL '
+                                 'to share the stored responses.', app.config['WORKER_PROCESSES'])
+                app.config['IDEMPOTENCY_ENABLED'] = False
+        self.store = store if store is not None else MemoryStore(app.config['IDEMPOTENCY_MAX_KEYS'])
+
+
+idempotency = Idempotency()
+
+
+def _fingerprint():
+    digest = hashlib.sha256(request.method.encode())
+    digest.update(request.full_path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(stored):
+    status, body, headers = stored
+    response = make_response(body, status)
+    response.headers.update(headers)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+# Runs the view once per Idempotency-Key, replays its response for the retries.
+# Put it under @jwt_required so the key is scoped to the authenticated user.
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not current_app.config.get('IDEMPOTENCY_ENABLED'):
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'Error': f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."}), HTTP_400_BAD_REQUEST
+
+        endpoint = request.endpoint
+        store_key = f"{client_key()}:{endpoint}:{key}"
+        store = idempotency.store
+        try:
+            state, stored = store.begin(store_key, _fingerprint(), current_app.config['IDEMPOTENCY_TTL'])
+        except Exception as e:
+            _store_failed(endpoint, 'begin', e)
+            return view(*args, **kwargs)
+        idempotency_requests.inc(endpoint, state)
+        if state == 'replay':
+            return _replay(stored)
+        if state == 'running':
+            response = jsonify({'Error': 'A request with this Idempotency-Key is still being processed.'})
+            response.status_code = HTTP_409_CONFLICT
+            response.headers['Retry-After'] = '1'
+            return response
+        if state == 'mismatch':
+            return jsonify({'Error': f"This {HEADER} was already used with a different request."}), HTTP_422_UNPROCESSABLE_ENTITY
+        if state == 'full':
+            response = jsonify({'Error': 'Too many requests are being processed, please retry.'})
+            response.status_code = HTTP_503_SERVICE_UNAVAILABLE
+            response.headers['Retry-After'] = '1'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            _store_call(endpoint, 'abandon', store.abandon, store_key)
+            raise
+        if response.status_code >= 500 or response.is_streamed:
+            _store_call(endpoint, 'abandon', store.abandon, store_key)
+        else:
+            headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+            _store_call(endpoint, 'finish', store.finish, store_key, (response.status_code, response.get_data(), headers))
+        return response
+    return wrapper
+
+
+def _store_failed(endpoint, call, error):
+    store_errors.inc(endpoint, call)
+    current_app.logger.warning('Idempotency store %s failed for %s, running without it: %s', call, endpoint, error)
+
+
+# finish/abandon after the view ran: a failure only loses the stored response, the view's response is still sent.
+def _store_call(endpoint, call, function, *args):
+    try:
+        function(*args)
+    except Exception as e:
+        _store_failed(endpoint, call, e)
+
+
+def init_idempotency(app, store=None):
+    idempotency.init_app(app, store)
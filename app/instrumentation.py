@@ -0,0 +1,237 @@
+import hmac
+import random
+import threading
+import time
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request and database instrumentation exposed on /metrics in the Prometheus text format.
+# Every request is counted in http_requests_total. A sampled request also records its latency, the number of SQL queries
+# it ran and the time spent in the database. Unsampled requests cost one random() call and the counter increment.
+
+# Upper bounds of the histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {} # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels + ('le',), label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = [] # Functions returning extra lines (values read at scrape time, e.g. pool usage).
+
+    def counter(self, name, description, labels=()):
+        return self.metrics.setdefault(name, Counter(name, description, labels))
+
+    def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, description, labels, buckets))
+
+    def collector(self, function):
+        if function not in self.collectors:
+            self.collectors.append(function)
+        return function
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        for function in self.collectors:
+            lines.extend(function())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.histogram('http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'))
+request_count = registry.counter('http_requests_total', 'Requests by endpoint and status code.', ('endpoint', 'method', 'status'))
+request_queries = registry.histogram('http_request_db_queries', 'SQL queries run per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+request_db_time = registry.histogram('http_request_db_seconds', 'Time spent in the database per request.', ('endpoint',))
+slow_queries = registry.counter('db_slow_queries_total', 'Queries slower than SLOW_QUERY_SECONDS.', ('endpoint',))
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_request():
+    if current_app.config['METRICS_SAMPLE_RATE'] <= random.random():
+        return
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_time = 0.0
+
+
+def _after_request(response):
+    endpoint = _endpoint()
+    request_count.inc(endpoint, request.method, response.status_code)
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+    request_latency.observe(time.perf_counter() - start, endpoint, request.method)
+    request_queries.observe(g.metrics_queries, endpoint)
+    request_db_time.observe(g.metrics_db_time, endpoint)
+    return response
+
+
+def _sampled():
+    return has_request_context() and 'metrics_start' in g
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _sampled():
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts or not _sampled():
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    g.metrics_queries += 1
+    g.metrics_db_time += elapsed
+
+    if elapsed >= current_app.config['SLOW_QUERY_SECONDS']:
+        endpoint = _endpoint()
+        slow_queries.inc(endpoint)
+        current_app.logger.warning('Slow query (%.3fs) in %s: %s', elapsed, endpoint, statement)
+
+
+# A failed query never reaches after_cursor_execute: its start is dropped so the next query on the connection (which
+# goes back to the pool) is not timed from it.
+def _handle_error(context):
+    if context.connection is None:
+        return
+    starts = context.connection.info.get('metrics_query_start')
+    if starts:
+        starts.pop()
+
+
+# Connection pool usage and checkout waits (see app/db_pool.py).
+def _pool_lines():
+    from app.extensions import db
+    from app.db_pool import WAIT_BUCKETS, pool_status
+
+    lines = [
+        '# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection.',
+        '# TYPE db_pool_checkout_wait_seconds histogram',
+    ]
+    gauges = {'size': [], 'checked_out': [], 'overflow': []}
+    timeouts = []
+    for name, info in pool_status(db).items():
+        labels = f'pool="{name}"'
+        wait = info.get('wait')
+        if wait:
+            cumulative = 0
+            for bound, count in zip(WAIT_BUCKETS, wait['buckets']):
+                cumulative += count
+                lines.append(f'db_pool_checkout_wait_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'db_pool_checkout_wait_seconds_bucket{{{labels},le="+Inf"}} {wait["checkouts"]}')
+            lines.append(f'db_pool_checkout_wait_seconds_sum{{{labels}}} {wait["wait_seconds_total"]}')
+            lines.append(f'db_pool_checkout_wait_seconds_count{{{labels}}} {wait["checkouts"]}')
+            timeouts.append(f'db_pool_checkout_timeouts_total{{{labels}}} {wait["timeouts"]}')
+        for gauge in gauges:
+            if gauge in info:
+                gauges[gauge].append(f'db_pool_{gauge}{{{labels}}} {info[gauge]}')
+
+    lines += ['# HELP db_pool_checkout_timeouts_total Checkouts that gave up waiting for a connection.',
+              '# TYPE db_pool_checkout_timeouts_total counter'] + timeouts
+    for gauge, values in gauges.items():
+        lines += [f'# HELP db_pool_{gauge} Connection pool {gauge.replace("_", " ")}.', f'# TYPE db_pool_{gauge} gauge'] + values
+    return lines
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_AUTH_TOKEN')
+    # compare_digest takes as long whatever matches, the token cannot be guessed from the response times.
+    if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app):
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    # Engine events fire for every engine (primary and replicas).
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    registry.collector(_pool_lines)
+    if app.config.get('METRICS_REQUIRE_TOKEN') and not app.config.get('METRICS_AUTH_TOKEN'):
+        # Requests are still measured, the numbers are only readable once a token is configured.
+        app.logger.error('/metrics is not served: METRICS_AUTH_TOKEN is not set.')
+        return
+    app.add_url_rule('/metrics', 'metrics_endpoint', metrics_view)
@@ -0,0 +1,59 @@
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime, time
+from flask.json.provider import DefaultJSONProvider
+
+# JSON providers, picked with the JSON_PROVIDER config value ('orjson' or 'default').
+# Both write dates and times in ISO 8601 (2026-10-19, 08:30:00, 2026-10-19T08:30:00) instead of Flask's
+# HTTP date format, so the same value is formatted the same way whichever provider is used.
+
+try:
+    import orjson
+except ImportError: # orjson is optional, the standard library provider is used without it.
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# Standard library provider with ISO dates.
+class IsoJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    # Key order does not matter to the clients and sorting costs time on large lists.
+    sort_keys = False
+
+
+# orjson provider: several times faster than the json module on large lists of dicts.
+# orjson writes datetime, date and time objects in ISO format itself.
+class OrjsonProvider(IsoJSONProvider):
+    options = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.options).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # The bytes from orjson go straight into the response, without decoding them to a str first.
+        return self._app.response_class(orjson.dumps(obj, default=_default, option=self.options), mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    if app.config.get('JSON_PROVIDER') == 'orjson' and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = IsoJSONProvider(app)
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from importlib.metadata import version
+from flask import current_app
+from flask_jwt_extended import JWTManager
+from app.instrumentation import registry
+
+# Cache of verified tokens.
+# Every @jwt_required request decodes its token and checks its signature (an HMAC, or an RSA/Ed25519 verification with
+# the key ring), often twice since the rate limiter reads the token too. With JWT_VERIFY_CACHE_SIZE set, the claims of
+# a token that verified are kept in memory under the sha256 digest of the token, and the next requests with the same
+# token get them back without decoding it again.
+# An entry is served until the token expires, and at most JWT_VERIFY_CACHE_TTL seconds, so a retired signing key or a
+# new JWT_SECRET_KEY takes effect within that time. Revocation (app/token_blocklist.py), token type and freshness are
+# still checked on every request, only the decoding and the signature check are skipped. The expiry and the "not before"
+# time are checked again on every hit, with the JWT_DECODE_LEEWAY the decoding uses.
+# The cache hooks into JWTManager._decode_jwt_from_config, a private method of flask-jwt-extended (4.x, tested with
+# 4.7). With another major version the cache stays off and every token is decoded, see SUPPORTED_JWT_EXTENDED.
+
+SUPPORTED_JWT_EXTENDED = '4.'
+
+cache_lookups = registry.counter('jwt_verify_cache_lookups_total', 'Verified token cache lookups.', ('result',))
+
+
+class VerifiedTokenCache:
+    # Least recently used verified tokens, each with the time it stops being served.
+    def __init__(self, max_entries, ttl):
+        self.entries = OrderedDict() # token digest -> (expires, claims)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    def get(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self.entries[key] # Expired token: decoded again, which raises the expiry error.
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, claims, now):
+        expires = now + self.ttl
+        if claims.get('exp') is not None:
+            expires = min(expires, claims['exp'])
+        with self.lock:
+            self.entries[key] = (expires, claims)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Same time checks as the decoding: exp and nbf give or take the leeway. A token out of its time is decoded again,
+# which raises the usual error.
+def _in_time(claims, now):
+    leeway = current_app.config.get('JWT_DECODE_LEEWAY', 0)
+    if isinstance(leeway, timedelta):
+        leeway = leeway.total_seconds()
+    if claims.get('exp') is not None and now >= claims['exp'] + leeway:
+        return False
+    return claims.get('nbf') is None or now >= claims['nbf'] - leeway
+
+
+class CachingJWTManager(JWTManager):
+    # JWTManager reading the claims of recently verified tokens from the app's VerifiedTokenCache when there is one.
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        cache = current_app.extensions.get('jwt_verify_cache')
+        if cache is None or csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.sha256(encoded_token.encode() if isinstance(encoded_token, str) else encoded_token).digest()
+        now = time.time()
+        claims = cache.get(key, now)
+        if claims is not None and _in_time(claims, now):
+            cache_lookups.inc('hit')
+            return dict(claims) # A copy, the callers may add to it.
+
+        cache_lookups.inc('miss')
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        cache.put(key, dict(claims), now)
+        return claims
+
+
+def init_jwt_cache(app):
+    size = app.config.get('JWT_VERIFY_CACHE_SIZE')
+    if size and not (version('flask-jwt-extended').startswith(SUPPORTED_JWT_EXTENDED)
+                     and hasattr(JWTManager, '_decode_jwt_from_config')):
+        app.logger.warning('JWT_VERIFY_CACHE_SIZE is ignored: flask-jwt-extended %s is not supported by the token cache.',
+                           version('flask-jwt-extended'))
+        return
+    if size:
+        app.extensions['jwt_verify_cache'] = VerifiedTokenCache(size, app.config['JWT_VERIFY_CACHE_TTL'])
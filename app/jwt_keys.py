@@ -0,0 +1,306 @@
+import base64
+import os
+import secrets
+import threading
+import time
+import click
+from flask import current_app, g, jsonify
+from jwt import InvalidTokenError
+
+# Asymmetric JWT signing with a key ring.
+# With JWT_KEYS_PATH set, tokens are signed with a private key (RS256 or EdDSA) instead of the shared JWT_SECRET_KEY,
+# and carry the id of that key in their "kid" header. The public keys are published on /.well-known/jwks.json so
+# other services verify our tokens themselves, without the signing secret and without calling this API.
+# The ring is a directory of <kid>.pem private keys plus an "active" file naming the key that signs. Every key in the
+# directory verifies. Workers look for changes every JWT_KEYS_RELOAD_SECONDS and only parse new or changed files, the
+# parsed keys are kept in memory so a request does not read or parse any PEM.
+# Rotation without downtime ("flask jwt-keys ..."):
+#   1. generate: the new key is published on the JWKS but does not sign yet (verifiers pick it up at their next fetch),
+#   2. activate <kid>: new tokens are signed with it, tokens signed with the old key still verify,
+#   3. retire <old kid>: once the old key's tokens have expired (JWT_REFRESH_TOKEN_EXPIRES).
+# Without JWT_KEYS_PATH the tokens are signed with JWT_SECRET_KEY (HS256) as before.
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+except ImportError: # cryptography is optional, only needed for the key ring.
+    serialization = None
+
+ALGORITHMS = ('RS256', 'EdDSA')
+ACTIVE_FILE = 'active'
+
+
+class KeyRingError(Exception):
+    # Raised for a key ring that cannot be used (missing library, no active key...).
+    pass
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _int_b64(number):
+    return _b64(number.to_bytes((number.bit_length() + 7) // 8, 'big'))
+
+
+# Public half of a key in the JWK format (RFC 7517, RFC 8037 for Ed25519).
+def public_jwk(kid, public_key):
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return {'kty': 'OKP', 'crv': 'Ed25519', 'x': _b64(raw), 'kid': kid, 'alg': 'EdDSA', 'use': 'sig'}
+    numbers = public_key.public_numbers()
+    return {'kty': 'RSA', 'n': _int_b64(numbers.n), 'e': _int_b64(numbers.e), 'kid': kid, 'alg': 'RS256', 'use': 'sig'}
+
+
+class SigningKey:
+    def __init__(self, kid, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        self.algorithm = 'EdDSA' if isinstance(private_key, ed25519.Ed25519PrivateKey) else 'RS256'
+        self.jwk = public_jwk(kid, self.public_key)
+
+
+class KeyRing:
+    def __init__(self, path, reload_seconds=10):
+        if serialization is None:
+            raise KeyRingError('The cryptography package is required to sign tokens with a key ring.')
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.keys = {} # kid -> SigningKey
+        self.active = None
+        self.files = {} # file name -> modification time of the version loaded
+        self.checked = None
+        self.lock = threading.Lock()
+
+    def _listing(self):
+        listing = {}
+        if not os.path.isdir(self.path):
+            return listing
+        for name in os.listdir(self.path):
+            if name.endswith('.pem') or name == ACTIVE_FILE:
+                listing[name] = os.stat(os.path.join(self.path, name)).st_mtime_ns
+        return listing
+
+    def load(self):
+        with self.lock:
+            listing = self._listing()
+            keys = {}
+            for name, mtime in listing.items():
+                if not name.endswith('.pem'):
+                    continue
+                kid = name[:-len('.pem')]
+                if kid in self.keys and self.files.get(name) == mtime:
+                    keys[kid] = self.keys[kid] # Unchanged file, already parsed.
+                    continue
+                with open(os.path.join(self.path, name), 'rb') as key_file:
+                    keys[kid] = SigningKey(kid, serialization.load_pem_private_key(key_file.read(), password=None))
+
+            if ACTIVE_FILE in listing:
+                with open(os.path.join(self.path, ACTIVE_FILE)) as active_file:
+                    active = active_file.read().strip()
+            elif len(keys) == 1:
+                active = next(iter(keys))
+            else:
+                active = None
+            if active not in keys:
+                raise KeyRingError(f"No active signing key in {self.path} (run \"flask jwt-keys generate --activate\").")
+
+            self.keys, self.active, self.files = keys, active, listing
+            self.checked = time.monotonic()
+
+    # Picks up keys added, activated or retired by the other workers, at most once every reload_seconds.
+    def refresh(self, force=False):
+        if self.checked is None:
+            self.load()
+            return
+        if not force and time.monotonic() - self.checked < self.reload_seconds:
+            return
+        try:
+            changed = self._listing() != self.files
+        except OSError:
+            changed = False
+        if changed:
+            try:
+                self.load()
+            except (KeyRingError, OSError, ValueError) as e:
+                # E.g. an active file naming a key not copied yet, or a half written PEM: the last good keys keep
+                # signing and verifying, the directory is read again after reload_seconds.
+                current_app.logger.error('Reloading the JWT key ring failed, keeping the keys loaded before: %s', e)
+                self.checked = time.monotonic()
+        else:
+            self.checked = time.monotonic()
+
+    def signing_key(self, algorithm):
+        self.refresh()
+        key = self.keys[self.active]
+        if key.algorithm != algorithm:
+            raise KeyRingError(f"The active key {key.kid} is an {key.algorithm} key, tokens are signed with {algorithm}.")
+        return key
+
+    def verification_key(self, kid):
+        self.refresh()
+        key = self.keys.get(kid)
+        if key is None:
+            # Maybe a key generated a moment ago, not seen yet by this worker (looked for at most once a second,
+            # so tokens with made up kids do not list the directory on every request).
+            self.refresh(force=time.monotonic() - self.checked >= 1)
+            key = self.keys.get(kid)
+        if key is None:
+            raise InvalidTokenError(f"Unknown signing key: {kid}")
+        return key.public_key
+
+    def jwks(self):
+        self.refresh()
+        return {'keys': [key.jwk for kid, key in sorted(self.keys.items())]}
+
+
+def generate_key(path, algorithm='RS256'):
+    if serialization is None:
+        raise KeyRingError('The cryptography package is required to generate signing keys.')
+    if algorithm not in ALGORITHMS:
+        raise KeyRingError(f"Unsupported algorithm: {algorithm}. Available: {', '.join(ALGORITHMS)}")
+    private_key = ed25519.Ed25519PrivateKey.generate() if algorithm == 'EdDSA' else rsa.generate_private_key(65537, 2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    kid = time.strftime('%Y%m%d%H%M%S') + '-' + secrets.token_hex(4)
+    os.makedirs(path, exist_ok=True)
+    descriptor = os.open(os.path.join(path, kid + '.pem'), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, 'wb') as key_file:
+        key_file.write(pem)
+    return kid
+
+
+def activate_key(path, kid):
+    if not os.path.exists(os.path.join(path, kid + '.pem')):
+        raise KeyRingError(f"No key {kid} in {path}")
+    temporary = os.path.join(path, ACTIVE_FILE + '.tmp')
+    with open(temporary, 'w') as active_file:
+        active_file.write(kid)
+    os.replace(temporary, os.path.join(path, ACTIVE_FILE)) # Workers never read a half written file.
+
+
+def retire_key(path, kid):
+    ring = KeyRing(path)
+    ring.load()
+    if kid == ring.active:
+        raise KeyRingError(f"{kid} is the active key, activate another key first.")
+    if kid not in ring.keys:
+        raise KeyRingError(f"No key {kid} in {path}")
+    os.remove(os.path.join(path, kid + '.pem'))
+
+
+def _ring():
+    return current_app.extensions.get('jwt_key_ring')
+
+
+# JWTManager callbacks. The key ring is per application, apps without one keep the flask-jwt-extended defaults.
+def _headers(identity):
+    ring = _ring()
+    if ring is None:
+        return {}
+    g.jwt_signing_key = ring.signing_key(current_app.config['JWT_ALGORITHM']) # Header and signature use the same key even if the ring changes meanwhile.
+    return {'kid': g.jwt_signing_key.kid}
+
+
+def _encode_key(identity):
+    from flask_jwt_extended.config import config
+
+    ring = _ring()
+    if ring is None:
+        return config.encode_key
+    key = g.pop('jwt_signing_key', None) or ring.signing_key(current_app.config['JWT_ALGORITHM'])
+    return key.private_key
+
+
+def _decode_key(jwt_header, jwt_payload):
+    from flask_jwt_extended.config import config
+
+    ring = _ring()
+    if ring is None:
+        return config.decode_key
+    if jwt_header.get('alg') == 'HS256' and current_app.config.get('JWT_ACCEPT_HS256_TOKENS'):
+        return current_app.config['JWT_SECRET_KEY'] # Tokens issued before the switch to the key ring.
+    return ring.verification_key(jwt_header.get('kid'))
+
+
+def jwks_view():
+    response = jsonify(_ring().jwks())
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config['JWKS_MAX_AGE']}"
+    return response
+
+
+# Signs this app's tokens with the key ring.
+def use_key_ring(app, ring):
+    app.extensions['jwt_key_ring'] = ring
+    app.config['JWT_ALGORITHM'] = app.config['JWT_KEYS_ALGORITHM']
+    app.config['JWT_DECODE_ALGORITHMS'] = list(ALGORITHMS) + (['HS256'] if app.config.get('JWT_ACCEPT_HS256_TOKENS') else [])
+
+
+def init_jwt_keys(app):
+    from app.extensions import jwt
+
+    jwt.additional_headers_loader(_headers)
+    jwt.encode_key_loader(_encode_key)
+    jwt.decode_key_loader(_decode_key)
+
+    path = app.config.get('JWT_KEYS_PATH')
+    if path:
+        ring = KeyRing(path, app.config['JWT_KEYS_RELOAD_SECONDS'])
+        try:
+            ring.load()
+        except KeyRingError as e:
+            # Tokens cannot be issued until a key is generated, the app still starts so the command can be run.
+            app.logger.warning(str(e))
+        use_key_ring(app, ring)
+        app.add_url_rule('/.well-known/jwks.json', 'jwks', jwks_view)
+
+    @app.cli.group('jwt-keys')
+    def jwt_keys_command():
+        # Manage the keys signing the JWTs (JWT_KEYS_PATH).
+        if not app.config.get('JWT_KEYS_PATH'):
+            raise click.ClickException('JWT_KEYS_PATH is not set.')
+
+    @jwt_keys_command.command('generate')
+    @click.option('--algorithm', default=None, help='RS256 or EdDSA (JWT_KEYS_ALGORITHM by default)')
+    @click.option('--activate', is_flag=True, help='sign with the new key straight away')
+    def generate_command(algorithm, activate):
+        # Add a key to the ring, published on the JWKS but not signing until activated.
+        try:
+            kid = generate_key(app.config['JWT_KEYS_PATH'], algorithm or app.config['JWT_KEYS_ALGORITHM'])
+            if activate:
+                activate_key(app.config['JWT_KEYS_PATH'], kid)
+        except KeyRingError as e:
+            raise click.ClickException(str(e))
+        print(f"Generated key {kid}{' (active)' if activate else ''}.")
+
+    @jwt_keys_command.command('activate')
+    @click.argument('kid')
+    def activate_command(kid):
+        # Sign the new tokens with this key.
+        try:
+            activate_key(app.config['JWT_KEYS_PATH'], kid)
+        except KeyRingError as e:
+            raise click.ClickException(str(e))
+        print(f"Key {kid} now signs the new tokens.")
+
+    @jwt_keys_command.command('retire')
+    @click.argument('kid')
+    def retire_command(kid):
+        # Remove a key, the tokens it signed stop verifying.
+        try:
+            retire_key(app.config['JWT_KEYS_PATH'], kid)
+        except KeyRingError as e:
+            raise click.ClickException(str(e))
+        print(f"Key {kid} retired.")
+
+    @jwt_keys_command.command('list')
+    def list_command():
+        # Keys of the ring, the active one marked with a star.
+        try:
+            ring = KeyRing(app.config['JWT_KEYS_PATH'])
+            ring.load()
+        except KeyRingError as e:
+            raise click.ClickException(str(e))
+        for kid, key in sorted(ring.keys.items()):
+            print(f"{'*' if kid == ring.active else ' '} {kid} {key.algorithm}")
@@ -0,0 +1,230 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, send_file
+from werkzeug.security import safe_join
+
+# Content addressed storage for the gallery images.
+# Every file is saved under the sha256 hash of its bytes, e.g. media/ab/abcdef.../original.jpg,
+# so uploading the same picture twice only stores it once.
+
+# Size of the chunks read from the upload stream (1MB) so large files are never held in memory at once.
+CHUNK_SIZE = 1024 * 1024
+
+# Name given to the stored original inside its hash folder.
+ORIGINAL_NAME = 'original'
+
+# Extension of the stored original for each image format Pillow recognises.
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+# Background workers that generate the thumbnails and webp variants.
+_executor = None
+
+
+class MediaError(Exception):
+    # Raised when an upload cannot be stored (too large, wrong file type...).
+    pass
+
+
+def get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['MEDIA_WORKERS'], thread_name_prefix='media')
+    return _executor
+
+
+# Waits for the queued variant jobs, called when a worker process shuts down.
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+# Folder holding the original and all the variants of one image.
+def hash_dir(root, content_hash):
+    return os.path.join(root, content_hash[:2], content_hash)
+
+
+# Public url of a stored file, served by the gallery media route.
+def media_url(app, content_hash, filename):
+    return f"{app.config['MEDIA_URL_PREFIX']}/{content_hash}/{filename}"
+
+
+def find_original(root, content_hash):
+    folder = hash_dir(root, content_hash)
+    if not os.path.isdir(folder):
+        return None
+    for filename in os.listdir(folder):
+        if filename.startswith(ORIGINAL_NAME + '.'):
+            return os.path.join(folder, filename)
+    return None
+
+
+# Format of the image in path checked by Pillow, which reads the headers and the structure without decoding the pixels.
+# Returns the extension to store it under (the one of its real format, whatever the uploaded file name says).
+def image_extension(path, allowed):
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        raise MediaError('The file is not a valid image.')
+    extension = FORMAT_EXTENSIONS.get(image_format)
+    if extension is None or extension not in allowed:
+        raise MediaError('Unsupported image type.')
+    return extension
+
+
+# Streams an uploaded file (werkzeug FileStorage) to the store while hashing it.
+# Returns the content hash and the path of the stored original.
+def store_upload(app, file_storage):
+    root = app.config['MEDIA_ROOT']
+    max_bytes = app.config['MEDIA_MAX_BYTES']
+
+    filename = file_storage.filename or ''
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in app.config['MEDIA_ALLOWED_EXTENSIONS']:
+        raise MediaError('Unsupported image type.')
+
+    tmp_dir = os.path.join(root, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    # Writing to a temporary file first, the final name is only known once the whole file is hashed.
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise MediaError('Image is too large.')
+                digest.update(chunk)
+                tmp_file.write(chunk)
+
+        if size == 0:
+            raise MediaError('Uploaded image is empty.')
+
+        content_hash = digest.hexdigest()
+
+        # Same content already stored, the new copy is dropped (deduplication).
+        existing = find_original(root, content_hash)
+        if existing:
+            os.remove(tmp_path)
+            return content_hash, existing
+
+        # Only real images are stored and served, the name alone proves nothing.
+        extension = image_extension(tmp_path, app.config['MEDIA_ALLOWED_EXTENSIONS'])
+
+        folder = hash_dir(root, content_hash)
+        os.makedirs(folder, exist_ok=True)
+        original_path = os.path.join(folder, f"{ORIGINAL_NAME}.{extension}")
+        # os.replace is atomic, a reader never sees a half written original.
+        os.replace(tmp_path, original_path)
+        return content_hash, original_path
+
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Generates the resized webp variants of a stored original.
+# Returns a dictionary of variant name -> file name. Existing variants are reused.
+def build_variants(original_path, widths):
+    from PIL import Image, ImageOps
+
+    folder = os.path.dirname(original_path)
+    variants = {}
+
+    with Image.open(original_path) as image:
+        image = ImageOps.exif_transpose(image) # Respect the camera orientation.
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for width in widths:
+            name = f"w{width}"
+            filename = f"{name}.webp"
+            path = os.path.join(folder, filename)
+            variants[name] = filename
+
+            if os.path.exists(path):
+                continue
+
+            # Images are never upscaled, smaller originals keep their size.
+            resized = image.copy()
+            resized.thumbnail((width, width * 4))
+
+            # Saving through a unique temporary name so a half written variant is never served,
+            # even when two uploads of the same image are processed at the same time.
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as tmp_file:
+                resized.save(tmp_file, 'WEBP', quality=80, method=4)
+            os.replace(tmp_path, path)
+
+    return variants
+
+
+# Runs in the worker pool: builds the variants and records their urls on the gallery row.
+def process_gallery_image(app, gallery_id, content_hash, original_path):
+    from app.extensions import db
+    from app.models.gallery import Gallery
+
+    with app.app_context():
+        try:
+            files = build_variants(original_path, app.config['MEDIA_VARIANT_WIDTHS'])
+            variants = {name: media_url(app, content_hash, filename) for name, filename in files.items()}
+            variants['original'] = media_url(app, content_hash, os.path.basename(original_path))
+
+            gallery = db.session.get(Gallery, gallery_id)
+            if gallery is not None:
+                gallery.variants = variants
+                db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Generating variants for gallery %s failed: %s', gallery_id, e)
+
+        finally:
+            db.session.remove()
+
+
+def submit_variants(app, gallery_id, content_hash, original_path):
+    return get_executor(app).submit(process_gallery_image, app, gallery_id, content_hash, original_path)
+
+
+
+# Builds the response serving a stored file, or None when it is not in the store.
+# Range requests, If-None-Match and If-Range are answered by send_file (conditional=True) and the file body is
+# handed to the server's wsgi.file_wrapper, which uses sendfile() under gunicorn so the bytes never go through Python.
+def media_response(app, content_hash, filename):
+    folder = hash_dir(app.config['MEDIA_ROOT'], content_hash)
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+
+    # The hash identifies the bytes of the original, the variants are derived from it so the tag stays strong.
+    etag = content_hash if filename.startswith(ORIGINAL_NAME + '.') else f"{content_hash}-{filename}"
+    max_age = app.config['MEDIA_MAX_AGE']
+
+    accel_prefix = app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        # nginx streams the file from its internal location, the worker only sends the headers.
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{content_hash[:2]}/{content_hash}/{filename}"
+        response.set_etag(etag)
+    else:
+        response = send_file(path, conditional=True, etag=etag, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
@@ -10,10 +10,12 @@ class Booking(db.Model):
     total_unit_price = db.Column(db.Float, nullable=False)
     booking_date = db.Column(db.Date, nullable=False)
     booking_status = db.Column(db.String(20), default='confirmed' , nullable=False) # The booking may be confirmed (upcoming), cancelled, missed or completed.
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
-    service_id = db.Column(db.Integer, db.ForeignKey("services.id"))
-    user = db.relationship('User', backref="bookings")
-    service = db.relationship('Service', backref="bookings")
+    # Deleting a user deletes their bookings, deleting a service keeps its bookings as history without the service.
+    # The database applies the rules (passive_deletes), the bookings are not loaded to be deleted or updated one by one.
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    service_id = db.Column(db.Integer, db.ForeignKey("services.id", ondelete="SET NULL"), index=True)
+    user = db.relationship('User', backref=db.backref("bookings", passive_deletes=True))
+    service = db.relationship('Service', backref=db.backref("bookings", passive_deletes=True))
     created_at = db.Column(db.DateTime, default=datetime.now())
     updated_at = db.Column(db.DateTime, onupdate=datetime.now())
 
@@ -21,7 +23,7 @@ class Booking(db.Model):
         super(Booking, self).__init__()
         self.start_time = start_time
         self.end_time = end_time
-        self.total__unit_price = total_price
+        self.total_unit_price = total_price
         self.booking_date = booking_date
         self.booking_status = booking_status
         self.user_id = user_id
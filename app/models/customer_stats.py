@@ -0,0 +1,29 @@
+from app.extensions import db
+from datetime import datetime
+
+class CustomerStats(db.Model):
+    # Booking counters of one customer, kept up to date as bookings are created, change status or are deleted
+    # (see app/customer_stats.py). Only used when CUSTOMER_STATS_COUNTERS is on.
+    __tablename__ = "customer_stats"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    confirmed_count = db.Column(db.Integer, default=0, nullable=False)
+    cancelled_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    missed_count = db.Column(db.Integer, default=0, nullable=False)
+    bookings_total = db.Column(db.Integer, default=0, nullable=False) # Every booking, whatever its status.
+    total_spend = db.Column(db.Float, default=0.0, nullable=False) # Price of the bookings that were not cancelled.
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __init__(self, user_id):
+        super(CustomerStats, self).__init__()
+        self.user_id = user_id
+        self.confirmed_count = 0
+        self.cancelled_count = 0
+        self.completed_count = 0
+        self.missed_count = 0
+        self.bookings_total = 0
+        self.total_spend = 0.0
+
+    # Representation of the counters of a customer
+    def __repr__(self) -> str:
+         return f"Booking counters of user with id {self.user_id}."
@@ -6,17 +6,20 @@ class Gallery(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     image_url = db.Column(db.String(250), nullable=False)
     caption = (db.Column(db.String(250), nullable=True))
-    service_id = db.Column(db.Integer, db.ForeignKey('services.id'))
-    service = db.relationship("Service", backref="galleries") # To access the parent entity which is services.
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id', ondelete='CASCADE'), index=True) # The galleries go with their service.
+    service = db.relationship("Service", backref=db.backref("galleries", passive_deletes=True)) # To access the parent entity which is services.
+    content_hash = db.Column(db.String(64), nullable=True, index=True) # sha256 of the uploaded image in the media store.
+    variants = db.Column(db.JSON, nullable=True) # Urls of the resized/webp versions of the image, keyed by variant name.
     created_at = db.Column(db.DateTime, default=datetime.now())# Back ref from seervices to the child entity, gallery.
     updated_at = db.Column(db.DateTime, onupdate=datetime.now())
 
     # Constructoir for the gallery class to ensure that all new galleries have the necessary attributes.
-    def __init__(self, image_url, caption, service_id):
+    def __init__(self, image_url, caption, service_id, content_hash=None):
         super(Gallery, self).__init__()
         self.image_url = image_url
         self.caption = caption
         self.service_id = service_id
+        self.content_hash = content_hash
 
     # Defininfg how the object will be represented when called.
     def __repr__(self):
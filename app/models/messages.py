@@ -5,8 +5,9 @@ class Message(db.Model):
     # Customizing the table name.
     __tablename__ = "messages"
     id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The messages sent or received by a user are deleted with the user.
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
     time_stamp = db.Column(db.DateTime, default=datetime.now())
     edited_at = db.Column(db.DateTime, onupdate=datetime.now())
@@ -0,0 +1,33 @@
+from app.extensions import db
+from datetime import datetime
+
+class ServiceDailyStats(db.Model):
+    # Daily rollup of the bookings of one service, kept up to date on every booking write (see app/analytics.py).
+    # The analytics endpoints only read this table.
+    __tablename__ = "service_daily_stats"
+    service_id = db.Column(db.Integer, db.ForeignKey("services.id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True) # The booking date.
+    bookings_count = db.Column(db.Integer, default=0, nullable=False) # Every booking, whatever its status.
+    booked_hours = db.Column(db.Float, default=0.0, nullable=False) # Hours of the bookings that were not cancelled.
+    revenue = db.Column(db.Float, default=0.0, nullable=False) # total_unit_price of the bookings that were not cancelled.
+    cancelled_count = db.Column(db.Integer, default=0, nullable=False)
+    missed_count = db.Column(db.Integer, default=0, nullable=False)
+    completed_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (db.Index('ix_service_daily_stats_day', 'day'),)
+
+    def __init__(self, service_id, day):
+        super(ServiceDailyStats, self).__init__()
+        self.service_id = service_id
+        self.day = day
+        self.bookings_count = 0
+        self.booked_hours = 0.0
+        self.revenue = 0.0
+        self.cancelled_count = 0
+        self.missed_count = 0
+        self.completed_count = 0
+
+    # Representation of the rollup of a service for a day
+    def __repr__(self) -> str:
+         return f"Bookings of service with id {self.service_id} on {self.day}."
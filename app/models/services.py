@@ -11,6 +11,7 @@ class Service(db.Model):
     availability_status = db.Column(db.String(20), default="Available", nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now())
     updated_at = db.Column(db.DateTime, onupdate=datetime.now())
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True) # Set when the service is deleted, the row is purged in the background (app/soft_delete.py).
 
     def __init__(self, service_type, service_name, description, price_per_hour, availability_status):
         super(Service, self).__init__()
@@ -0,0 +1,25 @@
+from app.extensions import db
+from datetime import datetime
+
+class TokenRevocation(db.Model):
+    # A revoked token (jti set), or every token of a user issued up to revoked_at (jti empty, e.g. when the user is
+    # deleted or logs out everywhere). Read into memory by app/token_blocklist.py.
+    __tablename__ = "token_revocations"
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), nullable=True, index=True)
+    # No foreign key: the revocation has to outlive the user it revokes.
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.now, nullable=False, index=True) # The workers read the rows by it.
+    # When the revoked tokens expire by themselves, the row is no longer needed after that.
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+
+    def __init__(self, jti=None, user_id=None, expires_at=None):
+        super(TokenRevocation, self).__init__()
+        self.jti = jti
+        self.user_id = user_id
+        self.revoked_at = datetime.now()
+        self.expires_at = expires_at
+
+    # Representation of a revocation
+    def __repr__(self) -> str:
+         return f"Revocation of token {self.jti}." if self.jti else f"Revocation of the tokens of user {self.user_id}."
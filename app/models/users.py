@@ -13,6 +13,7 @@ class User(db.Model):
     email_preferences = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now())
     updated_at = db.Column(db.DateTime, onupdate=datetime.now())
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True) # Set when the user is deleted, the row is purged in the background (app/soft_delete.py).
 
     def __init__(self, name, email, phone, address, password, user_type):
         super(User, self).__init__()
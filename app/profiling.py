@@ -0,0 +1,142 @@
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from flask import current_app, g, request
+
+# Request profiler.
+# A profiled request is watched by a sampling thread that records the request thread's call stack every
+# PROFILE_INTERVAL seconds. The stacks are kept in the folded format ("outer;inner;leaf count") that flame graph
+# tools (flamegraph.pl, speedscope) read directly.
+# Requests are profiled at random (PROFILE_SAMPLE_RATE) or on demand when an admin sends the PROFILE_HEADER header.
+# When neither applies the hook returns straight away and the request runs without any profiler attached.
+# The header is only looked at with PROFILE_ON_DEMAND on, it then costs a token check and a user query.
+# The sampler watches the thread running the request hooks, which runs the view too (the views are synchronous and
+# gunicorn's sync and gthread workers run a request on one thread). Work handed to another thread, e.g. the media and
+# purge executors, only shows up as the request thread waiting for it.
+
+
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        return self.samples
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+
+class ProfileStore:
+    def __init__(self):
+        self.profiles = deque()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add(self, profile, limit):
+        with self.lock:
+            profile['id'] = next(self.ids)
+            self.profiles.appendleft(profile)
+            while len(self.profiles) > limit:
+                self.profiles.pop()
+        return profile['id']
+
+    def all(self):
+        with self.lock:
+            return list(self.profiles)
+
+    def get(self, profile_id):
+        with self.lock:
+            for profile in self.profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
+
+
+profile_store = ProfileStore()
+
+
+# Folded stacks text, one "stack count" line per distinct stack.
+def folded(profile):
+    return '\n'.join(f"{stack} {count}" for stack, count in sorted(profile['samples'].items())) + '\n'
+
+
+def _requested_by_admin():
+    from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+    from app.models.users import User
+
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return False
+    if identity is None:
+        return False
+    user = User.query.filter_by(id=identity).first()
+    return user is not None and user.user_type == 'admin'
+
+
+def _before_request():
+    config = current_app.config
+    on_demand = config['PROFILE_ON_DEMAND'] and config['PROFILE_HEADER'] in request.headers
+    if not on_demand and config['PROFILE_SAMPLE_RATE'] <= random.random():
+        return
+    if on_demand and not _requested_by_admin():
+        return
+
+    sampler = StackSampler(threading.get_ident(), config['PROFILE_INTERVAL'])
+    g.profiler = sampler
+    g.profile_started = time.perf_counter()
+    g.profile_started_at = datetime.now()
+    sampler.start()
+
+
+def _after_request(response):
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return response
+
+    samples = sampler.stop()
+    profile = {
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - g.profile_started) * 1000, 2),
+        'started_at': g.profile_started_at,
+        'interval_ms': current_app.config['PROFILE_INTERVAL'] * 1000,
+        'total_samples': sum(samples.values()),
+        'samples': dict(samples),
+    }
+    profile_id = profile_store.add(profile, current_app.config['PROFILE_MAX_STORED'])
+    response.headers['X-Profile-Id'] = str(profile_id)
+    return response
+
+
+def init_profiling(app):
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
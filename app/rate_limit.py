@@ -0,0 +1,302 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from flask import current_app, g, jsonify, request
+from app.instrumentation import registry
+from app.status_codes import HTTP_429_TOO_MANY_REQUESTS, HTTP_503_SERVICE_UNAVAILABLE
+
+# Rate limiting and concurrency caps.
+# Every limit is a token bucket: it holds up to <count> tokens, refills at <count> per <period> and each request
+# takes one token. Buckets live in memory (one set per worker process) or in a shared store (Redis,
+# RATE_LIMIT_STORAGE_URL) so all the workers of all the hosts share the same budget. Any object with a take() method
+# can be plugged in instead.
+# - login and register are checked against the bucket of the client IP and of the email/phone they name (@rate_limited),
+#   before the view runs, so a rejected request costs no bcrypt hash and no database query.
+# - every request is checked against the bucket of its client (the user of its access token, else its IP) for
+#   RATE_LIMIT_DEFAULT, and for the endpoints listed in RATE_LIMIT_ROUTES against a bucket of that endpoint too.
+# - the expensive endpoints of CONCURRENCY_LIMITS run at most N at a time per worker, and one client holds at most
+#   CONCURRENCY_PER_CLIENT of those slots, so a client looping over an export cannot take every slot. A request waits
+#   up to CONCURRENCY_QUEUE_TIMEOUT seconds for a slot, then gets a 503 with Retry-After.
+# Rejections are answered before the view (and its queries) runs, the other endpoints only pay for a bucket update.
+
+try:
+    import redis
+except ImportError: # redis is optional, the buckets are kept in memory without it.
+    redis = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+checks = registry.counter('rate_limit_checks_total', 'Rate limit checks by limit and result.', ('limit', 'result'))
+backend_errors = registry.counter('rate_limit_backend_errors_total', 'Rate limit checks the backend failed to answer.', ('limit',))
+concurrency_rejections = registry.counter('concurrency_rejections_total', 'Requests turned away by a concurrency cap.', ('endpoint', 'reason'))
+
+
+class Limit:
+    def __init__(self, count, period):
+        self.count = count # Bucket size (burst).
+        self.period = period
+        self.rate = count / period # Tokens added per second.
+
+    def __repr__(self):
+        return f"Limit({self.count}/{self.period}s)"
+
+
+# "10/minute", "5/second", "100/2 hours"...
+@lru_cache(maxsize=64)
+def parse_limit(text):
+    count, _, period = text.partition('/')
+    amount, _, unit = period.strip().partition(' ')
+    if not unit:
+        amount, unit = '1', amount
+    unit = unit.strip().rstrip('s')
+    if unit not in PERIODS:
+        raise ValueError(f"Invalid rate limit: {text}")
+    return Limit(int(count), float(amount) * PERIODS[unit])
+
+
+# Token bucket arithmetic shared by the backends: returns the tokens left and the seconds until the request fits.
+def refill(tokens, updated, now, limit, cost=1):
+    tokens = min(limit.count, tokens + max(now - updated, 0) * limit.rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / limit.rate
+
+
+class MemoryBackend:
+    # Buckets of one worker process, the least recently used ones are dropped past max_keys
+    # (a dropped bucket starts full again, which only ever lets a client in sooner).
+    def __init__(self, max_keys=100000):
+        self.buckets = OrderedDict()
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key, limit, cost=1):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (limit.count, now))
+            tokens, retry_after = refill(tokens, updated, now, limit, cost)
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return retry_after == 0, retry_after
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+# Same arithmetic as refill(), run inside Redis so concurrent workers update a bucket atomically.
+# The bucket expires once it would be full again, so idle clients do not keep keys around.
+TOKEN_BUCKET_SCRIPT = """
+local count = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or count
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(count, tokens + math.max(now - updated, 0) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((count - tokens) / rate * 1000) + 1000)
+return tostring(retry_after)
+"""
+
+
+class RedisBackend:
+    # Buckets shared by every worker through Redis.
+    def __init__(self, client, prefix='ratelimit:'):
+        self.prefix = prefix
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key, limit, cost=1):
+        retry_after = float(self.script(keys=[self.prefix + key], args=[limit.count, limit.rate, cost]))
+        return retry_after == 0, retry_after
+
+
+class RateLimiter:
+    def __init__(self):
+        self.backend = MemoryBackend()
+
+    def init_app(self, app, backend=None):
+        if backend is None:
+            url = app.config.get('RATE_LIMIT_STORAGE_URL')
+            if url:
+                if redis is None:
+                    raise RuntimeError('RATE_LIMIT_STORAGE_URL is set but the redis package is not installed.')
+                backend = RedisBackend(redis.Redis.from_url(url))
+            else:
+                backend = MemoryBackend(app.config['RATE_LIMIT_MAX_KEYS'])
+        self.backend = backend
+
+    # Takes a token from the bucket of key, returns (allowed, seconds to wait).
+    def hit(self, name, key, limit):
+        try:
+            allowed, retry_after = self.backend.take(f"{name}:{key}", limit)
+        except Exception as e:
+            # The limiter must not take the site down with it: a failing backend lets the request through.
+            backend_errors.inc(name)
+            current_app.logger.warning('Rate limit backend failed for %s: %s', name, e)
+            return True, 0.0
+        checks.inc(name, 'allowed' if allowed else 'rejected')
+        return allowed, retry_after
+
+
+limiter = RateLimiter()
+
+
+def client_ip():
+    # Behind a proxy, remote_addr is the client's address only with PROXY_FIX_X_FOR set (see config.py).
+    return request.remote_addr or 'unknown'
+
+
+# Key function reading a field of the JSON body (lower cased, so "A@x.com" and "a@x.com" share a bucket).
+def json_field(name):
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+        return str(value).strip().lower() if value else None
+    return key
+
+
+# Bucket key of the caller: the user of a valid access token, else the IP address.
+def client_key():
+    if 'rate_limit_client' in g:
+        return g.rate_limit_client
+    from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+    key = None
+    if request.headers.get('Authorization', '').startswith('Bearer '):
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+            key = f"user:{identity}" if identity is not None else None
+        except Exception: # Expired or invalid tokens are rejected by the view, they count against the IP meanwhile.
+            key = None
+    g.rate_limit_client = key or f"ip:{client_ip()}"
+    return g.rate_limit_client
+
+
+def too_many_requests(retry_after, status_code=HTTP_429_TOO_MANY_REQUESTS):
+    seconds = max(1, math.ceil(retry_after))
+    if status_code == HTTP_429_TOO_MANY_REQUESTS:
+        response = jsonify({'Error': f"Too many requests. Try again in {seconds} seconds."})
+    else:
+        response = jsonify({'Error': f"The server is busy. Try again in {seconds} seconds."})
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+
+class ConcurrencyLimiter:
+    # Requests running per endpoint and per (endpoint, client) in this worker process.
+    def __init__(self):
+        self.running = {}
+        self.condition = threading.Condition()
+
+    def acquire(self, endpoint, client, limit, per_client, timeout):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            if self.running.get((endpoint, client), 0) >= per_client:
+                return 'client' # The client already holds its share, it is not queued behind itself.
+            # Checked again after every wait: requests of one client queued together must not take every free slot.
+            while self.running.get(endpoint, 0) >= limit or self.running.get((endpoint, client), 0) >= per_client:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return 'busy' if self.running.get(endpoint, 0) >= limit else 'client'
+                self.condition.wait(remaining)
+            self.running[endpoint] = self.running.get(endpoint, 0) + 1
+            self.running[(endpoint, client)] = self.running.get((endpoint, client), 0) + 1
+        return None
+
+    def release(self, endpoint, client):
+        with self.condition:
+            for key in (endpoint, (endpoint, client)):
+                self.running[key] -= 1
+                if not self.running[key]:
+                    del self.running[key]
+            self.condition.notify_all() # The first waiter may be held back by its own client's share.
+
+    def lines(self):
+        with self.condition:
+            running = {key: count for key, count in self.running.items() if isinstance(key, str)}
+        lines = ['# HELP concurrency_running Requests running on the concurrency capped endpoints.',
+                 '# TYPE concurrency_running gauge']
+        return lines + [f'concurrency_running{{endpoint="{endpoint}"}} {count}' for endpoint, count in sorted(running.items())]
+
+
+concurrency = ConcurrencyLimiter()
+
+
+# Runs before every request: client quota, endpoint quota, then a slot on the capped endpoints.
+def _before_request():
+    config = current_app.config
+    endpoint = request.endpoint
+    if not config.get('RATE_LIMIT_ENABLED') or endpoint is None or endpoint in config['RATE_LIMIT_EXEMPT']:
+        return None
+
+    client = client_key()
+    allowed, retry_after = limiter.hit('client', client, parse_limit(config['RATE_LIMIT_DEFAULT']))
+    if not allowed:
+        return too_many_requests(retry_after)
+
+    route_limit = config['RATE_LIMIT_ROUTES'].get(endpoint)
+    if route_limit:
+        allowed, retry_after = limiter.hit(endpoint, client, parse_limit(route_limit))
+        if not allowed:
+            return too_many_requests(retry_after)
+
+    slots = config['CONCURRENCY_LIMITS'].get(endpoint)
+    if slots:
+        rejected = concurrency.acquire(endpoint, client, slots, config['CONCURRENCY_PER_CLIENT'],
+                                       config['CONCURRENCY_QUEUE_TIMEOUT'])
+        if rejected == 'client':
+            concurrency_rejections.inc(endpoint, rejected)
+            return too_many_requests(1)
+        if rejected == 'busy':
+            concurrency_rejections.inc(endpoint, rejected)
+            return too_many_requests(config['CONCURRENCY_QUEUE_TIMEOUT'], HTTP_503_SERVICE_UNAVAILABLE)
+        g.concurrency_slot = (endpoint, client)
+    return None
+
+
+# Runs when the request context ends, after a streamed response has been sent.
+def _release_slot(exception=None):
+    slot = g.pop('concurrency_slot', None)
+    if slot is not None:
+        concurrency.release(*slot)
+
+
+# Checks the request against every rule before the view runs. A rule is (name, config key of its limit, key function),
+# a rule whose key function returns None (e.g. no email in the body) is skipped.
+def rate_limited(*rules):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if config.get('RATE_LIMIT_ENABLED'):
+                for name, limit_key, key_function in rules:
+                    key = key_function()
+                    if key is None:
+                        continue
+                    allowed, retry_after = limiter.hit(name, key, parse_limit(config[limit_key]))
+                    if not allowed:
+                        return too_many_requests(retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_rate_limit(app, backend=None):
+    limiter.init_app(app, backend)
+    app.before_request(_before_request)
+    app.teardown_request(_release_slot)
+    registry.collector(concurrency.lines)
@@ -0,0 +1,187 @@
+from flask import request
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy.orm.interfaces import ONETOMANY
+
+# Serializers shared by the controllers.
+# A schema lists the fields of a model that go into a response. Each schema is compiled once into a plain function
+# building the dictionary ({'id': obj.id, 'username': obj.name, ...}), which avoids looking the fields up for every row.
+# Dates and times are left as objects, the JSON provider (app/json_provider.py) writes them in ISO format.
+#
+# Read endpoints accept two query parameters narrowing a schema (see fieldset()):
+#   ?fields=id,start_time,service.service_name  only these keys (dotted names pick the keys of a nested object)
+#   ?include=user,service                       nested objects to embed, ?include= with no value embeds none
+# The narrowed schema also gives the query options loading only the columns it needs (load_options()).
+
+
+# Narrowed schemas kept per schema, the combinations of valid names are limited but not every one is worth keeping.
+MAX_SELECTIONS = 256
+
+
+class FieldsetError(ValueError):
+    # Raised for an unknown name in ?fields= or ?include=.
+    pass
+
+
+class Nested:
+    # A related object (or list of objects with many=True) serialized with another schema.
+    def __init__(self, key, schema, attribute=None, many=False):
+        self.key = key
+        self.schema = schema
+        self.attribute = attribute or key
+        self.many = many
+
+
+class Schema:
+    def __init__(self, *fields):
+        # Fields are attribute names, (key, attribute) pairs when the response key differs, or Nested objects.
+        self.fields = []
+        for field in fields:
+            if isinstance(field, str):
+                field = (field, field)
+            self.fields.append(field)
+        self.serialize = self._compile()
+        self.selections = {}
+
+    def _compile(self):
+        namespace = {}
+        items = []
+        for index, field in enumerate(self.fields):
+            if isinstance(field, Nested):
+                key, attribute = field.key, field.attribute
+                namespace[f"_nested{index}"] = field.schema.serialize
+                if field.many:
+                    value = f"[_nested{index}(item) for item in obj.{attribute}]"
+                else:
+                    value = f"(None if (value := obj.{attribute}) is None else _nested{index}(value))"
+            else:
+                key, attribute = field
+                value = f"obj.{attribute}"
+            if not attribute.isidentifier():
+                raise ValueError(f"Invalid attribute name: {attribute!r}")
+            items.append(f"{key!r}: {value}")
+
+        source = "def serialize(obj):\n    return {" + ", ".join(items) + "}\n"
+        exec(compile(source, '<schema>', 'exec'), namespace)
+        return namespace['serialize']
+
+    def dump(self, obj):
+        return self.serialize(obj)
+
+    def dump_many(self, objs):
+        serialize = self.serialize
+        return [serialize(obj) for obj in objs]
+
+    # Schema keeping only some of the fields. None means no restriction, the id is always kept.
+    # With neither fields nor include every nested object is kept, otherwise only the ones named in either.
+    def select(self, fields=None, include=None):
+        if fields is None and include is None:
+            return self
+        cache_key = (None if fields is None else frozenset(fields), None if include is None else frozenset(include))
+        schema = self.selections.get(cache_key)
+        if schema is None:
+            schema = self._select(*cache_key)
+            if len(self.selections) < MAX_SELECTIONS:
+                self.selections[cache_key] = schema
+        return schema
+
+    def _select(self, fields, include):
+        nested = {field.key for field in self.fields if isinstance(field, Nested)}
+        plain = {field[0] for field in self.fields if not isinstance(field, Nested)}
+
+        for name in include or ():
+            if name not in nested:
+                raise FieldsetError(f"Unknown include: {name}")
+
+        top, inner = set(), {}
+        for name in fields or ():
+            key, dot, rest = name.partition('.')
+            if dot and key in nested:
+                inner.setdefault(key, set()).add(rest)
+            elif not dot and (key in plain or key in nested):
+                top.add(key)
+            else:
+                raise FieldsetError(f"Unknown field: {name}")
+
+        selected = []
+        for field in self.fields:
+            if isinstance(field, Nested):
+                if field.key in (include or ()) or field.key in top or field.key in inner:
+                    # "user" alone keeps the whole user, "user.email" only some of its keys.
+                    narrowed = field.schema.select(None if field.key in top else inner.get(field.key))
+                    selected.append(Nested(field.key, narrowed, field.attribute, field.many))
+            elif fields is None or field[0] in top or field[0] == 'id':
+                selected.append(field)
+        return Schema(*selected)
+
+    # Query options loading the columns of the schema and its nested objects, and nothing else.
+    # Many to one objects are joined in the same query, lists are loaded with one extra query (selectinload).
+    def load_options(self, model, path=()):
+        mapper = sa_inspect(model)
+        columns = set()
+        options = []
+        for field in self.fields:
+            if isinstance(field, Nested):
+                relationship = mapper.relationships[field.attribute]
+                # Foreign keys on this side are needed to match the related rows.
+                columns.update(mapper.get_property_by_column(column).key for column in relationship.local_columns)
+                strategy = selectinload if field.many else joinedload
+                options.extend(field.schema.load_options(relationship.mapper.class_,
+                                                         path + ((strategy, getattr(model, field.attribute)),)))
+            elif field[1] in mapper.column_attrs:
+                columns.add(field[1])
+
+        if path:
+            # The other end of a list (e.g. bookings.user_id) is needed to group the rows under their parent.
+            strategy, attribute = path[-1]
+            relationship = attribute.property
+            if relationship.direction is ONETOMANY:
+                columns.update(mapper.get_property_by_column(column).key for column in relationship.remote_side)
+
+        loader = None
+        for strategy, attribute in path:
+            loader = strategy(attribute) if loader is None else getattr(loader, strategy.__name__)(attribute)
+        only = [getattr(model, column) for column in sorted(columns)]
+        options.insert(0, load_only(*only) if loader is None else loader.load_only(*only))
+        return options
+
+
+def _names(value):
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+# The schema narrowed by the ?fields= and ?include= parameters of the current request.
+def fieldset(schema):
+    return schema.select(_names(request.args.get('fields')), _names(request.args.get('include')))
+
+
+service_schema = Schema('id', 'service_type', 'service_name', 'description', 'price_per_hour',
+                        'availability_status', 'created_at')
+
+user_schema = Schema('id', ('username', 'name'), 'email', 'phone', 'user_type', 'created_at')
+
+booking_schema = Schema('id', 'start_time', 'end_time', 'total_unit_price', 'booking_status',
+                        Nested('user', user_schema), Nested('service', service_schema), 'created_at')
+
+# Bookings of one user, the user is already known.
+user_booking_schema = Schema('id', 'start_time', 'end_time', 'total_unit_price', 'booking_status',
+                             Nested('service', service_schema), 'created_at')
+
+# Bookings listed under a customer.
+customer_booking_schema = Schema('id', 'booking_status', ('amount', 'total_unit_price'), 'booking_date',
+                                 'start_time', 'end_time', 'user_id', 'service_id')
+
+customer_schema = Schema('id', ('customername', 'name'), 'email', 'phone', 'address', 'created_at',
+                         Nested('bookings', customer_booking_schema, many=True))
+
+message_schema = Schema('id', 'sender_id', 'recipient_id', 'content', ('timestamp', 'time_stamp'))
+
+gallery_schema = Schema('image_url', 'caption', 'service_id', 'variants', 'created_at')
+
+feedback_schema = Schema('id', 'name', 'phone_number', 'email', 'message', 'created_at')
+
+# A single user with the bookings they made.
+user_detail_schema = Schema('id', ('username', 'name'), 'email', 'phone', 'user_type', 'created_at',
+                            Nested('bookings', customer_booking_schema, many=True))
@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import click
+from flask import current_app
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.orm import with_loader_criteria
+from app.db_routing import RoutingSession
+
+# Soft deletes of users and services.
+# Deleting a user or a service only sets its deleted_at, so the request does one UPDATE whatever the number of
+# bookings, messages or galleries it has. Every ORM query leaves the soft deleted rows out (a loader criteria added to
+# each SELECT), run a query with .execution_options(include_deleted=True) to see them.
+# The rows depending on them are then removed by a background job in batches of PURGE_BATCH_SIZE, one transaction per
+# batch, so no statement locks a large range of bookings:
+# - user: bookings (deleted through the ORM so the customer counters and the analytics rollups follow), messages sent
+#   or received, then the user row (its customer counters go with it, ON DELETE CASCADE),
+# - service: galleries, the service is taken off its bookings (service_id set to NULL, the bookings stay as history),
+#   then the service row (its daily rollups go with it).
+# The ON DELETE rules of the foreign keys would remove all of it with the parent row, the batches only keep each
+# transaction short.
+# "flask purge-deleted" runs the same job, e.g. from cron, for anything a stopped worker left behind.
+
+# Background worker running the purges one at a time.
+_executor = None
+
+# Loader criteria of the soft deleted models, built on first use.
+_criteria = None
+
+
+def _not_deleted():
+    global _criteria
+    if _criteria is None:
+        from app.models.users import User
+        from app.models.services import Service
+
+        _criteria = tuple(with_loader_criteria(model, lambda cls: cls.deleted_at.is_(None), include_aliases=True)
+                          for model in (User, Service))
+    return _criteria
+
+
+# Runs before every ORM statement: SELECTs of users and services skip the soft deleted rows.
+def _filter_deleted(execute_state):
+    if not execute_state.is_select or execute_state.execution_options.get('include_deleted', False):
+        return
+    execute_state.statement = execute_state.statement.options(*_not_deleted())
+
+
+# Marks a user or a service as deleted. The caller commits, then calls submit_purge().
+def soft_delete(instance):
+    instance.deleted_at = datetime.now()
+
+
+def _delete_in_batches(session, model, condition, batch_size):
+    deleted = 0
+    while True:
+        ids = session.scalars(select(model.id).where(condition).limit(batch_size)).all()
+        if not ids:
+            return deleted
+        session.execute(delete(model).where(model.id.in_(ids)))
+        session.commit()
+        deleted += len(ids)
+
+
+def _purge_user(session, user_id, batch_size):
+    from app.models.bookings import Booking
+    from app.models.messages import Message
+    from app.models.users import User
+
+    counts = {'bookings': 0}
+    while True:
+        # Through the ORM: the before_flush listeners take the bookings off the counters and the rollups.
+        bookings = session.scalars(select(Booking).where(Booking.user_id == user_id).limit(batch_size)).all()
+        if not bookings:
+            break
+        for booking in bookings:
+            session.delete(booking)
+        session.commit()
+        counts['bookings'] += len(bookings)
+
+    counts['messages'] = _delete_in_batches(session, Message, (Message.sender_id == user_id) | (Message.recipient_id == user_id), batch_size)
+    session.execute(delete(User).where(User.id == user_id))
+    session.commit()
+    return counts
+
+
+def _purge_service(session, service_id, batch_size):
+    from app.models.bookings import Booking
+    from app.models.gallery import Gallery
+    from app.models.services import Service
+
+    counts = {'galleries': _delete_in_batches(session, Gallery, Gallery.service_id == service_id, batch_size), 'bookings': 0}
+    while True:
+        ids = session.scalars(select(Booking.id).where(Booking.service_id == service_id).limit(batch_size)).all()
+        if not ids:
+            break
+        session.execute(update(Booking).where(Booking.id.in_(ids)).values(service_id=None))
+        session.commit()
+        counts['bookings'] += len(ids)
+
+    session.execute(delete(Service).where(Service.id == service_id))
+    session.commit()
+    return counts
+
+
+# Removes every soft deleted user and service with the rows depending on them. Returns what was removed.
+def purge_deleted(batch_size=500):
+    from app.extensions import db
+    from app.models.users import User
+    from app.models.services import Service
+
+    session = db.session
+    purged = {'users': 0, 'services': 0, 'bookings': 0, 'messages': 0, 'galleries': 0}
+    deleted = select(User.id).where(User.deleted_at.isnot(None)).execution_options(include_deleted=True)
+    for user_id in session.scalars(deleted).all():
+        for name, count in _purge_user(session, user_id, batch_size).items():
+            purged[name] += count
+        purged['users'] += 1
+
+    deleted = select(Service.id).where(Service.deleted_at.isnot(None)).execution_options(include_deleted=True)
+    for service_id in session.scalars(deleted).all():
+        for name, count in _purge_service(session, service_id, batch_size).items():
+            purged[name] += count
+        purged['services'] += 1
+    return purged
+
+
+def _run_purge(app):
+    from app.extensions import db
+
+    with app.app_context():
+        try:
+            purged = purge_deleted(app.config['PURGE_BATCH_SIZE'])
+            app.logger.info('Purged soft deleted rows: %s', purged)
+            return purged
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Purging the soft deleted rows failed: %s', e)
+        finally:
+            db.session.remove()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+    return _executor
+
+
+# Queues the purge after a soft delete has been committed.
+def submit_purge(app=None):
+    app = app or current_app._get_current_object()
+    if not app.config.get('PURGE_IN_BACKGROUND'):
+        return None
+    return get_executor().submit(_run_purge, app)
+
+
+# Waits for the queued purge, called when a worker process shuts down.
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def init_soft_delete(app):
+    if not event.contains(RoutingSession, 'do_orm_execute', _filter_deleted):
+        event.listen(RoutingSession, 'do_orm_execute', _filter_deleted)
+
+    @app.cli.command('purge-deleted')
+    @click.option('--batch-size', type=int, default=None, help='rows removed per transaction')
+    def purge_deleted_command(batch_size):
+        # Remove the soft deleted users and services with their bookings, messages and galleries.
+        purged = purge_deleted(batch_size or app.config['PURGE_BATCH_SIZE'])
+        print(', '.join(f"{count} {name}" for name, count in purged.items()) + ' purged.')
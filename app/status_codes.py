@@ -5,4 +5,8 @@ HTTP_400_BAD_REQUEST = 400
 HTTP_401_UNAUTHORIZED = 401
 HTTP_404_NOT_FOUND = 404
 HTTP_409_CONFLICT = 409
-HTTP_500_INTERNAL_SERVER_ERROR = 500
\ No newline at end of file
+HTTP_413_REQUEST_ENTITY_TOO_LARGE = 413
+HTTP_422_UNPROCESSABLE_ENTITY = 422
+HTTP_429_TOO_MANY_REQUESTS = 429
+HTTP_500_INTERNAL_SERVER_ERROR = 500
+HTTP_503_SERVICE_UNAVAILABLE = 503
\ No newline at end of file
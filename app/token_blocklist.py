@@ -0,0 +1,194 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from app.db_routing import RoutingSession
+from app.instrumentation import registry
+
+# Revoked JWTs.
+# Revocations are stored in the token_revocations table: one row per revoked token (logout), or one row revoking every
+# token of a user issued up to that moment (log out everywhere, deleted user). Each worker keeps them in memory (a set
+# of jtis and a cutoff per user) and checks every token against those, so a protected request does not query the
+# database. Every JWT_BLOCKLIST_SYNC_SECONDS the worker reads the rows added since its last read, which is how a
+# revocation made on another worker or host reaches it. That read runs on a thread of its own: the request that finds it
+# due does not wait for it (only the first load of the worker is waited for) and does not count its query.
+# Revocations made by this worker apply as soon as they are committed.
+# Ids and revoked_at times are not committed in order (a transaction can commit after a later row was read), so each
+# read goes back JWT_BLOCKLIST_SYNC_OVERLAP seconds before the newest revocation seen, and every
+# JWT_BLOCKLIST_RELOAD_SECONDS all the unexpired revocations are read again. Rows read twice change nothing.
+# Rows are useless once the tokens they revoke have expired, "flask purge-token-revocations" deletes them.
+
+rejected_tokens = registry.counter('jwt_revoked_rejections_total', 'Requests refused because their token was revoked.', ('type',))
+
+
+def _epoch(value):
+    return value.timestamp() if value is not None else None
+
+
+class Blocklist:
+    def __init__(self):
+        self.jtis = {} # jti -> expiry (epoch seconds)
+        self.users = {} # user id -> (tokens issued up to this time are revoked, expiry)
+        self.newest = None # revoked_at of the newest revocation read
+        self.synced = None
+        self.reloaded = None
+        self.thread = None # Background sync, see sync_in_background.
+        self.lock = threading.Lock() # Guards the changes to jtis and users.
+        self.sync_lock = threading.Lock() # One sync at a time.
+
+    def clear(self):
+        with self.lock:
+            self.jtis, self.users, self.newest, self.synced, self.reloaded = {}, {}, None, None, None
+
+    def add(self, jti, user_id, revoked_at, expires_at):
+        with self.lock:
+            self._add(jti, user_id, revoked_at, expires_at)
+
+    def _add(self, jti, user_id, revoked_at, expires_at):
+        if jti:
+            self.jtis[jti] = expires_at
+        elif user_id is not None:
+            cutoff = max(revoked_at, self.users.get(str(user_id), (0, None))[0])
+            self.users[str(user_id)] = (cutoff, expires_at)
+
+    def is_revoked(self, payload):
+        if payload.get('jti') in self.jtis:
+            return True
+        revoked = self.users.get(str(payload.get('sub')))
+        # iat is in whole seconds: a token issued in the second of the revocation (e.g. the login right after a logout
+        # everywhere) is kept.
+        return revoked is not None and payload.get('iat', 0) < revoked[0]
+
+    # Called with the lock held.
+    def _drop_expired(self, now):
+        self.jtis = {jti: expiry for jti, expiry in self.jtis.items() if expiry is None or expiry > now}
+        self.users = {user: revoked for user, revoked in self.users.items() if revoked[1] is None or revoked[1] > now}
+
+    # Reads the revocations added since the last sync (with an overlap), at most once every interval seconds, and
+    # all of them every reload_interval seconds.
+    def sync(self, session, interval, overlap=60, reload_interval=300):
+        now = time.monotonic()
+        if self.synced is not None and now - self.synced < interval:
+            return
+        if not self.sync_lock.acquire(blocking=False):
+            return # Another thread is syncing.
+        try:
+            from app.models.token_revocations import TokenRevocation
+
+            rows = session.query(TokenRevocation.jti, TokenRevocation.user_id, TokenRevocation.revoked_at,
+                                 TokenRevocation.expires_at)
+            reload = self.reloaded is None or self.newest is None or now - self.reloaded >= reload_interval
+            if reload:
+                rows = rows.filter(TokenRevocation.expires_at.is_(None) | (TokenRevocation.expires_at > datetime.now()))
+            else:
+                rows = rows.filter(TokenRevocation.revoked_at >= self.newest - timedelta(seconds=overlap))
+            rows = rows.all() # Read before taking the lock, the logouts of this worker do not wait for the database.
+
+            with self.lock:
+                for jti, user_id, revoked_at, expires_at in rows:
+                    self._add(jti, user_id, int(revoked_at.timestamp()), _epoch(expires_at))
+                    self.newest = max(self.newest, revoked_at) if self.newest is not None else revoked_at
+                self._drop_expired(time.time())
+            self.synced = now
+            if reload:
+                self.reloaded = now
+        finally:
+            self.sync_lock.release()
+
+    def _sync_app(self, app, interval, overlap, reload_interval):
+        from app.extensions import db
+
+        with app.app_context():
+            try:
+                self.sync(db.session, interval, overlap, reload_interval)
+            except Exception as e:
+                app.logger.warning('Token blocklist sync failed, using the revocations already loaded: %s', e)
+            finally:
+                db.session.remove()
+
+    # Starts a sync on a background thread when one is due. Waits for it only while nothing has been loaded yet.
+    def sync_in_background(self, app, interval, overlap=60, reload_interval=300):
+        if self.synced is not None and time.monotonic() - self.synced < interval:
+            return
+        with self.lock:
+            thread = self.thread
+            if thread is None or not thread.is_alive():
+                thread = self.thread = threading.Thread(target=self._sync_app, args=(app, interval, overlap, reload_interval),
+                                                        name='jwt-blocklist', daemon=True)
+                thread.start()
+        if self.reloaded is None:
+            thread.join()
+
+
+blocklist = Blocklist()
+
+
+def _check_token(jwt_header, jwt_payload):
+    if not current_app.config.get('JWT_BLOCKLIST_ENABLED'):
+        return False
+    config = current_app.config
+    blocklist.sync_in_background(current_app._get_current_object(), config['JWT_BLOCKLIST_SYNC_SECONDS'],
+                                 config['JWT_BLOCKLIST_SYNC_OVERLAP'], config['JWT_BLOCKLIST_RELOAD_SECONDS'])
+    if blocklist.is_revoked(jwt_payload):
+        rejected_tokens.inc(jwt_payload.get('type', 'access'))
+        return True
+    return False
+
+
+# Revocations of the session's transaction, added to the blocklist once it commits (forgotten on a rollback).
+PENDING_KEY = 'token_revocations'
+
+def _apply_revocations(session):
+    for revocation in session.info.pop(PENDING_KEY, ()):
+        blocklist.add(*revocation)
+
+def _forget_revocations(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# Revokes one token (its decoded payload). The caller commits.
+def revoke_token(payload):
+    from app.extensions import db
+    from app.models.token_revocations import TokenRevocation
+
+    expires_at = datetime.fromtimestamp(payload['exp']) if payload.get('exp') else None
+    revocation = TokenRevocation(jti=payload['jti'], user_id=payload.get('sub'), expires_at=expires_at)
+    db.session.add(revocation)
+    db.session.info.setdefault(PENDING_KEY, []).append(
+        (revocation.jti, revocation.user_id, int(revocation.revoked_at.timestamp()), _epoch(expires_at)))
+    return revocation
+
+
+# Revokes every token of a user issued until now. The caller commits.
+def revoke_user_tokens(user_id):
+    from app.extensions import db
+    from app.models.token_revocations import TokenRevocation
+
+    # The longest lived token issued before now expires within the refresh token lifetime.
+    lifetime = current_app.config.get('JWT_REFRESH_TOKEN_EXPIRES')
+    expires_at = datetime.now() + lifetime if isinstance(lifetime, timedelta) else None
+    revocation = TokenRevocation(user_id=user_id, expires_at=expires_at)
+    db.session.add(revocation)
+    db.session.info.setdefault(PENDING_KEY, []).append(
+        (None, user_id, int(revocation.revoked_at.timestamp()), _epoch(expires_at)))
+    return revocation
+
+
+def init_token_blocklist(app):
+    from app.extensions import jwt
+
+    jwt.token_in_blocklist_loader(_check_token)
+    if not event.contains(RoutingSession, 'after_commit', _apply_revocations):
+        event.listen(RoutingSession, 'after_commit', _apply_revocations)
+        event.listen(RoutingSession, 'after_rollback', _forget_revocations)
+
+    @app.cli.command('purge-token-revocations')
+    def purge_token_revocations_command():
+        # Delete the revocations of tokens that have expired anyway.
+        from app.extensions import db
+        from app.models.token_revocations import TokenRevocation
+
+        count = TokenRevocation.query.filter(TokenRevocation.expires_at < datetime.now()).delete()
+        db.session.commit()
+        print(f"Deleted {count} expired token revocations.")
@@ -0,0 +1,256 @@
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+import bcrypt
+import click
+import validators
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app.instrumentation import registry
+
+# Bulk user import, e.g. the existing customers of a partner hotel.
+# The rows (csv with a header line, or ndjson: one JSON object per line) are read IMPORT_CHUNK_SIZE at a time. For each
+# chunk:
+# - every row is checked with the rules of /api/register,
+# - the emails and phones are looked up in two queries for the whole chunk (plus the ones already seen in the file),
+#   instead of two queries per user,
+# - the passwords are hashed by a pool of IMPORT_HASH_WORKERS processes, so the bcrypt work uses every core ("flask
+#   import-users" only, an upload is hashed in the request's worker and capped at IMPORT_MAX_ROWS users),
+# - the users are inserted in one multi row INSERT and committed.
+# A row that fails is reported with its number (1 for the first user) and the reason, the other rows are imported.
+# Columns: name, email, phone, address, password, user_type ("customer" when left out).
+
+FORMATS = ('csv', 'ndjson')
+REQUIRED = ('name', 'email', 'phone', 'password')
+
+import_rows = registry.counter('user_import_rows_total', 'Rows of the bulk user imports.', ('result',))
+
+
+class UserImportError(Exception):
+    # Raised for an import that cannot be read at all (unknown format, no header...).
+    pass
+
+
+def _hash_password(password, rounds, prefix, handle_long_passwords):
+    # Same hash as flask_bcrypt's generate_password_hash with the app's BCRYPT_* settings, run in the pool processes.
+    password = password.encode('utf-8')
+    if handle_long_passwords:
+        password = hashlib.sha256(password).hexdigest().encode('utf-8')
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds, prefix=prefix.encode('utf-8'))).decode('utf-8')
+
+
+# Rows of the file as (row number, dictionary or error message).
+def iter_rows(stream, file_format):
+    if file_format not in FORMATS:
+        raise UserImportError(f"Unsupported import format: {file_format}. Available: {', '.join(FORMATS)}")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='') if not isinstance(stream, io.TextIOBase) else stream
+
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames:
+            raise UserImportError('The csv file has no header line.')
+        for number, row in enumerate(reader, start=1):
+            yield number, row
+        return
+
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, 'Invalid JSON.'
+            continue
+        yield number, row if isinstance(row, dict) else 'Each line must be a JSON object.'
+
+
+def _clean(row):
+    if isinstance(row, str):
+        return None, row
+    user = {name: str(row.get(name) or '').strip() or None for name in REQUIRED + ('address', 'user_type')}
+    missing = [name for name in REQUIRED if not user[name]]
+    if missing:
+        return None, 'Missing ' + ', '.join(missing) + '.'
+    if len(user['password']) < 8:
+        return None, 'Password is too short.'
+    if not validators.email(user['email']):
+        return None, 'Invalid email address.'
+    user['user_type'] = user['user_type'] or 'customer'
+    return user, None
+
+
+class UserImport:
+    def __init__(self, app, session, chunk_size=1000, workers=0):
+        self.app = app
+        self.session = session
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.emails = set() # Seen in the file so far, so a repeated email or phone is reported on its second row.
+        self.phones = set()
+        self.imported = 0
+        self.errors = []
+
+    def _fail(self, number, user, message):
+        self.errors.append({'row': number, 'email': user.get('email') if isinstance(user, dict) else None, 'Error': message})
+
+    # Emails and phones of the chunk already in the users table, soft deleted users included, in one query each.
+    def _taken(self, users):
+        from app.models.users import User
+
+        emails = {user['email'] for user in users}
+        phones = {user['phone'] for user in users}
+        taken_emails = set(self.session.scalars(select(User.email).where(User.email.in_(emails))
+                                                .execution_options(include_deleted=True)))
+        taken_phones = set(self.session.scalars(select(User.phone).where(User.phone.in_(phones))
+                                                .execution_options(include_deleted=True)))
+        return taken_emails, taken_phones
+
+    def _check(self, chunk):
+        valid = []
+        for number, row in chunk:
+            user, error = _clean(row)
+            if error:
+                self._fail(number, row, error)
+            elif user['email'] in self.emails:
+                self._fail(number, user, 'Email is repeated in the file.')
+            elif user['phone'] in self.phones:
+                self._fail(number, user, 'Contact is repeated in the file.')
+            else:
+                self.emails.add(user['email'])
+                self.phones.add(user['phone'])
+                valid.append((number, user))
+        if not valid:
+            return valid
+
+        taken_emails, taken_phones = self._taken([user for number, user in valid])
+        kept = []
+        for number, user in valid:
+            if user['email'] in taken_emails:
+                self._fail(number, user, 'Email is already in use.')
+            elif user['phone'] in taken_phones:
+                self._fail(number, user, 'Contact is already in use.')
+            else:
+                kept.append((number, user))
+        return kept
+
+    def _insert(self, users):
+        from app.models.users import User
+
+        # Core insert on the table: one executemany whatever the optional columns each row fills in.
+        self.session.execute(insert(User.__table__), users)
+        self.session.commit()
+
+    def _import_chunk(self, chunk, hash_passwords):
+        valid = self._check(chunk)
+        if not valid:
+            return
+        hashes = hash_passwords([user['password'] for number, user in valid])
+        now = datetime.now()
+        users = [dict(user, password=hashed, created_at=now) for (number, user), hashed in zip(valid, hashes)]
+        try:
+            self._insert(users)
+        except IntegrityError:
+            # Users registered while the chunk was hashed: those rows are reported, the others inserted.
+            self.session.rollback()
+            taken_emails, taken_phones = self._taken(users)
+            kept = []
+            for (number, user), row in zip(valid, users):
+                if user['email'] in taken_emails or user['phone'] in taken_phones:
+                    self._fail(number, user, 'Email or contact is already in use.')
+                else:
+                    kept.append((number, user, row))
+            users = [row for number, user, row in kept]
+            try:
+                if users:
+                    self._insert(users)
+            except IntegrityError:
+                # Another registration raced the retry too: the rest of the chunk is reported instead of lost.
+                self.session.rollback()
+                for number, user, row in kept:
+                    self._fail(number, user, 'Email or contact is already in use.')
+                users = []
+        self.imported += len(users)
+
+    def run(self, rows, max_rows=None):
+        config = self.app.config
+        hash_password = partial(_hash_password, rounds=config.get('BCRYPT_LOG_ROUNDS', 12),
+                                prefix=config.get('BCRYPT_HASH_PREFIX', '2b'),
+                                handle_long_passwords=config.get('BCRYPT_HANDLE_LONG_PASSWORDS', False))
+        # spawn: the pool processes start clean instead of sharing the worker's database connections and threads.
+        pool = (ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                if self.workers > 1 else None)
+
+        def hash_passwords(passwords):
+            if pool is None:
+                return [hash_password(password) for password in passwords]
+            return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (self.workers * 4))))
+
+        try:
+            chunk = []
+            for number, row in rows:
+                if max_rows is not None and number > max_rows:
+                    self._fail(number, row, f"Only {max_rows} users can be imported at a time, the rest of the file was skipped.")
+                    break
+                chunk.append((number, row))
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(chunk, hash_passwords)
+                    chunk = []
+            if chunk:
+                self._import_chunk(chunk, hash_passwords)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        import_rows.inc('imported', amount=self.imported)
+        import_rows.inc('failed', amount=len(self.errors))
+        return self.report()
+
+    def report(self):
+        return {'imported': self.imported, 'failed': len(self.errors), 'errors': self.errors}
+
+
+# Format of an upload, from the file name or the content type when not given.
+def guess_format(filename=None, content_type=None):
+    filename = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+
+# workers: processes hashing the passwords, IMPORT_HASH_WORKERS when left out (0 hashes in the caller).
+def import_users(stream, file_format, max_rows=None, app=None, workers=None):
+    from flask import current_app
+    from app.extensions import db
+
+    app = app or current_app._get_current_object()
+    workers = app.config['IMPORT_HASH_WORKERS'] if workers is None else workers
+    importer = UserImport(app, db.session, app.config['IMPORT_CHUNK_SIZE'], workers)
+    return importer.run(iter_rows(stream, file_format), max_rows)
+
+
+def init_user_import(app):
+    @app.cli.command('import-users')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', default=None, help='csv or ndjson (from the file name by default)')
+    @click.option('--report', default=None, help='write the rows that failed to this JSON file')
+    def import_users_command(path, file_format, report):
+        # Import users from a csv or ndjson file and print how many were imported and which rows failed.
+        with open(path, 'rb') as import_file:
+            try:
+                result = import_users(import_file, file_format or guess_format(path), app=app)
+            except UserImportError as e:
+                raise click.ClickException(str(e))
+        if report:
+            with open(report, 'w') as report_file:
+                json.dump(result['errors'], report_file, indent=2)
+        print(f"{result['imported']} users imported, {result['failed']} rows failed.")
+        for error in result['errors'][:20]:
+            print(f"  row {error['row']}: {error['Error']}")
@@ -0,0 +1,89 @@
+# Shared helpers for the benchmark scripts.
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Seeded accounts (see seed.py), every seeded user has the same password.
+ADMIN_EMAIL = 'admin@bench.test'
+PASSWORD = 'benchpassword'
+
+
+def database_url(url=None):
+    # --database-url, then BENCH_DATABASE_URL, then a new SQLite file.
+    url = url or os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    return url
+
+
+def create_bench_app(url=None):
+    os.environ['TEST_DATABASE_URL'] = database_url(url)
+
+    from app import create_app
+
+    app = create_app('testing')
+    # Tokens are issued with an integer identity, newer flask-jwt-extended versions reject them unless this is off.
+    app.config['JWT_VERIFY_SUB'] = False
+    # Measuring the application, not the instrumentation.
+    app.config['METRICS_SAMPLE_RATE'] = 0
+    # Every benchmark request comes from the same client: the login/read limits and the concurrency caps would answer
+    # most of them with 429/503 instead of measuring the endpoints.
+    app.config['RATE_LIMIT_ENABLED'] = False
+    app.config['CONCURRENCY_LIMITS'] = {}
+    return app
+
+
+def login(client, email=ADMIN_EMAIL):
+    response = client.post('/api/login', json={'identifier': email, 'password': PASSWORD})
+    return {'Authorization': 'Bearer ' + response.get_json()['User']['access_token']}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Throughput and latency percentiles (milliseconds) of a list of durations in seconds.
+def summarize(name, latencies, elapsed, **extra):
+    result = {
+        'name': name,
+        'count': len(latencies),
+        'per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+    result.update(extra)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+# Prints every result as a JSON line and, with an output path, saves them with the commit they were measured on.
+def emit(suite, results, output=None):
+    for result in results:
+        print(json.dumps(result))
+    if output:
+        report = {
+            'suite': suite,
+            'commit': git_commit(),
+            'measured_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }
+        with open(output, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
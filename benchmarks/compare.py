@@ -0,0 +1,43 @@
+# Compares two benchmark reports written with --output (e.g. from two commits).
+#
+#   python benchmarks/compare.py before.json after.json
+#
+# Prints the change of throughput and of the p50/p99 latencies for every benchmark present in both reports.
+import argparse
+import json
+
+
+def load(path):
+    with open(path) as report_file:
+        report = json.load(report_file)
+    return report, {result['name']: result for result in report['results']}
+
+
+def change(before, after):
+    if not before:
+        return 'n/a'
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports.')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    before_report, before = load(args.before)
+    after_report, after = load(args.after)
+    print(f"{before_report.get('commit')} -> {after_report.get('commit')} ({after_report['suite']})")
+
+    for name in before:
+        if name not in after:
+            continue
+        row = [name]
+        for metric in ('per_second', 'requests_per_second', 'p50_ms', 'p99_ms'):
+            if metric in before[name] and metric in after[name]:
+                row.append(f"{metric} {before[name][metric]} -> {after[name][metric]} ({change(before[name][metric], after[name][metric])})")
+        print('  '.join(row))
+
+
+if __name__ == '__main__':
+    main()
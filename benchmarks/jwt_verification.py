@@ -0,0 +1,84 @@
+# Token verification benchmark: CPU spent per request on the JWT, with and without the verified token cache.
+#
+#   python benchmarks/jwt_verification.py --requests 20000 --output jwt_verification.json
+#
+# A request to a @jwt_required route verifies its token twice: once for the rate limiter (to key the client) and once
+# for the view. Both are run here for every simulated request, with the same token, as a client sending the token it
+# was given does. Measured for HS256 (JWT_SECRET_KEY) and, when cryptography is installed, for RS256 and EdDSA keys of
+# the key ring (app/jwt_keys.py).
+# <algorithm>_uncached: JWT_VERIFY_CACHE_SIZE = 0, every verification decodes and checks the signature.
+# <algorithm>_cached:   JWT_VERIFY_CACHE_SIZE = 10000, the claims come from the cache after the first request.
+import argparse
+import tempfile
+import time
+
+from common import create_bench_app, emit, summarize
+
+
+def run(name, app, token, requests):
+    from flask_jwt_extended import verify_jwt_in_request
+
+    headers = {'Authorization': 'Bearer ' + token}
+    latencies = []
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for _ in range(requests):
+        with app.test_request_context('/api/users/all', headers=headers):
+            began = time.perf_counter()
+            verify_jwt_in_request(optional=True) # Rate limiter.
+            verify_jwt_in_request() # @jwt_required()
+            latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return summarize(name, latencies, elapsed, cpu_us_per_request=round(cpu / requests * 1e6, 2))
+
+
+def variants(app):
+    # (algorithm, function switching the app to it)
+    from app.jwt_keys import KeyRing, activate_key, generate_key, serialization, use_key_ring
+
+    yield 'hs256', lambda: None
+    if serialization is None:
+        return
+    for algorithm in ('RS256', 'EdDSA'):
+        def switch(algorithm=algorithm):
+            path = tempfile.mkdtemp()
+            activate_key(path, generate_key(path, algorithm))
+            app.config['JWT_KEYS_ALGORITHM'] = algorithm
+            use_key_ring(app, KeyRing(path, app.config['JWT_KEYS_RELOAD_SECONDS']))
+        yield algorithm.lower(), switch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JWT verification CPU per request, with and without the cache.')
+    parser.add_argument('--requests', type=int, default=20000, help='simulated requests per variant')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    from flask_jwt_extended import create_access_token
+    from app.jwt_cache import VerifiedTokenCache
+    from app.extensions import db
+
+    app = create_bench_app()
+    with app.app_context():
+        db.create_all() # The revocations table read by the blocklist check.
+    results = []
+    for name, switch in variants(app):
+        switch()
+        with app.app_context():
+            token = create_access_token(identity=1)
+
+        app.extensions.pop('jwt_verify_cache', None)
+        uncached = run(f"{name}_uncached", app, token, args.requests)
+        app.extensions['jwt_verify_cache'] = VerifiedTokenCache(10000, 60)
+        cached = run(f"{name}_cached", app, token, args.requests)
+        app.extensions.pop('jwt_verify_cache')
+
+        # CPU saved per request by the cache.
+        cached['cpu_us_saved_per_request'] = round(uncached['cpu_us_per_request'] - cached['cpu_us_per_request'], 2)
+        results += [uncached, cached]
+    emit('jwt_verification', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# Load scenario: login -> list services -> create booking -> inbox, run by concurrent virtual users.
+#
+#   python benchmarks/load.py --scale 10000 --users 16 --iterations 20 --output load.json
+#   python benchmarks/load.py --base-url http://127.0.0.1:8000 --users 32 --iterations 50
+#
+# Without --base-url the requests go through the Flask test client in this process, with it they are sent over
+# HTTP to a running server (seed its database first with seed.py, and start it with RATE_LIMIT_ENABLED=false or most
+# logins are answered 429). Prints throughput, p50 and p99 per step.
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from common import PASSWORD, create_bench_app, emit, summarize
+from seed import seed
+
+STEPS = ['login', 'list_services', 'create_booking', 'inbox']
+
+# A booking refused because its slot is taken (409) is a valid answer, not an error.
+EXPECTED_STATUS = {'login': {200}, 'list_services': {200}, 'create_booking': {201, 409}, 'inbox': {200}}
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+def virtual_user(transport, user_number, iterations, services_count, latencies, errors, lock):
+    rnd = random.Random(user_number)
+    email = f"user{user_number}@bench.test"
+
+    for _ in range(iterations):
+        timings = {}
+
+        began = time.perf_counter()
+        status, body = transport.request('POST', '/api/login', {'identifier': email, 'password': PASSWORD})
+        timings['login'] = (time.perf_counter() - began, status)
+        if status != 200:
+            with lock:
+                errors['login'] += 1
+            continue
+        user_id = body['User']['id']
+        headers = {'Authorization': 'Bearer ' + body['User']['access_token']}
+
+        began = time.perf_counter()
+        status, _ = transport.request('GET', '/api/services/all', headers=headers)
+        timings['list_services'] = (time.perf_counter() - began, status)
+
+        start_hour = rnd.randint(6, 20)
+        booking = {
+            'service_name': f"Bench service {rnd.randrange(services_count)}",
+            'booking_date': (date.today() + timedelta(days=rnd.randint(1, 3650))).isoformat(),
+            'start_time': f"{start_hour:02d}:00",
+            'end_time': f"{start_hour + 1:02d}:00",
+        }
+        began = time.perf_counter()
+        status, _ = transport.request('POST', '/api/bookings/create', booking, headers=headers)
+        timings['create_booking'] = (time.perf_counter() - began, status)
+
+        began = time.perf_counter()
+        status, _ = transport.request('GET', f"/api/messages/inbox/{user_id}", headers=headers)
+        timings['inbox'] = (time.perf_counter() - began, status)
+
+        with lock:
+            for step, (elapsed, status) in timings.items():
+                latencies[step].append(elapsed)
+                if status not in EXPECTED_STATUS[step]:
+                    errors[step] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Booking flow load test.')
+    parser.add_argument('--base-url', help='send the requests to a running server instead of the test client')
+    parser.add_argument('--database-url')
+    parser.add_argument('--scale', type=int, default=10000, help='bookings seeded in a new database (test client only)')
+    parser.add_argument('--services', type=int, default=20)
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=10, help='scenario runs per virtual user')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.base_url:
+        transport = HttpTransport(args.base_url)
+    else:
+        app = create_bench_app(args.database_url)
+        seed(app, args.scale, services_count=args.services)
+        transport = TestClientTransport(app)
+
+    latencies = {step: [] for step in STEPS}
+    errors = {step: 0 for step in STEPS}
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        for user_number in range(1, args.users + 1):
+            executor.submit(virtual_user, transport, user_number, args.iterations, args.services, latencies, errors, lock)
+    elapsed = time.perf_counter() - start
+
+    results = [summarize(step, latencies[step], elapsed, errors=errors[step], concurrency=args.users) for step in STEPS]
+    total = sum(len(values) for values in latencies.values())
+    results.append({'name': 'scenario', 'requests': total, 'requests_per_second': round(total / elapsed, 1),
+                    'errors': sum(errors.values()), 'seconds': round(elapsed, 2)})
+    emit('load', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Micro-benchmarks for the hot pieces of the bookings endpoints.
+#
+#   python benchmarks/micro.py --scale 10000 --output micro.json
+#
+# serialize_bookings: building the getAllBookings dictionaries and encoding them as JSON (see serialization.py).
+# overlap_check: the overlapping booking query run by createBooking.
+import argparse
+import random
+import time
+from datetime import date, time as dtime, timedelta
+
+from common import create_bench_app, emit, summarize
+from seed import seed
+
+
+def bench_serialize(app, rows, repeat):
+    from sqlalchemy.orm import joinedload
+    from app.models.bookings import Booking
+    from app.serializers import booking_schema
+
+    with app.test_request_context():
+        bookings = Booking.query.options(joinedload(Booking.user), joinedload(Booking.service)).limit(rows).all()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            began = time.perf_counter()
+            app.json.dumps({'Bookings': booking_schema.dump_many(bookings)})
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+    return summarize('serialize_bookings', latencies, elapsed, rows=len(bookings))
+
+
+def bench_overlap(app, repeat):
+    from sqlalchemy import and_, or_
+    from app.models.bookings import Booking
+
+    rnd = random.Random(7)
+    today = date.today()
+    with app.app_context():
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            booking_date = today + timedelta(days=rnd.randint(-365, 365))
+            start_hour = rnd.randint(6, 20)
+            start_time, end_time = dtime(start_hour), dtime(start_hour + 1)
+            began = time.perf_counter()
+            Booking.query.filter(
+                Booking.booking_date == booking_date,
+                or_(
+                    and_(Booking.start_time < end_time, Booking.end_time > start_time)
+                )).first()
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+    return summarize('overlap_check', latencies, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serializer and overlap check micro-benchmarks.')
+    parser.add_argument('--database-url')
+    parser.add_argument('--scale', type=int, default=10000, help='bookings seeded in a new database')
+    parser.add_argument('--rows', type=int, default=5000, help='bookings serialized per iteration')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    seed(app, args.scale)
+
+    results = [
+        bench_serialize(app, args.rows, args.repeat),
+        bench_overlap(app, args.repeat * 50),
+    ]
+    emit('micro', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
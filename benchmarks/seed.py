@@ -0,0 +1,118 @@
+# Seeds a benchmark database with users, services, bookings, messages and galleries.
+#
+#   python benchmarks/seed.py --database-url sqlite:///bench.db --scale 100000
+#   python benchmarks/seed.py --database-url mysql+pymysql://root:@localhost/kask_bench --scale 1000000
+#
+# --scale is the number of bookings, the other tables grow with it (users = scale/10, messages = scale/2).
+# Rows are generated from a fixed random seed and inserted in chunks, so runs at the same scale are comparable.
+# The analytics rollups and the customer counters are rebuilt at the end, as "flask rebuild-analytics" would.
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from common import ADMIN_EMAIL, PASSWORD, create_bench_app
+
+CHUNK = 5000
+SERVICE_TYPES = ['Swimming pool', 'Grounds', 'Conference hall', 'Restaurant']
+STATUSES = ['confirmed', 'confirmed', 'completed', 'completed', 'cancelled', 'missed']
+
+
+# Inserts and commits CHUNK rows at a time: rows can be a generator, a million bookings are never held in memory or in
+# one transaction.
+def insert_chunks(db, table, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            db.session.execute(table.insert(), chunk)
+            db.session.commit()
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+
+
+def generate_bookings(rnd, scale, users_count, services_count, now):
+    today = date.today()
+    for i in range(scale):
+        start_hour = rnd.randint(6, 20)
+        service_id = rnd.randint(1, services_count)
+        yield {
+            'start_time': dtime(start_hour), 'end_time': dtime(start_hour + 1, rnd.choice([0, 30])),
+            'total_unit_price': float(10 + service_id), 'booking_date': today + timedelta(days=rnd.randint(-365, 365)),
+            'booking_status': rnd.choice(STATUSES), 'user_id': rnd.randint(1, users_count),
+            'service_id': service_id, 'created_at': now,
+        }
+
+
+def seed(app, scale, services_count=20, seed_value=42):
+    from app.extensions import db, bcrypt
+    from app.models.users import User
+    from app.models.services import Service
+    from app.models.bookings import Booking
+    from app.models.messages import Message
+    from app.models.gallery import Gallery
+    from app.analytics import rebuild_rollups
+    from app.customer_stats import rebuild_customer_stats
+
+    rnd = random.Random(seed_value)
+    now = datetime.now()
+    users_count = max(10, scale // 10)
+
+    with app.app_context():
+        db.create_all()
+        if User.query.filter_by(email=ADMIN_EMAIL).first() is not None:
+            return {'seeded': False}
+
+        # Hashing once, every seeded user shares the password.
+        password = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+
+        users = [{'name': 'Bench admin', 'email': ADMIN_EMAIL, 'phone': '0700000000', 'address': 'Kampala',
+                  'password': password, 'user_type': 'admin', 'email_preferences': False, 'created_at': now}]
+        users += [{'name': f"Customer {i}", 'email': f"user{i}@bench.test", 'phone': f"07{i:08d}",
+                   'address': 'Entebbe', 'password': password, 'user_type': 'customer',
+                   'email_preferences': False, 'created_at': now} for i in range(1, users_count)]
+        insert_chunks(db, User.__table__, users)
+
+        services = [{'service_type': SERVICE_TYPES[i % len(SERVICE_TYPES)], 'service_name': f"Bench service {i}",
+                     'description': 'Benchmark service with a reasonably long description text.',
+                     'price_per_hour': float(10 + i), 'availability_status': 'Available', 'created_at': now}
+                    for i in range(services_count)]
+        insert_chunks(db, Service.__table__, services)
+
+        insert_chunks(db, Booking.__table__, generate_bookings(rnd, scale, users_count, services_count, now))
+
+        messages = ({'sender_id': 1, 'recipient_id': rnd.randint(1, users_count),
+                     'content': f"Reminder {i}: your booking is coming up.", 'time_stamp': now}
+                    for i in range(scale // 2))
+        insert_chunks(db, Message.__table__, messages)
+
+        galleries = [{'image_url': f"https://example.com/gallery/{i}.jpg", 'caption': f"Picture {i}",
+                      'service_id': i % services_count + 1, 'created_at': now} for i in range(services_count * 5)]
+        insert_chunks(db, Gallery.__table__, galleries)
+
+        # The bookings were inserted on the table, past the session hooks keeping the rollups and counters up to date.
+        rebuild_rollups()
+        rebuild_customer_stats()
+
+    return {'seeded': True, 'users': users_count, 'services': services_count, 'bookings': scale,
+            'messages': scale // 2, 'galleries': services_count * 5}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a benchmark database.')
+    parser.add_argument('--database-url')
+    parser.add_argument('--scale', type=int, default=1000, help='number of bookings (1000 to 1000000)')
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    start = time.perf_counter()
+    counts = seed(app, args.scale)
+    counts['seconds'] = round(time.perf_counter() - start, 2)
+    counts['database_url'] = app.config['SQLALCHEMY_DATABASE_URI']
+    print(counts)
+
+
+if __name__ == '__main__':
+    main()
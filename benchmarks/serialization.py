@@ -0,0 +1,127 @@
+# Serialization benchmark: the getAllBookings payload built and encoded in three ways.
+#
+#   python benchmarks/serialization.py --rows 50000 --output serialization.json
+#
+# hand_built_default: dictionaries written out by hand (the controllers before app/serializers.py) encoded with
+#                     Flask's stock DefaultJSONProvider.
+# schema_iso_json:    compiled booking_schema encoded with IsoJSONProvider (standard library json module).
+# schema_orjson:      compiled booking_schema encoded with OrjsonProvider, skipped when orjson is not installed.
+#
+# The bookings are built in memory (no database), so only the serialization is measured.
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+from common import create_bench_app, emit, summarize
+
+
+def booking_to_dict(booking):
+    # The getAllBookings dictionary as it was written in the controller.
+    return {
+        "id":booking.id,
+        "start_time":booking.start_time.strftime('%H:%M'),
+        "end_time":booking.end_time.strftime('%H:%M'),
+        "total_unit_price":booking.total_unit_price,
+        "booking_status":booking.booking_status,
+        "user":{
+            'id':booking.user.id,
+            'username':booking.user.name,
+            'email':booking.user.email,
+            'phone':booking.user.phone,
+            'user_type':booking.user.user_type,
+            'created_at':booking.user.created_at
+        },
+        "service":{
+            'id':booking.service.id,
+            'service_type':booking.service.service_type,
+            'service_name':booking.service.service_name,
+            'description':booking.service.description,
+            'price_per_hour':booking.service.price_per_hour,
+            'availability_status':booking.service.availability_status,
+            'created_at':booking.service.created_at
+        },
+        "created_at":booking.created_at
+    }
+
+
+def make_bookings(rows):
+    from app.models.bookings import Booking
+    from app.models.services import Service
+    from app.models.users import User
+
+    rnd = random.Random(3)
+    now = datetime.now()
+    services = []
+    for index in range(20):
+        service = Service(f"type{index % 4}", f"Service {index}", 'Bench service', 10.0 + index, 'available')
+        service.id = index + 1
+        service.created_at = now
+        services.append(service)
+
+    users = []
+    for index in range(max(1, rows // 10)):
+        user = User(f"User {index}", f"user{index}@bench.test", '0700000000', 'Bench street', 'x', 'customer')
+        user.id = index + 1
+        user.created_at = now
+        users.append(user)
+
+    bookings = []
+    for index in range(rows):
+        start_hour = rnd.randint(6, 20)
+        user, service = rnd.choice(users), rnd.choice(services)
+        booking = Booking(dtime(start_hour), dtime(start_hour + 1), service.price_per_hour,
+                          date.today() + timedelta(days=rnd.randint(-365, 365)), 'confirmed', user.id, service.id)
+        booking.id = index + 1
+        booking.user = user
+        booking.service = service
+        booking.created_at = now
+        bookings.append(booking)
+    return bookings
+
+
+def run(name, build, provider, bookings, repeat):
+    latencies = []
+    size = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        began = time.perf_counter()
+        body = provider.dumps({'Bookings': build(bookings)})
+        latencies.append(time.perf_counter() - began)
+        size = len(body)
+    elapsed = time.perf_counter() - start
+    return summarize(name, latencies, elapsed, rows=len(bookings), bytes=size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hand built dictionaries vs compiled schemas and orjson.')
+    parser.add_argument('--rows', type=int, default=50000, help='bookings in the payload')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    from flask.json.provider import DefaultJSONProvider
+    from app.json_provider import IsoJSONProvider, OrjsonProvider, orjson
+    from app.serializers import booking_schema
+
+    app = create_bench_app()
+    with app.app_context():
+        bookings = make_bookings(args.rows)
+
+        hand_built = lambda rows: [booking_to_dict(booking) for booking in rows]
+        results = [
+            run('hand_built_default', hand_built, DefaultJSONProvider(app), bookings, args.repeat),
+            run('schema_iso_json', booking_schema.dump_many, IsoJSONProvider(app), bookings, args.repeat),
+        ]
+        if orjson is not None:
+            results.append(run('schema_orjson', booking_schema.dump_many, OrjsonProvider(app), bookings, args.repeat))
+
+    # Speedup of each variant over the hand built dictionaries (p50).
+    baseline = results[0]['p50_ms']
+    for result in results:
+        result['speedup'] = round(baseline / result['p50_ms'], 2) if result['p50_ms'] else None
+    emit('serialization', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
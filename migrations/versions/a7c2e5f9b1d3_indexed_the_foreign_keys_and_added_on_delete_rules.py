@@ -0,0 +1,48 @@
+"""Indexed the foreign keys and added their ON DELETE rules
+
+Revision ID: a7c2e5f9b1d3
+Revises: f3a9c7e1d2b4
+Create Date: 2026-10-19 20:03:27.114950
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e5f9b1d3'
+down_revision = 'f3a9c7e1d2b4'
+branch_labels = None
+depends_on = None
+
+# (table, constraint, column, referred table, ON DELETE, index created)
+# The constraints keep the names MySQL gave them when the tables were created.
+FOREIGN_KEYS = [
+    ('bookings', 'bookings_ibfk_1', 'service_id', 'services', 'SET NULL', True),
+    ('bookings', 'bookings_ibfk_2', 'user_id', 'users', 'CASCADE', True),
+    ('galleries', 'galleries_ibfk_1', 'service_id', 'services', 'CASCADE', True),
+    ('messages', 'messages_ibfk_1', 'recipient_id', 'users', 'CASCADE', True),
+    ('messages', 'messages_ibfk_2', 'sender_id', 'users', 'CASCADE', True),
+    # Primary keys already index these two.
+    ('customer_stats', 'customer_stats_ibfk_1', 'user_id', 'users', 'CASCADE', False),
+    ('service_daily_stats', 'service_daily_stats_ibfk_1', 'service_id', 'services', 'CASCADE', False),
+]
+
+
+def upgrade():
+    for table, constraint, column, referred, ondelete, indexed in FOREIGN_KEYS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            # The index first, MySQL does not let a foreign key go without one.
+            if indexed:
+                batch_op.create_index(batch_op.f(f"ix_{table}_{column}"), [column], unique=False)
+            batch_op.drop_constraint(op.f(constraint), type_='foreignkey')
+            batch_op.create_foreign_key(op.f(constraint), referred, [column], ['id'], ondelete=ondelete)
+
+
+def downgrade():
+    for table, constraint, column, referred, ondelete, indexed in reversed(FOREIGN_KEYS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(op.f(constraint), type_='foreignkey')
+            if indexed:
+                batch_op.drop_index(batch_op.f(f"ix_{table}_{column}"))
+            batch_op.create_foreign_key(op.f(constraint), referred, [column], ['id'])
@@ -2,5 +2,6 @@ from app import create_app
 
 app = create_app()
 
+# Development server only, production runs wsgi.py through gunicorn (gunicorn -c gunicorn.conf.py wsgi:app).
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=app.config.get('DEBUG', False))
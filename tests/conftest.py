@@ -0,0 +1,78 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from app import create_app
+from config import TestingConfig
+from app.extensions import db, bcrypt
+from app.models.users import User
+from app.models.services import Service
+from app.models.bookings import Booking
+
+pytest_plugins = ['query_budget']
+
+PASSWORD = 'password123'
+
+
+def seed():
+    password = bcrypt.generate_password_hash(PASSWORD)
+    db.session.add(User(name='Admin', email='admin@kask.test', phone='0700000000', address='Kampala',
+                        password=password, user_type='admin'))
+    services = [Service('Swimming pool', f"Pool {i}", 'Pool', 10.0 + i, 'Available') for i in range(3)]
+    db.session.add_all(services)
+
+    # Several customers with several bookings each, so a query per row would show in the query counts.
+    for i in range(5):
+        customer = User(name=f"Customer {i}", email=f"customer{i}@kask.test", phone=f"07100000{i:02d}",
+                        address='Entebbe', password=password, user_type='customer')
+        db.session.add(customer)
+        db.session.flush()
+        for j in range(3):
+            db.session.add(Booking(start_time=time(8 + j), end_time=time(9 + j), total_price=10.0,
+                                   booking_date=date.today() + timedelta(days=i), booking_status='confirmed',
+                                   user_id=customer.id, service_id=services[j].id))
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app('testing')
+    # Tokens are issued with an integer identity, newer flask-jwt-extended versions reject them unless this is off.
+    app.config['JWT_VERIFY_SUB'] = False
+
+    with app.app_context():
+        db.create_all()
+        seed()
+
+    yield app
+
+    with app.app_context():
+        db.drop_all()
+
+
+@pytest.fixture
+def make_app(monkeypatch, tmp_path):
+    # Seeded app on a database file of its own (a file can be copied, e.g. to stand in for the read replicas).
+    # Keyword arguments override TestingConfig before the engines are created.
+    def make(**settings):
+        settings.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'app.db'}")
+        for name, value in settings.items():
+            monkeypatch.setattr(TestingConfig, name, value, raising=False)
+        new_app = create_app('testing')
+        new_app.config['JWT_VERIFY_SUB'] = False
+        with new_app.app_context():
+            db.create_all()
+            seed()
+        return new_app
+    return make
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def admin_headers(app):
+    response = app.test_client().post('/api/login', json={'identifier': 'admin@kask.test', 'password': PASSWORD})
+    return {'Authorization': 'Bearer ' + response.get_json()['User']['access_token']}
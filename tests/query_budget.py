@@ -0,0 +1,113 @@
+# Pytest plugin guarding the number of SQL queries and the latency of endpoints.
+#
+# A test measures an endpoint with the query_guard fixture:
+#
+#   query_guard.measure('users.getAllCustomers', lambda: client.get('/api/users/customers', headers=headers), max_queries=2)
+#
+# Every SQL statement run while Flask handles that endpoint is recorded. The test fails when
+#   - the endpoint runs more queries than its declared budget (max_queries),
+#   - it runs more queries than recorded in the baseline (tests/query_baseline.json),
+#   - its median latency is above the baseline median x query_latency_factor + query_latency_slack_ms.
+# Run "pytest --update-query-baseline" to record the current numbers as the new baseline (on the machine that runs CI).
+import json
+import os
+import statistics
+import time
+
+import pytest
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_baseline.json')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--update-query-baseline', action='store_true', default=False,
+                     help='write the measured query counts and latencies to tests/query_baseline.json')
+    parser.addini('query_latency_factor', 'allowed median latency growth against the baseline', default='3.0')
+    parser.addini('query_latency_slack_ms', 'latency added to the allowed median (milliseconds)', default='25')
+
+
+class QueryGuard:
+    def __init__(self, baseline, results, latency_factor, latency_slack_ms, update):
+        self.baseline = baseline
+        self.results = results
+        self.latency_factor = latency_factor
+        self.latency_slack_ms = latency_slack_ms
+        self.update = update
+        self.endpoint = None
+        self.statements = []
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and request.endpoint == self.endpoint:
+            self.statements.append(statement)
+
+    def measure(self, endpoint, call, max_queries, runs=5):
+        self.endpoint = endpoint
+        counts = []
+        latencies = []
+        statements = []
+        response = None
+
+        for _ in range(runs):
+            self.statements = []
+            start = time.perf_counter()
+            response = call()
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code < 400, f"{endpoint} returned {response.status_code}: {response.get_data(as_text=True)[:300]}"
+            counts.append(len(self.statements))
+            statements = self.statements
+
+        queries = max(counts)
+        median_ms = statistics.median(latencies)
+        self.results[endpoint] = {'queries': queries, 'median_ms': round(median_ms, 3)}
+        listing = '\n'.join(statements)
+
+        assert queries <= max_queries, f"{endpoint} ran {queries} queries, its budget is {max_queries}:\n{listing}"
+
+        baseline = self.baseline.get(endpoint)
+        if baseline and not self.update:
+            assert queries <= baseline['queries'], (
+                f"{endpoint} ran {queries} queries, the baseline is {baseline['queries']}:\n{listing}")
+            allowed_ms = baseline['median_ms'] * self.latency_factor + self.latency_slack_ms
+            assert median_ms <= allowed_ms, (
+                f"{endpoint} median latency {median_ms:.1f}ms is above the allowed {allowed_ms:.1f}ms "
+                f"(baseline {baseline['median_ms']}ms)")
+        return response
+
+
+def _load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as baseline_file:
+        return json.load(baseline_file)
+
+
+def pytest_configure(config):
+    config._query_results = {}
+
+
+@pytest.fixture
+def query_guard(request):
+    config = request.config
+    guard = QueryGuard(
+        baseline=_load_baseline(),
+        results=config._query_results,
+        latency_factor=float(config.getini('query_latency_factor')),
+        latency_slack_ms=float(config.getini('query_latency_slack_ms')),
+        update=config.getoption('--update-query-baseline'),
+    )
+    event.listen(Engine, 'before_cursor_execute', guard.record)
+    yield guard
+    event.remove(Engine, 'before_cursor_execute', guard.record)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if config.getoption('--update-query-baseline') and config._query_results:
+        baseline = _load_baseline()
+        baseline.update(config._query_results)
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
@@ -0,0 +1,93 @@
+# Daily service rollups and the analytics endpoints reading them.
+from collections import defaultdict
+from datetime import date, time, timedelta
+
+from app.analytics import COUNTERS, contribution, daily_report, rebuild_rollups, upsert_rollup
+from app.extensions import db
+from app.models.bookings import Booking
+from app.models.service_daily_stats import ServiceDailyStats
+
+
+def test_services_report(client, admin_headers):
+    start, end = date.today(), date.today() + timedelta(days=4)
+    response = client.get(f"/api/analytics/services?start={start}&end={end}", headers=admin_headers)
+    assert response.status_code == 200
+    services = response.get_json()['Services']
+    assert len(services) == 3
+    # One one-hour booking of every service on each of the five days.
+    assert services[0]['bookings'] == 5
+    assert services[0]['booked_hours'] == 5.0
+    assert services[0]['revenue'] == 50.0
+    assert services[0]['occupancy'] == round(5 / (12 * 5), 4)
+
+
+def test_daily_report_filters_by_service(client, admin_headers):
+    response = client.get(f"/api/analytics/daily?start={date.today()}&service_id=1", headers=admin_headers)
+    days = response.get_json()['Days']
+    assert [day['service_id'] for day in days] == [1]
+
+
+def test_invalid_range(client, admin_headers):
+    response = client.get('/api/analytics/daily?start=yesterday', headers=admin_headers)
+    assert response.status_code == 400
+
+
+def test_rollups_follow_booking_writes(app):
+    start, end = date.today(), date.today() + timedelta(days=4)
+    with app.app_context():
+        incremental = daily_report(start, end)
+        rebuild_rollups()
+        assert daily_report(start, end) == incremental
+
+        booking = Booking.query.filter_by(service_id=1, booking_date=date.today()).first()
+        booking.booking_status = 'cancelled'
+        db.session.commit()
+        today = daily_report(start, start, service_id=1)[0]
+        assert today['cancelled'] == 1 and today['revenue'] == 0.0 and today['booked_hours'] == 0.0
+
+        booking.booking_status = 'confirmed'
+        db.session.commit()
+        assert daily_report(start, end) == incremental
+
+
+def test_first_bookings_of_a_day_created_at_the_same_time(app):
+    day = date.today() + timedelta(days=500)
+
+    def delta():
+        values = defaultdict(float)
+        values.update(contribution('confirmed', time(8), time(10), 20.0))
+        return values
+
+    with app.app_context():
+        try:
+            # Both requests found no rollup row and nothing stored yet for the day: the second one adds to the first.
+            upsert_rollup(db.session, 2, day, {}, delta())
+            upsert_rollup(db.session, 2, day, {}, delta())
+            db.session.commit()
+            stats = db.session.get(ServiceDailyStats, (2, day))
+            assert (stats.bookings_count, stats.booked_hours, stats.revenue) == (2, 4.0, 40.0)
+
+            # The second request saw the first booking committed (but no row yet): its stored total is not added again.
+            upsert_rollup(db.session, 2, day, {counter: getattr(stats, counter) for counter in COUNTERS}, delta())
+            db.session.commit()
+            db.session.refresh(stats)
+            assert (stats.bookings_count, stats.revenue) == (3, 60.0)
+        finally:
+            db.session.query(ServiceDailyStats).filter_by(day=day).delete()
+            db.session.commit()
+
+
+def test_booking_on_a_new_day_creates_its_rollup(app):
+    day = date.today() + timedelta(days=501)
+    with app.app_context():
+        booking = Booking(start_time=time(8), end_time=time(9), total_price=15.0, booking_date=day,
+                          booking_status='confirmed', user_id=2, service_id=3)
+        db.session.add(booking)
+        db.session.commit()
+        try:
+            assert daily_report(day, day, service_id=3)[0]['revenue'] == 15.0
+        finally:
+            db.session.delete(booking)
+            db.session.commit()
+            db.session.query(ServiceDailyStats).filter_by(day=day).delete()
+            db.session.commit()
@@ -0,0 +1,49 @@
+# gzip compression of the JSON responses.
+import gzip
+import json
+
+from app.compression import compressed_cache
+
+
+def test_large_response_is_gzipped(client, admin_headers):
+    headers = dict(admin_headers, **{'Accept-Encoding': 'gzip'})
+    response = client.get('/api/bookings/all', headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data))['Total_bookings'] == 15
+
+
+def test_small_response_is_not_compressed(client, admin_headers):
+    headers = dict(admin_headers, **{'Accept-Encoding': 'gzip'})
+    response = client.get('/api/services/1', headers=headers)
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()['Service']['id'] == 1
+
+
+def test_identity_when_not_accepted(client, admin_headers):
+    response = client.get('/api/bookings/all', headers=dict(admin_headers, **{'Accept-Encoding': 'identity'}))
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_catalog_body_is_compressed_once(app, client, admin_headers):
+    app.config['COMPRESSION_MIN_SIZE'] = 100
+    try:
+        headers = dict(admin_headers, **{'Accept-Encoding': 'gzip'})
+        first = client.get('/api/services/all', headers=headers)
+        hits = compressed_cache.hits
+        second = client.get('/api/services/all', headers=headers)
+        assert compressed_cache.hits == hits + 1
+        assert first.data == second.data
+        assert len(json.loads(gzip.decompress(second.data))['Services']) == 3
+    finally:
+        app.config['COMPRESSION_MIN_SIZE'] = 1024
+
+
+def test_streamed_response_is_compressed(app):
+    from flask import Response
+    from app.compression import _compress_response
+
+    with app.test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+        response = _compress_response(Response((f"{i}\n" for i in range(1000)), mimetype='text/plain'))
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(b''.join(response.response)).decode().splitlines()[-1] == '999'
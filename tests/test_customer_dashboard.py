@@ -0,0 +1,88 @@
+# Customer dashboard aggregates and the booking counters behind them.
+from collections import defaultdict
+from datetime import date, time, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app.customer_stats import (_count_bookings, counted_dashboard, grouped_dashboard, rebuild_customer_stats,
+                                 upsert_customer_stats)
+from app.extensions import db
+from app.models.bookings import Booking
+from app.models.customer_stats import CustomerStats
+from app.models.users import User
+
+
+def test_dashboard_is_one_grouped_query(client, admin_headers, query_guard):
+    client.get('/api/users/customers/dashboard', headers=admin_headers) # Token blocklist loaded before measuring.
+    response = query_guard.measure('users.getCustomersDashboard',
+                                   lambda: client.get('/api/users/customers/dashboard', headers=admin_headers),
+                                   max_queries=2) # The logged in user, then the dashboard.
+    customers = response.get_json()['customers']
+    assert len(customers) == 5
+    first = customers[0]
+    assert first['bookings_total'] == 3
+    assert first['bookings_by_status']['confirmed'] == 3
+    assert first['total_spend'] == 30.0
+    assert first['next_booking_date'] == date.today().isoformat()
+
+
+def test_only_admins_see_the_dashboard(app, client):
+    with app.app_context():
+        customer_id = db.session.scalar(db.select(User.id).filter_by(email='customer0@kask.test'))
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=customer_id)}
+    response = client.get('/api/users/customers/dashboard', headers=headers)
+    assert response.status_code == 401
+
+
+def test_counters_follow_booking_changes(app):
+    app.config['CUSTOMER_STATS_COUNTERS'] = True
+    try:
+        with app.app_context():
+            rebuild_customer_stats()
+            assert counted_dashboard() == grouped_dashboard()
+
+            customer_id = db.session.query(Booking.user_id).first()[0]
+            new_booking = Booking(start_time=time(15), end_time=time(16), total_price=25.0,
+                                  booking_date=date.today() + timedelta(days=30), booking_status='confirmed',
+                                  user_id=customer_id, service_id=1)
+            db.session.add(new_booking)
+            existing = Booking.query.filter_by(user_id=customer_id).first()
+            existing.booking_status = 'cancelled'
+            db.session.commit()
+
+            stats = db.session.get(CustomerStats, customer_id)
+            assert stats.bookings_total == 4
+            assert stats.cancelled_count == 1
+            assert counted_dashboard() == grouped_dashboard()
+
+            existing.booking_status = 'confirmed'
+            db.session.delete(new_booking)
+            db.session.commit()
+            assert counted_dashboard() == grouped_dashboard()
+            assert db.session.get(CustomerStats, customer_id).bookings_total == 3
+
+            CustomerStats.query.delete()
+            db.session.commit()
+    finally:
+        app.config['CUSTOMER_STATS_COUNTERS'] = False
+
+
+def test_first_bookings_of_a_customer_created_at_the_same_time(app):
+    def delta(price):
+        values = defaultdict(float)
+        values.update({'total': 1, 'confirmed': 1, 'spend': price})
+        return values
+
+    with app.app_context():
+        customer_id = db.session.scalar(db.select(User.id).filter_by(email='customer3@kask.test'))
+        try:
+            # Both requests found no counters row and counted the same 3 stored bookings: the second adds to the first.
+            stored = _count_bookings(db.session, customer_id)
+            upsert_customer_stats(db.session, customer_id, stored, delta(25.0))
+            upsert_customer_stats(db.session, customer_id, stored, delta(5.0))
+            db.session.commit()
+            stats = db.session.get(CustomerStats, customer_id)
+            assert (stats.bookings_total, stats.confirmed_count, stats.total_spend) == (5, 5, 60.0)
+        finally:
+            CustomerStats.query.delete()
+            db.session.commit()
@@ -0,0 +1,74 @@
+# Engine/pool settings and the connection pool metrics.
+import pytest
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.db_pool import TimedQueuePool, configure_pool_metrics, pool_metrics
+from app.extensions import db
+from app.models.users import User
+from config import Config, DevelopmentConfig, ProductionConfig, TestingConfig, config_by_name, engine_options
+
+
+def test_engine_options_read_the_environment(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '4')
+    monkeypatch.setenv('DB_POOL_PRE_PING', 'false')
+    monkeypatch.setenv('DB_READ_TIMEOUT', '7')
+
+    options = engine_options('mysql+pymysql://root:@localhost/kasokoso_db')
+    assert options['pool_size'] == 4
+    assert options['max_overflow'] == 20
+    assert options['pool_pre_ping'] is False
+    assert options['connect_args'] == {'connect_timeout': 5, 'read_timeout': 7, 'write_timeout': 30}
+    # The timeouts are options of the MySQL driver only.
+    assert 'connect_args' not in engine_options('postgresql://localhost/kasokoso_db')
+
+
+def test_config_classes():
+    assert config_by_name['default'] is Config
+    assert issubclass(DevelopmentConfig, Config) and DevelopmentConfig.DEBUG
+    assert ProductionConfig.DEBUG is False
+    assert TestingConfig.TESTING and TestingConfig.SQLALCHEMY_ENGINE_OPTIONS == {}
+    assert 'pool_size' in Config.SQLALCHEMY_ENGINE_OPTIONS
+
+
+@pytest.mark.parametrize('config', [Config, ProductionConfig])
+def test_timed_pool_does_not_change_the_config_class(config):
+    app = Flask(__name__)
+    app.config.from_object(config)
+    configure_pool_metrics(app)
+
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['poolclass'] is TimedQueuePool
+    assert 'poolclass' not in config.SQLALCHEMY_ENGINE_OPTIONS
+    assert 'poolclass' not in Config.SQLALCHEMY_ENGINE_OPTIONS
+
+
+def test_timed_pool_records_waits_and_timeouts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0,
+                           pool_timeout=0.05, pool_logging_name='timed_test')
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    engine.dispose()
+
+    stats = pool_metrics.snapshot()['timed_test']
+    assert stats['checkouts'] == 1
+    assert stats['timeouts'] == 1
+    assert sum(stats['buckets']) == 1
+    assert stats['wait_seconds_max'] >= 0
+
+
+def test_db_pool_endpoint_is_for_admins(app, client):
+    with app.app_context():
+        customer_id = db.session.scalar(db.select(User.id).filter_by(email='customer0@kask.test'))
+        admin = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+        customer = {'Authorization': 'Bearer ' + create_access_token(identity=customer_id)}
+        pool_class = type(db.engine.pool).__name__
+
+    response = client.get('/api/metrics/db-pool', headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['Pools']['default'] == {'pool_class': pool_class, 'wait': {}}
+    assert client.get('/api/metrics/db-pool', headers=customer).status_code == 401
+    assert client.get('/api/metrics/db-pool').status_code == 401
@@ -0,0 +1,81 @@
+# Read replica routing with two SQLite stand-ins: copies of the primary database file.
+import shutil
+import sqlite3
+
+import pytest
+from flask_jwt_extended import create_access_token
+from app.extensions import db
+
+
+@pytest.fixture
+def routed(make_app, tmp_path):
+    replicas = [tmp_path / 'replica_0.db', tmp_path / 'replica_1.db']
+    app = make_app(SQLALCHEMY_REPLICA_URIS=[f"sqlite:///{path}" for path in replicas])
+    for path in replicas:
+        shutil.copy(tmp_path / 'app.db', path)
+        # Renamed on the replicas so the responses show where they were read.
+        with sqlite3.connect(path) as connection:
+            connection.execute("UPDATE services SET service_name = 'Replica ' || service_name")
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+    yield app, headers, replicas
+
+    # The replica binds stay registered on db, create_all/drop_all of the next apps would look for their engines.
+    for bind_key in app.extensions['db_router'].bind_keys:
+        db.metadatas.pop(bind_key, None)
+
+
+def _service_names(client, headers):
+    response = client.get('/api/services/all', headers=headers)
+    assert response.status_code == 200
+    return sorted(service['service_name'] for service in response.get_json()['Services'])
+
+
+def test_reads_go_to_a_replica_until_the_client_writes(routed):
+    app, headers, replicas = routed
+    client = app.test_client()
+    assert _service_names(client, headers) == ['Replica Pool 0', 'Replica Pool 1', 'Replica Pool 2']
+
+    response = client.post('/api/services/create', headers=headers, json={
+        'service_type': 'Sauna', 'service_name': 'Sauna', 'description': 'Steam', 'price_per_hour': 5,
+        'availability_status': 'Available'})
+    assert response.status_code == 201
+    assert 'db_primary=1' in response.headers['Set-Cookie']
+
+    # The cookie keeps the client on the primary, it reads its own write.
+    assert _service_names(client, headers) == ['Pool 0', 'Pool 1', 'Pool 2', 'Sauna']
+    # Other clients still read from the replicas.
+    assert 'Sauna' not in _service_names(app.test_client(), headers)
+
+
+def test_soft_deleted_rows_are_hidden_on_the_replicas(routed):
+    app, headers, replicas = routed
+    for path in replicas:
+        with sqlite3.connect(path) as connection:
+            connection.execute("UPDATE services SET deleted_at = '2026-01-01 00:00:00' WHERE service_name = 'Replica Pool 0'")
+    assert _service_names(app.test_client(), headers) == ['Replica Pool 1', 'Replica Pool 2']
+
+
+def test_replicas_marked_down_are_skipped(routed):
+    app, headers, replicas = routed
+    router = app.extensions['db_router']
+    router.mark_down('replica_0')
+    with app.app_context():
+        assert router.pick(app.extensions['sqlalchemy'].engines)[0] == 'replica_1'
+        router.mark_down('replica_1')
+        assert router.pick(app.extensions['sqlalchemy'].engines) == (None, None)
+    assert _service_names(app.test_client(), headers) == ['Pool 0', 'Pool 1', 'Pool 2']
+
+
+def test_read_failing_on_its_replica_is_retried_on_the_primary(routed):
+    app, headers, replicas = routed
+    client = app.test_client()
+    _service_names(client, headers) # Both replicas pass their health check.
+    for path in replicas:
+        with sqlite3.connect(path) as connection:
+            connection.execute('DROP TABLE galleries')
+            connection.execute('DROP TABLE services')
+
+    assert _service_names(client, headers) == ['Pool 0', 'Pool 1', 'Pool 2']
+    router = app.extensions['db_router']
+    assert any(until > 0 for until in router.down_until.values())
@@ -0,0 +1,51 @@
+# Bookings export: chunked reads, csv output and the per service summary.
+import csv
+import gzip
+import io
+from datetime import date, timedelta
+
+from app.exports import ServiceSummary, iter_chunks, write_export
+from app.extensions import db
+
+
+def test_chunks_are_columns(app):
+    with app.app_context():
+        chunks = list(iter_chunks(db.session, chunk_size=4))
+    assert [len(chunk['booking_id']) for chunk in chunks] == [4, 4, 4, 3]
+    assert chunks[0]['hours'][0] == 1.0
+    assert chunks[0]['service_name'][0].startswith('Pool')
+
+
+def test_csv_export_and_summary(app):
+    export_file = io.BytesIO()
+    with app.app_context():
+        summary = write_export(iter_chunks(db.session, chunk_size=4), export_file, 'csv')
+    rows = list(csv.reader(io.StringIO(gzip.decompress(export_file.getvalue()).decode())))
+    assert rows[0][0] == 'booking_id'
+    assert len(rows) == 16
+    services = summary.rows()
+    assert [service['bookings'] for service in services] == [5, 5, 5]
+    assert services[0]['revenue'] == 50.0 and services[0]['hours'] == 5.0
+
+
+def test_summary_skips_cancelled_bookings():
+    summary = ServiceSummary()
+    summary.add({'service_id': [1, 1, 2], 'service_name': ['a', 'a', 'b'], 'hours': [1.0, 2.0, 1.5],
+                 'total_unit_price': [10.0, 20.0, 15.0], 'booking_status': ['confirmed', 'cancelled', 'completed']})
+    assert summary.rows() == [
+        {'service_id': 1, 'service_name': 'a', 'bookings': 2, 'cancelled': 1, 'hours': 1.0, 'revenue': 10.0},
+        {'service_id': 2, 'service_name': 'b', 'bookings': 1, 'cancelled': 0, 'hours': 1.5, 'revenue': 15.0},
+    ]
+
+
+def test_streamed_csv_download(client, admin_headers):
+    start, end = date.today(), date.today() + timedelta(days=4)
+    response = client.get(f"/api/analytics/export?start={start}&end={end}", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert len(response.get_data(as_text=True).splitlines()) == 16
+
+
+def test_unknown_format(client, admin_headers):
+    response = client.get('/api/analytics/export?format=xlsx', headers=admin_headers)
+    assert response.status_code == 400
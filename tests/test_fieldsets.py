@@ -0,0 +1,46 @@
+# ?fields= and ?include= on the read endpoints.
+from app.models.bookings import Booking
+from app.serializers import booking_schema
+
+
+def test_fields_restrict_booking_keys(client, admin_headers):
+    response = client.get('/api/bookings/all?fields=start_time,service.service_name', headers=admin_headers)
+    booking = response.get_json()['Bookings'][0]
+    assert booking.keys() == {'id', 'start_time', 'service'}
+    assert booking['service'].keys() == {'id', 'service_name'}
+
+
+def test_fields_restrict_selected_columns(app):
+    schema = booking_schema.select(['start_time', 'service.service_name'])
+    with app.app_context():
+        sql = str(Booking.query.options(*schema.load_options(Booking)).statement.compile())
+    select_list = sql.split('FROM')[0]
+    assert 'service_name' in select_list and 'start_time' in select_list
+    assert 'description' not in select_list and 'users' not in sql
+
+
+def test_include_picks_nested_objects(client, admin_headers):
+    response = client.get('/api/bookings/all?include=user', headers=admin_headers)
+    booking = response.get_json()['Bookings'][0]
+    assert 'user' in booking and 'service' not in booking
+    assert 'end_time' in booking
+
+    response = client.get('/api/bookings/all?include=', headers=admin_headers)
+    booking = response.get_json()['Bookings'][0]
+    assert 'user' not in booking and 'service' not in booking
+
+
+def test_nested_list_fields(client, admin_headers):
+    response = client.get('/api/users/customers?fields=customername,bookings.amount', headers=admin_headers)
+    customer = response.get_json()['customers'][0]
+    assert customer.keys() == {'id', 'customername', 'bookings'}
+    assert len(customer['bookings']) == 3
+    assert customer['bookings'][0].keys() == {'id', 'amount'}
+
+
+def test_unknown_field_is_rejected(client, admin_headers):
+    response = client.get('/api/services/all?fields=password', headers=admin_headers)
+    assert response.status_code == 400
+
+    response = client.get('/api/bookings/all?include=payments', headers=admin_headers)
+    assert response.status_code == 400
@@ -0,0 +1,124 @@
+# Idempotency-Key replays of the create endpoints.
+from datetime import date, timedelta
+
+from app.extensions import db
+from flask import Flask
+
+from app.idempotency import Idempotency, MemoryStore, RedisStore, _fingerprint, idempotency
+from app.models.bookings import Booking
+
+
+def test_retried_booking_is_created_once(app, client, admin_headers):
+    body = {'start_time': '06:00', 'end_time': '07:00', 'service_name': 'Pool 0',
+            'booking_date': (date.today() + timedelta(days=400)).isoformat()}
+    headers = dict(admin_headers, **{'Idempotency-Key': 'booking-retry-1'})
+    try:
+        first = client.post('/api/bookings/create', json=body, headers=headers)
+        second = client.post('/api/bookings/create', json=body, headers=headers)
+        assert first.status_code == second.status_code == 201
+        assert second.headers['Idempotent-Replayed'] == 'true'
+        assert second.get_json() == first.get_json()
+
+        # The same key with another body is refused, a new key runs the view (and finds the overlap).
+        other = dict(body, end_time='08:00')
+        assert client.post('/api/bookings/create', json=other, headers=headers).status_code == 422
+        assert client.post('/api/bookings/create', json=body, headers=dict(headers, **{'Idempotency-Key': 'booking-retry-2'})).status_code == 409
+    finally:
+        with app.app_context():
+            assert Booking.query.filter_by(booking_date=date.today() + timedelta(days=400)).delete() == 1
+            db.session.commit()
+
+
+def test_retry_while_running_gets_conflict(app, client, admin_headers):
+    headers = dict(admin_headers, **{'Idempotency-Key': 'message-running'})
+    body = {'content': 'Hello'}
+    # Claiming the key as the first request does, the view has not finished yet.
+    store_key = 'user:1:messages.createMessage:message-running'
+    with app.test_request_context('/api/messages/send', method='POST', json=body):
+        assert idempotency.store.begin(store_key, _fingerprint(), 60) == ('new', None)
+    try:
+        response = client.post('/api/messages/send', json=body, headers=headers)
+        assert response.status_code == 409
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        idempotency.store.abandon(store_key)
+
+
+def test_store_evicts_expired_and_oldest_entries():
+    store = MemoryStore(max_keys=2)
+    assert store.begin('a', 'x', ttl=-1) == ('new', None)
+    assert store.begin('a', 'x', ttl=60) == ('new', None) # The expired entry was dropped.
+    store.finish('a', (201, b'{}', {}))
+    assert store.begin('a', 'x', ttl=60) == ('replay', (201, b'{}', {}))
+    store.begin('b', 'x', ttl=60)
+    store.begin('c', 'x', ttl=60)
+    assert 'a' not in store.entries and len(store) == 2
+
+
+class FakeRedis:
+    # The commands the store uses, without expiry.
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, nx=False, xx=False, ex=None, keepttl=False):
+        if (nx and key in self.values) or (xx and key not in self.values):
+            return None
+        self.values[key] = value.encode()
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+def test_redis_store_is_shared_between_workers():
+    client = FakeRedis()
+    first_worker, second_worker = RedisStore(client), RedisStore(client)
+    assert first_worker.begin('k', 'x', 60) == ('new', None)
+    assert second_worker.begin('k', 'x', 60) == ('running', None)
+    first_worker.finish('k', (201, b'{"id": 1}', {'Content-Type': 'application/json'}))
+    assert second_worker.begin('k', 'x', 60) == ('replay', (201, b'{"id": 1}', {'Content-Type': 'application/json'}))
+    assert second_worker.begin('k', 'y', 60) == ('mismatch', None)
+    second_worker.abandon('k')
+    assert first_worker.begin('k', 'y', 60) == ('new', None)
+
+
+def test_memory_store_is_refused_with_several_workers():
+    app = Flask(__name__)
+    app.config.update(IDEMPOTENCY_ENABLED=True, IDEMPOTENCY_MAX_KEYS=10, IDEMPOTENCY_STORAGE_URL=None, WORKER_PROCESSES=3)
+    Idempotency().init_app(app)
+    assert app.config['IDEMPOTENCY_ENABLED'] is False
+
+    app.config.update(IDEMPOTENCY_ENABLED=True, WORKER_PROCESSES=1)
+    Idempotency().init_app(app)
+    assert app.config['IDEMPOTENCY_ENABLED'] is True
+
+
+def test_running_entries_are_never_evicted():
+    store = MemoryStore(max_keys=2)
+    store.begin('a', 'x', ttl=60)
+    store.begin('b', 'x', ttl=60)
+    assert store.begin('c', 'x', ttl=60) == ('full', None)
+    assert store.begin('a', 'x', ttl=60) == ('running', None) # Still claimed, a retry does not run the view again.
+    store.finish('a', (201, b'{}', {}))
+    assert store.begin('c', 'x', ttl=60) == ('new', None)
+    assert list(store.entries) == ['b', 'c']
+
+
+class BrokenStore:
+    def begin(self, key, fingerprint, ttl):
+        raise ConnectionError('Redis is down')
+
+    finish = abandon = begin
+
+
+def test_failing_store_runs_the_view_without_idempotency(app, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(idempotency, 'store', BrokenStore())
+    headers = dict(admin_headers, **{'Idempotency-Key': 'store-down'})
+    first = client.post('/api/messages/send', json={'content': 'Hello'}, headers=headers)
+    second = client.post('/api/messages/send', json={'content': 'Hello'}, headers=headers)
+    assert first.status_code < 500 and second.status_code == first.status_code
+    assert 'Idempotent-Replayed' not in second.headers
+    assert 'idempotency_store_errors_total{endpoint="messages.createMessage",call="begin"}' in app.test_client().get('/metrics').get_data(as_text=True)
@@ -0,0 +1,69 @@
+# Cache of verified tokens.
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from conftest import PASSWORD
+from app.jwt_cache import VerifiedTokenCache
+
+
+@pytest.fixture
+def token_cache(app):
+    cache = app.extensions['jwt_verify_cache'] = VerifiedTokenCache(100, 60)
+    yield cache
+    app.extensions.pop('jwt_verify_cache')
+
+
+def test_verified_token_is_decoded_once(app, client, admin_headers, token_cache, monkeypatch):
+    from flask_jwt_extended import JWTManager
+
+    decoded = []
+    original = JWTManager._decode_jwt_from_config
+    monkeypatch.setattr(JWTManager, '_decode_jwt_from_config',
+                        lambda self, *args: decoded.append(1) or original(self, *args))
+    for _ in range(3):
+        assert client.get('/api/users/all', headers=admin_headers).status_code == 200
+    assert len(decoded) == 1
+    assert len(token_cache) == 1
+
+
+def test_revoked_token_is_refused_despite_the_cache(client, token_cache):
+    user = client.post('/api/login', json={'identifier': 'customer0@kask.test', 'password': PASSWORD}).get_json()['User']
+    headers = {'Authorization': 'Bearer ' + user['access_token']}
+    assert client.get(f"/api/users/user/{user['id']}", headers=headers).status_code == 200
+    assert client.post('/api/logout', headers=headers).status_code == 200
+    assert client.get(f"/api/users/user/{user['id']}", headers=headers).status_code == 401
+
+
+def test_entries_expire_with_the_token():
+    cache = VerifiedTokenCache(2, ttl=60)
+    cache.put(b'a', {'exp': 100}, now=50)
+    assert cache.get(b'a', now=99) == {'exp': 100}
+    assert cache.get(b'a', now=100) is None and len(cache) == 0
+
+    # No longer than the TTL, and the least recently used entry goes first.
+    cache.put(b'b', {'exp': 10000}, now=0)
+    assert cache.get(b'b', now=61) is None
+    for key in (b'c', b'd', b'e'):
+        cache.put(key, {}, now=0)
+    assert list(cache.entries) == [b'd', b'e']
+
+
+def test_hits_check_the_token_times_with_the_leeway(app, client, token_cache):
+    # A token verified at the very end of its life, whose cache entry is made to outlive it.
+    with app.app_context():
+        token = create_access_token(identity=1, expires_delta=False, additional_claims={'exp': int(time.time()) + 1})
+    headers = {'Authorization': 'Bearer ' + token}
+    app.config['JWT_DECODE_LEEWAY'] = 0
+    try:
+        assert client.get('/api/users/all', headers=headers).status_code == 200
+        for entry in token_cache.entries:
+            token_cache.entries[entry] = (time.time() + 60, token_cache.entries[entry][1])
+        time.sleep(1.1)
+        assert client.get('/api/users/all', headers=headers).status_code == 401
+
+        app.config['JWT_DECODE_LEEWAY'] = 30
+        assert client.get('/api/users/all', headers=headers).status_code == 200
+    finally:
+        app.config['JWT_DECODE_LEEWAY'] = 0
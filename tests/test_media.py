@@ -0,0 +1,206 @@
+# Gallery uploads in the content addressed media store.
+import hashlib
+import io
+import os
+
+import pytest
+from flask_jwt_extended import create_access_token
+from PIL import Image
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
+
+from app import media_storage
+from app.extensions import db
+from app.media_storage import MediaError, shutdown_executor, store_upload
+from app.models.gallery import Gallery
+from app.models.users import User
+
+
+def _png(width=800, height=600, color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def media_app(make_app, tmp_path):
+    app = make_app(MEDIA_ROOT=str(tmp_path / 'media'))
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+    yield app, headers
+    shutdown_executor()
+
+
+def _upload(client, headers, data, filename='photo.png'):
+    return client.post('/api/gallery/upload', headers=headers, content_type='multipart/form-data', data={
+        'image': (io.BytesIO(data), filename), 'caption': 'Pool side', 'service_name': 'Pool 0'})
+
+
+class ChunkedStream(io.BytesIO):
+    # Records the size of every read the store makes.
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def test_upload_is_streamed_in_chunks(media_app, monkeypatch):
+    app, headers = media_app
+    monkeypatch.setattr(media_storage, 'CHUNK_SIZE', 1024)
+    data = _png()
+    stream = ChunkedStream(data)
+
+    content_hash, path = store_upload(app, FileStorage(stream=stream, filename='photo.PNG'))
+    assert content_hash == hashlib.sha256(data).hexdigest()
+    assert path == os.path.join(app.config['MEDIA_ROOT'], content_hash[:2], content_hash, 'original.png')
+    assert set(stream.reads) == {1024}
+    assert len(stream.reads) == len(data) // 1024 + 2 # Every chunk, the last partial one and the empty read.
+
+
+def test_too_large_upload_leaves_nothing_behind(media_app, monkeypatch):
+    app, headers = media_app
+    monkeypatch.setitem(app.config, 'MEDIA_MAX_BYTES', 1000)
+    with pytest.raises(MediaError):
+        store_upload(app, FileStorage(stream=io.BytesIO(_png()), filename='photo.png'))
+    assert os.listdir(os.path.join(app.config['MEDIA_ROOT'], 'tmp')) == []
+
+    response = _upload(app.test_client(), headers, _png())
+    assert response.status_code == 400
+    assert response.get_json()['Error'] == 'Image is too large.'
+
+
+def test_upload_is_accepted_and_its_variants_generated(media_app):
+    app, headers = media_app
+    data = _png()
+    response = _upload(app.test_client(), headers, data)
+    assert response.status_code == 202
+    gallery = response.get_json()['Gallery']
+    content_hash = hashlib.sha256(data).hexdigest()
+    assert gallery['content_hash'] == content_hash
+    assert gallery['image_url'] == f"/api/gallery/media/{content_hash}/original.png"
+
+    shutdown_executor() # Waits for the background job.
+    with app.app_context():
+        variants = db.session.get(Gallery, gallery['id']).variants
+    assert variants == {name: f"/api/gallery/media/{content_hash}/{name}.webp" for name in ('w320', 'w640', 'w1280')} | {
+        'original': gallery['image_url']}
+
+    folder = os.path.join(app.config['MEDIA_ROOT'], content_hash[:2], content_hash)
+    with Image.open(os.path.join(folder, 'w320.webp')) as image:
+        assert image.format == 'WEBP'
+        assert image.size == (320, 240)
+    with Image.open(os.path.join(folder, 'w1280.webp')) as image:
+        assert image.size == (800, 600) # Never upscaled.
+
+
+def test_same_image_is_stored_once(media_app):
+    app, headers = media_app
+    client = app.test_client()
+    data = _png()
+    first = _upload(client, headers, data).get_json()['Gallery']
+    second = _upload(client, headers, data, filename='copy.png').get_json()['Gallery']
+
+    assert first['id'] != second['id']
+    assert first['content_hash'] == second['content_hash']
+    assert first['image_url'] == second['image_url']
+    folder = os.path.join(app.config['MEDIA_ROOT'], first['content_hash'][:2], first['content_hash'])
+    assert [name for name in os.listdir(folder) if name.startswith('original')] == ['original.png']
+    assert os.listdir(os.path.join(app.config['MEDIA_ROOT'], 'tmp')) == []
+
+
+def _stored(app, headers):
+    data = _png()
+    gallery = _upload(app.test_client(), headers, data).get_json()['Gallery']
+    return gallery['image_url'], data
+
+
+def test_media_is_served_from_the_store_without_queries(media_app):
+    app, headers = media_app
+    url, data = _stored(app, headers)
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = app.test_client().get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.mimetype == 'image/png'
+    assert statements == []
+    assert app.test_client().get(url.replace('original.png', 'missing.png')).status_code == 404
+    assert app.test_client().get('/api/gallery/media/' + '0' * 64 + '/original.png').status_code == 404
+    assert app.test_client().get('/api/gallery/media/not-a-hash/original.png').status_code == 404
+
+
+def test_media_is_cached_as_immutable_with_a_strong_etag(media_app):
+    app, headers = media_app
+    url, data = _stored(app, headers)
+    client = app.test_client()
+
+    response = client.get(url)
+    content_hash = url.split('/')[-2]
+    assert response.headers['ETag'] == f'"{content_hash}"'
+    cache_control = response.cache_control
+    assert cache_control.public and cache_control.immutable
+    assert cache_control.max_age == app.config['MEDIA_MAX_AGE']
+
+    revalidated = client.get(url, headers={'If-None-Match': f'"{content_hash}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == f'"{content_hash}"'
+
+
+def test_media_answers_range_requests(media_app):
+    app, headers = media_app
+    url, data = _stored(app, headers)
+    client = app.test_client()
+
+    response = client.get(url, headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.data == data[:100]
+    assert response.headers['Content-Range'] == f"bytes 0-99/{len(data)}"
+
+    # If-Range with the current tag resumes the download, an outdated tag gets the whole file.
+    content_hash = url.split('/')[-2]
+    resumed = client.get(url, headers={'Range': 'bytes=100-', 'If-Range': f'"{content_hash}"'})
+    assert resumed.status_code == 206
+    assert resumed.data == data[100:]
+    outdated = client.get(url, headers={'Range': 'bytes=100-', 'If-Range': '"outdated"'})
+    assert outdated.status_code == 200
+    assert outdated.data == data
+
+
+def test_only_images_are_stored(media_app):
+    app, headers = media_app
+    client = app.test_client()
+    response = _upload(client, headers, b'<?php echo "not an image"; ?>', filename='shell.png')
+    assert response.status_code == 400
+    assert response.get_json()['Error'] == 'The file is not a valid image.'
+    assert os.listdir(os.path.join(app.config['MEDIA_ROOT'], 'tmp')) == []
+
+    # Stored under the extension of its real format, so it is served with the right content type.
+    gallery = _upload(client, headers, _png(), filename='photo.jpg').get_json()['Gallery']
+    assert gallery['image_url'].endswith('/original.png')
+
+
+def test_large_bodies_are_refused(make_app, tmp_path):
+    app = make_app(MEDIA_ROOT=str(tmp_path / 'media'), MAX_CONTENT_LENGTH=2000)
+    with app.app_context():
+        customer_id = db.session.scalar(db.select(User.id).filter_by(email='customer0@kask.test'))
+        admin = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+        customer = {'Authorization': 'Bearer ' + create_access_token(identity=customer_id)}
+    client = app.test_client()
+    data = _png() + os.urandom(4000)
+
+    # Non administrators are refused before their body is read.
+    assert _upload(client, customer, data).status_code == 401
+    response = _upload(client, admin, data)
+    assert response.status_code == 413
+    assert response.get_json()['Error'] == 'Image is too large.'
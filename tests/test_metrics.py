@@ -0,0 +1,132 @@
+# /metrics output and the per request query counters.
+import re
+import time
+
+import pytest
+from flask import g, has_request_context
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.extensions import db
+from app.instrumentation import Registry
+from config import Config, ProductionConfig
+
+
+def _value(body, line_start):
+    match = re.search('^' + re.escape(line_start) + r' (\S+)$', body, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+@pytest.fixture
+def metrics_app(make_app):
+    def make(**settings):
+        app = make_app(**settings)
+        with app.app_context():
+            app.test_headers = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+        return app
+    return make
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = Registry()
+    counter = registry.counter('jobs_total', 'Jobs run.', ('queue',))
+    histogram = registry.histogram('job_seconds', 'Job duration.', ('queue',), buckets=(0.1, 1.0))
+    assert registry.counter('jobs_total', 'Jobs run.', ('queue',)) is counter
+    counter.inc('mail')
+    counter.inc('mail', amount=2)
+    counter.inc('say "hi"\n')
+    histogram.observe(0.05, 'mail')
+    histogram.observe(0.5, 'mail')
+    histogram.observe(3, 'mail')
+    registry.collector(lambda: ['extra_gauge 1'])
+
+    assert registry.render() == '\n'.join([
+        '# HELP jobs_total Jobs run.',
+        '# TYPE jobs_total counter',
+        'jobs_total{queue="mail"} 3',
+        'jobs_total{queue="say \\"hi\\"\\n"} 1',
+        '# HELP job_seconds Job duration.',
+        '# TYPE job_seconds histogram',
+        'job_seconds_bucket{queue="mail",le="0.1"} 1',
+        'job_seconds_bucket{queue="mail",le="1.0"} 2',
+        'job_seconds_bucket{queue="mail",le="+Inf"} 3',
+        'job_seconds_sum{queue="mail"} 3.55',
+        'job_seconds_count{queue="mail"} 3',
+        'extra_gauge 1',
+    ]) + '\n'
+
+
+def test_requests_record_their_queries(metrics_app):
+    app = metrics_app(METRICS_SAMPLE_RATE=1.0, SLOW_QUERY_SECONDS=0.0)
+    client = app.test_client()
+    labels = '{endpoint="services.getAllServices"}'
+    before = client.get('/metrics').get_data(as_text=True)
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    # Queries of the request itself, not the token blocklist sync running in its own thread.
+    record = lambda conn, cursor, statement, *args: has_request_context() and statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get('/api/services/all', headers=app.test_headers).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    after = response.get_data(as_text=True)
+    change = lambda line: _value(after, line) - _value(before, line)
+    assert statements
+    assert change('http_requests_total{endpoint="services.getAllServices",method="GET",status="200"}') == 1
+    assert change('http_request_db_queries_count' + labels) == 1
+    assert change('http_request_db_queries_sum' + labels) == len(statements)
+    assert change('db_slow_queries_total' + labels) == len(statements) # Every query is slow with a 0s threshold.
+    assert change('http_request_db_seconds_count' + labels) == 1
+    assert '# TYPE db_pool_size gauge' in after
+
+
+def test_unsampled_requests_are_only_counted(metrics_app):
+    app = metrics_app(METRICS_SAMPLE_RATE=0.0)
+    client = app.test_client()
+    count = 'http_requests_total{endpoint="services.getAllServices",method="GET",status="200"}'
+    latency = 'http_request_duration_seconds_count{endpoint="services.getAllServices",method="GET"}'
+    before = client.get('/metrics').get_data(as_text=True)
+    client.get('/api/services/all', headers=app.test_headers)
+    after = client.get('/metrics').get_data(as_text=True)
+    assert _value(after, count) == _value(before, count) + 1
+    assert _value(after, latency) == _value(before, latency)
+
+
+def test_failed_queries_do_not_leave_their_start_behind(metrics_app):
+    app = metrics_app(METRICS_SAMPLE_RATE=1.0)
+    with app.test_request_context():
+        g.metrics_start, g.metrics_queries, g.metrics_db_time = time.perf_counter(), 0, 0.0
+        connection = db.session.connection()
+        try:
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM missing_table')
+            assert not connection.info.get('metrics_query_start')
+        finally:
+            db.session.rollback()
+
+
+def test_metrics_token(metrics_app):
+    app = metrics_app(METRICS_AUTH_TOKEN='scrape-token')
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
+
+
+def test_production_requires_a_metrics_token():
+    assert Config.METRICS_REQUIRE_TOKEN is False
+    assert ProductionConfig.METRICS_REQUIRE_TOKEN is True
+
+
+@pytest.mark.parametrize('token, status', [(None, 404), ('scrape-token', 200)])
+def test_metrics_are_only_served_with_the_required_token(metrics_app, token, status):
+    app = metrics_app(METRICS_REQUIRE_TOKEN=True, METRICS_AUTH_TOKEN=token)
+    assert app.test_client().get('/metrics', headers={'Authorization': f"Bearer {token}"}).status_code == status
@@ -0,0 +1,106 @@
+# Request profiler (app/profiling.py) and the admin only profiles endpoints.
+import threading
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app.extensions import db
+from app.models.users import User
+from app.profiling import ProfileStore, StackSampler, folded
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+def test_sampler_records_the_stacks_of_the_watched_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,))
+    worker.start()
+    sampler = StackSampler(worker.ident, 0.001)
+    sampler.start()
+    time.sleep(0.1)
+    samples = sampler.stop()
+    stop.set()
+    worker.join()
+
+    assert sum(samples.values()) > 0
+    assert not sampler.thread.is_alive()
+    for stack in samples:
+        frames = stack.split(';')
+        assert frames[0].startswith('_bootstrap (threading.py:') # Outermost frame first.
+        assert any(frame.startswith('_spin (test_profiling.py:') for frame in frames)
+
+
+def test_store_keeps_the_newest_profiles():
+    store = ProfileStore()
+    ids = [store.add({'endpoint': f"endpoint{i}"}, limit=3) for i in range(5)]
+    assert ids == [1, 2, 3, 4, 5]
+    assert [profile['id'] for profile in store.all()] == [5, 4, 3]
+    assert store.get(4)['endpoint'] == 'endpoint3'
+    assert store.get(1) is None
+
+
+def test_folded_format():
+    profile = {'samples': {'main;handler;query': 3, 'main;handler': 1}}
+    assert folded(profile) == 'main;handler 1\nmain;handler;query 3\n'
+
+
+@pytest.fixture
+def profiling_app(make_app):
+    app = make_app(PROFILE_SAMPLE_RATE=0.0, PROFILE_INTERVAL=0.0005)
+    with app.app_context():
+        customer_id = db.session.scalar(db.select(User.id).filter_by(email='customer0@kask.test'))
+        admin = {'Authorization': 'Bearer ' + create_access_token(identity=1)}
+        customer = {'Authorization': 'Bearer ' + create_access_token(identity=customer_id)}
+    return app, admin, customer
+
+
+def test_only_admins_profile_on_demand(profiling_app):
+    app, admin, customer = profiling_app
+    client = app.test_client()
+
+    assert 'X-Profile-Id' not in client.get('/api/services/all', headers=admin).headers
+    assert 'X-Profile-Id' not in client.get('/api/services/all', headers=dict(customer, **{'X-Profile': '1'})).headers
+    assert 'X-Profile-Id' not in client.get('/api/services/all', headers={'X-Profile': '1'}).headers
+
+    response = client.get('/api/services/all', headers=dict(admin, **{'X-Profile': '1'}))
+    assert response.status_code == 200
+    profile_id = int(response.headers['X-Profile-Id'])
+
+    listed = client.get('/api/profiles/all?endpoint=services.getAllServices', headers=admin).get_json()['Profiles']
+    assert listed[0]['id'] == profile_id
+    assert listed[0]['path'] == '/api/services/all' and listed[0]['status'] == 200
+    assert 'samples' not in listed[0]
+
+    profile = client.get(f"/api/profiles/{profile_id}", headers=admin).get_json()['Profile']
+    assert profile['total_samples'] == sum(profile['samples'].values())
+    text = client.get(f"/api/profiles/{profile_id}?format=folded", headers=admin)
+    assert text.mimetype == 'text/plain'
+    assert text.get_data(as_text=True) == folded(profile)
+
+
+def test_profiles_are_for_admins_only(profiling_app):
+    app, admin, customer = profiling_app
+    client = app.test_client()
+    profile_id = client.get('/api/services/all', headers=dict(admin, **{'X-Profile': '1'})).headers['X-Profile-Id']
+
+    assert client.get('/api/profiles/all', headers=customer).status_code == 401
+    assert client.get(f"/api/profiles/{profile_id}", headers=customer).status_code == 401
+    assert client.get('/api/profiles/all').status_code == 401
+    assert client.get('/api/profiles/999999', headers=admin).status_code == 404
+
+
+def test_profile_header_is_ignored_when_on_demand_profiling_is_off(make_app, monkeypatch):
+    import app.profiling as profiling
+
+    app = make_app(PROFILE_SAMPLE_RATE=0.0, PROFILE_ON_DEMAND=False)
+    with app.app_context():
+        admin = {'Authorization': 'Bearer ' + create_access_token(identity=1), 'X-Profile': '1'}
+    checks = []
+    monkeypatch.setattr(profiling, '_requested_by_admin', lambda: checks.append(1) or True)
+
+    assert 'X-Profile-Id' not in app.test_client().get('/api/services/all', headers=admin).headers
+    assert checks == []
@@ -0,0 +1,21 @@
+# Query count and latency budgets of the list endpoints that used to run one query per row (N+1).
+
+
+def test_get_all_customers_budget(client, admin_headers, query_guard):
+    # Customers, then all their bookings in one query.
+    response = query_guard.measure('users.getAllCustomers',
+                                   lambda: client.get('/api/users/customers', headers=admin_headers), max_queries=2)
+    assert response.get_json()['Total customers'] == 5
+
+
+def test_get_user_budget(client, admin_headers, query_guard):
+    response = query_guard.measure('users.getUser',
+                                   lambda: client.get('/api/users/user/2', headers=admin_headers), max_queries=2)
+    assert len(response.get_json()['User']['bookings']) == 3
+
+
+def test_get_all_bookings_budget(client, admin_headers, query_guard):
+    # Bookings joined with their users and services.
+    response = query_guard.measure('bookings.getAllBookings',
+                                   lambda: client.get('/api/bookings/all', headers=admin_headers), max_queries=1)
+    assert response.get_json()['Total_bookings'] == 15
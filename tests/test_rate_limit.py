@@ -0,0 +1,158 @@
+# Token bucket limits of the login and register endpoints.
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.rate_limit import ConcurrencyLimiter, MemoryBackend, concurrency, limiter, parse_limit, refill
+
+
+def test_parse_limit():
+    limit = parse_limit('10/minute')
+    assert (limit.count, limit.period) == (10, 60)
+    assert parse_limit('100/2 hours').period == 7200
+
+
+def test_bucket_refills_over_time():
+    limit = parse_limit('2/second')
+    tokens, retry_after = refill(0, 0.0, 0.25, limit)
+    assert tokens == 0.5 and retry_after == 0.25
+    tokens, retry_after = refill(tokens, 0.25, 0.5, limit)
+    assert tokens == 0 and retry_after == 0
+
+
+def test_login_burst_is_rejected_before_any_query(app, client):
+    app.config['RATE_LIMIT_LOGIN_IDENTIFIER'] = '3/minute'
+    try:
+        body = {'identifier': 'stuffing@kask.test', 'password': 'wrong-password'}
+        environ = {'REMOTE_ADDR': '10.0.0.1'}
+        statuses = [client.post('/api/login', json=body, environ_base=environ).status_code for _ in range(3)]
+        assert statuses == [401, 401, 401]
+
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(Engine, 'before_cursor_execute', record)
+        try:
+            response = client.post('/api/login', json=body, environ_base=environ)
+        finally:
+            event.remove(Engine, 'before_cursor_execute', record)
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert statements == []
+
+        # Another identifier from another address still gets in.
+        other = client.post('/api/login', json={'identifier': 'other@kask.test', 'password': 'x' * 8},
+                            environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        assert other.status_code == 401
+    finally:
+        app.config['RATE_LIMIT_LOGIN_IDENTIFIER'] = '5/minute'
+
+
+def test_register_is_limited_per_ip(app, client):
+    app.config['RATE_LIMIT_REGISTER_IP'] = '2/minute'
+    try:
+        environ = {'REMOTE_ADDR': '10.0.0.3'}
+        statuses = [client.post('/api/register', json={'email': f"new{i}@kask.test"}, environ_base=environ).status_code
+                    for i in range(3)]
+        assert statuses == [400, 400, 429]
+    finally:
+        app.config['RATE_LIMIT_REGISTER_IP'] = '5/minute'
+
+
+def test_pluggable_backend_is_shared(app, client):
+    # One store answering for every worker (stand-in for the shared Redis store).
+    shared = MemoryBackend()
+    previous = limiter.backend
+    limiter.backend = shared
+    try:
+        app.config['RATE_LIMIT_LOGIN_IP'] = '1/minute'
+        environ = {'REMOTE_ADDR': '10.0.0.4'}
+        assert client.post('/api/login', json={'identifier': 'a@kask.test', 'password': 'x'}, environ_base=environ).status_code == 401
+        assert 'login_ip:10.0.0.4' in shared.buckets
+        assert client.post('/api/login', json={'identifier': 'b@kask.test', 'password': 'x'}, environ_base=environ).status_code == 429
+    finally:
+        limiter.backend = previous
+        app.config['RATE_LIMIT_LOGIN_IP'] = '20/minute'
+
+
+def test_failing_backend_lets_requests_through(app, client):
+    class Broken:
+        def take(self, key, limit, cost=1):
+            raise ConnectionError('store unavailable')
+
+    previous = limiter.backend
+    limiter.backend = Broken()
+    try:
+        response = client.post('/api/login', json={'identifier': 'c@kask.test', 'password': 'x'},
+                               environ_base={'REMOTE_ADDR': '10.0.0.5'})
+        assert response.status_code == 401
+    finally:
+        limiter.backend = previous
+
+
+def test_route_quota_is_per_token(app, client, admin_headers):
+    previous = limiter.backend
+    limiter.backend = MemoryBackend()
+    app.config['RATE_LIMIT_ROUTES']['services.searchService'] = '2/minute'
+    try:
+        statuses = [client.get('/api/services/search?q=Pool', headers=admin_headers).status_code for _ in range(3)]
+        assert 429 not in statuses[:2] and statuses[2] == 429
+        assert 'services.searchService:user:1' in limiter.backend.buckets
+        # Other endpoints, and the same endpoint for anonymous clients, keep their own budget.
+        assert client.get('/api/services/all', headers=admin_headers).status_code == 200
+        assert client.get('/api/services/search?q=Pool').status_code != 429
+    finally:
+        limiter.backend = previous
+        app.config['RATE_LIMIT_ROUTES']['services.searchService'] = '120/minute'
+
+
+def test_concurrency_cap(app, client, admin_headers):
+    app.config['CONCURRENCY_QUEUE_TIMEOUT'] = 0.05
+    try:
+        # Two other clients hold both export slots: the request waits, then is turned away with a 503.
+        assert concurrency.acquire('analytics.exportBookings', 'user:100', 2, 2, 0) is None
+        assert concurrency.acquire('analytics.exportBookings', 'user:101', 2, 2, 0) is None
+        response = client.get('/api/analytics/export', headers=admin_headers)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+
+        # One client cannot take more than its share of the slots.
+        concurrency.release('analytics.exportBookings', 'user:101')
+        assert concurrency.acquire('analytics.exportBookings', 'user:100', 2, 1, 0) == 'client'
+        assert client.get('/api/analytics/export', headers=admin_headers).status_code == 200
+        assert concurrency.running == {'analytics.exportBookings': 1, ('analytics.exportBookings', 'user:100'): 1}
+    finally:
+        concurrency.release('analytics.exportBookings', 'user:100')
+        app.config['CONCURRENCY_QUEUE_TIMEOUT'] = 2.0
+
+
+def test_queued_requests_of_one_client_do_not_take_every_slot():
+    slots = ConcurrencyLimiter()
+    assert slots.acquire('ep', 'other:1', 2, 1, 0) is None
+    assert slots.acquire('ep', 'other:2', 2, 1, 0) is None
+
+    # The scraper queues requests while the endpoint is full.
+    results = []
+    waiting = [threading.Thread(target=lambda: results.append(slots.acquire('ep', 'scraper', 2, 1, 0.5)))
+               for _ in range(3)]
+    for thread in waiting:
+        thread.start()
+    time.sleep(0.05)
+    slots.release('ep', 'other:1')
+    slots.release('ep', 'other:2')
+    for thread in waiting:
+        thread.join()
+
+    assert sorted(results, key=str) == [None, 'client', 'client']
+    assert slots.running == {'ep': 1, ('ep', 'scraper'): 1}
+
+
+@pytest.mark.parametrize('x_for, limited', [(0, True), (1, False)])
+def test_clients_behind_the_proxy_get_buckets_of_their_own(make_app, x_for, limited):
+    app = make_app(PROXY_FIX_X_FOR=x_for, RATE_LIMIT_REGISTER_IP='1/minute')
+    client = app.test_client()
+    statuses = [client.post('/api/register', json={'email': f"new{i}@kask.test"}, environ_base={'REMOTE_ADDR': f"10.0.9.{x_for}"},
+                            headers={'X-Forwarded-For': f"203.0.113.{x_for * 10 + i}"}).status_code for i in range(2)]
+    assert statuses == ([400, 429] if limited else [400, 400])
@@ -0,0 +1,119 @@
+# Soft deletes: the delete request only marks the row, the background purge removes it with its dependents.
+from datetime import date, datetime, time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from conftest import PASSWORD
+from app.extensions import db, bcrypt
+from app.models.bookings import Booking
+from app.models.gallery import Gallery
+from app.models.messages import Message
+from app.models.services import Service
+from app.models.users import User
+from app.soft_delete import submit_purge
+
+
+def _add_customer(app, email, phone, bookings):
+    with app.app_context():
+        user = User(name='Leaving', email=email, phone=phone, address='Jinja',
+                    password=bcrypt.generate_password_hash(PASSWORD), user_type='customer')
+        db.session.add(user)
+        db.session.flush()
+        service_id = Service.query.first().id
+        for i in range(bookings):
+            db.session.add(Booking(start_time=time(8), end_time=time(9), total_price=10.0, booking_date=date.today(),
+                                   booking_status='confirmed', user_id=user.id, service_id=service_id))
+        db.session.add(Message(user.id, 1, 'Goodbye', datetime.now()))
+        db.session.commit()
+        return user.id
+
+
+def _statements(client, *args, **kwargs):
+    statements = []
+    record = lambda conn, cursor, statement, *rest: statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = client.delete(*args, **kwargs)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    return response, statements
+
+
+def test_deleting_a_user_is_one_update_and_the_purge_removes_the_rest(app, client, admin_headers):
+    app.config['PURGE_IN_BACKGROUND'] = False
+    try:
+        user_id = _add_customer(app, 'leaving@kask.test', '0719999999', bookings=40)
+        response, statements = _statements(client, f"/api/users/delete/{user_id}", headers=admin_headers)
+    finally:
+        app.config['PURGE_IN_BACKGROUND'] = True
+    assert response.status_code == 200
+    assert not [s for s in statements if s.lstrip().upper().startswith('DELETE')]
+
+    # Hidden from the API straight away, but the email stays taken until the purge.
+    assert client.get('/api/users/all', headers=admin_headers).get_json()['Total users'] == 6
+    register = client.post('/api/register', json={'name': 'Again', 'email': 'leaving@kask.test', 'phone': '0719999998',
+                                                  'address': 'Jinja', 'password': PASSWORD, 'user_type': 'customer'})
+    assert register.status_code == 409
+
+    app.config['PURGE_BATCH_SIZE'] = 7
+    try:
+        purged = submit_purge(app).result()
+    finally:
+        app.config['PURGE_BATCH_SIZE'] = 500
+    assert purged['users'] == 1 and purged['bookings'] == 40 and purged['messages'] == 1
+    with app.app_context():
+        assert db.session.get(User, user_id, execution_options={'include_deleted': True}) is None
+        assert Booking.query.filter_by(user_id=user_id).count() == 0
+        assert Message.query.filter_by(sender_id=user_id).count() == 0
+
+
+def test_deleted_service_is_hidden_then_purged_with_its_galleries(app, client, admin_headers):
+    with app.app_context():
+        service = Service('Sauna', 'Closing sauna', 'Sauna', 5.0, 'Available')
+        db.session.add(service)
+        db.session.flush()
+        db.session.add_all([Gallery(f"https://cdn.test/{i}.jpg", None, service.id) for i in range(3)])
+        db.session.commit()
+        service_id = service.id
+
+    app.config['PURGE_IN_BACKGROUND'] = False
+    try:
+        assert client.delete(f"/api/services/delete/{service_id}", headers=admin_headers).status_code == 200
+    finally:
+        app.config['PURGE_IN_BACKGROUND'] = True
+    assert client.get('/api/services/all', headers=admin_headers).get_json()['Total_services'] == 3
+    with app.app_context():
+        assert Service.query.execution_options(include_deleted=True).filter_by(id=service_id).count() == 1
+
+    purged = submit_purge(app).result()
+    assert purged['services'] == 1 and purged['galleries'] == 3
+    with app.app_context():
+        assert Gallery.query.filter_by(service_id=service_id).count() == 0
+        assert Service.query.execution_options(include_deleted=True).filter_by(id=service_id).count() == 0
+
+
+def test_foreign_keys_cascade_on_delete(app):
+    user_id = _add_customer(app, 'cascade@kask.test', '0719999997', bookings=2)
+    with app.app_context():
+        service = Service('Sauna', 'Cascading sauna', 'Sauna', 5.0, 'Available')
+        db.session.add(service)
+        db.session.flush()
+        db.session.add(Gallery('https://cdn.test/sauna.jpg', None, service.id))
+        booking = Booking(start_time=time(8), end_time=time(9), total_price=5.0, booking_date=date.today(),
+                          booking_status='confirmed', user_id=user_id, service_id=service.id)
+        db.session.add(booking)
+        db.session.commit()
+        service_id, booking_id = service.id, booking.id
+
+        # The database applies the rules, nothing is loaded by the ORM.
+        db.session.delete(db.session.get(Service, service_id))
+        db.session.commit()
+        assert Gallery.query.filter_by(service_id=service_id).count() == 0
+        assert db.session.get(Booking, booking_id).service_id is None
+
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+        assert Booking.query.filter_by(user_id=user_id).count() == 0
+        assert Message.query.filter_by(sender_id=user_id).count() == 0
+
@@ -0,0 +1,99 @@
+# Logout and token revocation, checked against the in-memory blocklist.
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from conftest import PASSWORD
+from app.extensions import db
+from app.models.token_revocations import TokenRevocation
+from app.token_blocklist import Blocklist, blocklist
+
+
+def _login(client, email):
+    user = client.post('/api/login', json={'identifier': email, 'password': PASSWORD}).get_json()['User']
+    return user['id'], {'Authorization': 'Bearer ' + user['access_token']}, user['refresh_token']
+
+
+def test_logout_revokes_access_and_refresh_tokens(client):
+    user_id, headers, refresh_token = _login(client, 'customer1@kask.test')
+    assert client.get(f"/api/users/user/{user_id}", headers=headers).status_code == 200
+
+    assert client.post('/api/logout', json={'refresh_token': refresh_token}, headers=headers).status_code == 200
+    response = client.get(f"/api/users/user/{user_id}", headers=headers)
+    assert response.status_code == 401
+    assert client.post('/api/refresh', headers={'Authorization': 'Bearer ' + refresh_token}).status_code == 401
+
+
+def test_revoked_check_runs_no_query(client):
+    user_id, headers, _ = _login(client, 'customer2@kask.test')
+    client.post('/api/logout', headers=headers)
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        assert client.get(f"/api/users/user/{user_id}", headers=headers).status_code == 401
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    assert statements == []
+
+
+def test_revocation_from_another_worker_is_synced(app, client):
+    user_id, headers, _ = _login(client, 'customer3@kask.test')
+    # A revocation written by another process: only in the table, not in this worker's memory.
+    with app.app_context():
+        revocation = TokenRevocation(user_id=user_id, expires_at=datetime.now() + timedelta(days=1))
+        revocation.revoked_at = datetime.now() + timedelta(seconds=1)
+        db.session.add(revocation)
+        db.session.commit()
+
+    blocklist.synced = None # The sync interval has passed.
+    # The request that finds the sync due starts it in the background and is not held up by it.
+    assert client.get(f"/api/users/user/{user_id}", headers=headers).status_code == 200
+    blocklist.thread.join()
+    assert str(user_id) in blocklist.users
+    assert client.get(f"/api/users/user/{user_id}", headers=headers).status_code == 401
+
+
+def test_revocation_committed_late_is_still_synced(app):
+    with app.app_context():
+        next_id = (db.session.query(db.func.max(TokenRevocation.id)).scalar() or 0) + 1
+        newer = TokenRevocation(user_id=998, expires_at=datetime.now() + timedelta(days=1))
+        newer.id = next_id + 1
+        db.session.add(newer)
+        db.session.commit()
+        blocklist.synced = None
+        blocklist.sync(db.session, 0)
+        assert blocklist.newest >= newer.revoked_at
+
+        # Revoked before the row above but committed after it was read.
+        late = TokenRevocation(user_id=999, expires_at=datetime.now() + timedelta(days=1))
+        late.id = next_id # The id was handed out first, the transaction committed last.
+        late.revoked_at = newer.revoked_at - timedelta(seconds=5)
+        db.session.add(late)
+        db.session.commit()
+
+        blocklist.synced = None
+        blocklist.sync(db.session, 0)
+    assert '999' in blocklist.users
+
+
+def test_logout_with_an_invalid_refresh_token_is_a_bad_request(client):
+    _, headers, _ = _login(client, 'customer0@kask.test')
+    response = client.post('/api/logout', json={'refresh_token': 'not.a.token'}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_logout_rolled_back_revokes_nothing(client):
+    user_id, headers, _ = _login(client, 'customer4@kask.test')
+    assert client.post('/api/logout', json={'refresh_token': 'not.a.token'}, headers=headers).status_code == 400
+    assert client.get(f"/api/users/user/{user_id}", headers=headers).status_code == 200
+
+
+def test_token_issued_in_the_second_of_a_logout_everywhere_is_valid():
+    revoked = Blocklist()
+    revoked.add(None, 5, 1000, None)
+    assert revoked.is_revoked({'sub': 5, 'iat': 999})
+    assert not revoked.is_revoked({'sub': 5, 'iat': 1000}) # e.g. the login right after the logout.
+    assert not revoked.is_revoked({'sub': 6, 'iat': 999})
@@ -0,0 +1,145 @@
+# Bulk user import: set based uniqueness checks, hashing in a process pool (the command), chunked inserts and the per
+# row report.
+import io
+import json
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from conftest import PASSWORD
+from app.extensions import db
+from app.models.users import User
+
+CSV = '''name,email,phone,address,password,user_type
+Guest 1,guest1@hotel.test,0720000001,Mbarara,longpassword1,
+Guest 2,guest2@hotel.test,0720000002,,longpassword2,customer
+Guest 3,guest1@hotel.test,0720000003,,longpassword3,
+Guest 4,customer0@kask.test,0720000004,,longpassword4,
+Guest 5,guest5@hotel.test,0710000001,,longpassword5,
+Guest 6,guest6@hotel.test,0720000006,,short,
+Guest 7,not-an-email,0720000007,,longpassword7,
+Guest 8,guest8@hotel.test,0720000008,,longpassword8,
+'''
+
+
+def _import(app, client, headers, **kwargs):
+    app.config.update(BCRYPT_LOG_ROUNDS=4)
+    try:
+        return client.post('/api/users/import', headers=headers, **kwargs)
+    finally:
+        app.config.update(BCRYPT_LOG_ROUNDS=12)
+
+
+def _remove_imported(app):
+    with app.app_context():
+        User.query.filter(User.email.like('%@hotel.test')).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def test_csv_upload_reports_every_failed_row(app, client, admin_headers):
+    statements = []
+    record = lambda conn, cursor, statement, *rest: statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        response = _import(app, client, admin_headers, content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(CSV.encode()), 'guests.csv')})
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+    try:
+        assert response.status_code == 201
+        body = response.get_json()
+        assert body['Imported'] == 3
+        assert {error['row']: error['Error'] for error in body['Errors']} == {
+            3: 'Email is repeated in the file.',
+            4: 'Email is already in use.',
+            5: 'Contact is already in use.',
+            6: 'Password is too short.',
+            7: 'Invalid email address.',
+        }
+        # Two lookups and one INSERT for the chunk, not two queries per user.
+        assert len([s for s in statements if s.lstrip().upper().startswith('INSERT INTO USERS')]) == 1
+        assert len([s for s in statements if 'FROM users' in s and 'users.email IN' in s]) == 1
+
+        login = client.post('/api/login', json={'identifier': 'guest1@hotel.test', 'password': 'longpassword1'})
+        assert login.status_code == 200
+        with app.app_context():
+            assert User.query.filter_by(email='guest2@hotel.test').first().user_type == 'customer'
+    finally:
+        _remove_imported(app)
+
+
+def test_ndjson_body_is_imported_in_chunks(app, client, admin_headers):
+    lines = [json.dumps({'name': f"Guest {i}", 'email': f"chunk{i}@hotel.test", 'phone': f"07300000{i:02d}",
+                         'password': PASSWORD}) for i in range(5)]
+    lines.insert(2, '{not json')
+    app.config['IMPORT_CHUNK_SIZE'] = 2
+    try:
+        response = _import(app, client, admin_headers, data='\n'.join(lines), content_type='application/x-ndjson')
+    finally:
+        app.config['IMPORT_CHUNK_SIZE'] = 1000
+
+    try:
+        body = response.get_json()
+        assert response.status_code == 201
+        assert body['Imported'] == 5
+        assert body['Errors'] == [{'row': 3, 'email': None, 'Error': 'Invalid JSON.'}]
+        with app.app_context():
+            assert User.query.filter(User.email.like('chunk%@hotel.test')).count() == 5
+    finally:
+        _remove_imported(app)
+
+
+def test_only_admins_import_users(client):
+    user = client.post('/api/login', json={'identifier': 'customer4@kask.test', 'password': PASSWORD}).get_json()['User']
+    response = client.post('/api/users/import', data=CSV, content_type='text/csv',
+                           headers={'Authorization': 'Bearer ' + user['access_token']})
+    assert response.status_code == 401
+
+
+def test_upload_is_capped_and_the_command_imports_the_rest(app, client, admin_headers, tmp_path):
+    lines = [json.dumps({'name': f"Guest {i}", 'email': f"cap{i}@hotel.test", 'phone': f"07400000{i:02d}",
+                         'password': PASSWORD}) for i in range(4)]
+    settings = {name: app.config[name] for name in ('IMPORT_MAX_ROWS', 'IMPORT_HASH_WORKERS')}
+    app.config['IMPORT_MAX_ROWS'] = 2
+    try:
+        response = _import(app, client, admin_headers, data='\n'.join(lines), content_type='application/x-ndjson')
+    finally:
+        app.config.update(settings)
+
+    path = tmp_path / 'guests.ndjson'
+    path.write_text('\n'.join(lines[2:]))
+    app.config.update(BCRYPT_LOG_ROUNDS=4, IMPORT_HASH_WORKERS=2)
+    try:
+        result = app.test_cli_runner().invoke(args=['import-users', str(path)])
+    finally:
+        app.config.update(settings, BCRYPT_LOG_ROUNDS=12)
+
+    try:
+        body = response.get_json()
+        assert body['Imported'] == 2
+        assert body['Errors'][0]['row'] == 3
+        assert '2 users imported, 0 rows failed.' in result.output
+        with app.app_context():
+            assert User.query.filter(User.email.like('cap%@hotel.test')).count() == 4
+    finally:
+        _remove_imported(app)
+
+
+def test_chunk_is_reported_when_the_retry_conflicts_too(app, client, admin_headers, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+    from app.user_import import UserImport
+
+    # Every insert conflicts, as when other registrations take the emails while the chunk is hashed and retried.
+    def conflict(self, users):
+        raise IntegrityError('INSERT INTO users', {}, Exception('Duplicate entry'))
+
+    monkeypatch.setattr(UserImport, '_insert', conflict)
+    response = _import(app, client, admin_headers, data=CSV, content_type='text/csv')
+
+    body = response.get_json()
+    assert response.status_code == 400
+    assert body['Imported'] == 0
+    assert {error['row'] for error in body['Errors']} == set(range(1, 9))
+    assert [error['Error'] for error in body['Errors'] if error['row'] in (1, 2, 8)] == \
+        ['Email or contact is already in use.'] * 3
@@ -0,0 +1,6 @@
+# Production entry point, used by gunicorn (see gunicorn.conf.py):
+#   gunicorn -c gunicorn.conf.py wsgi:app
+import os
+from app import create_app
+
+app = create_app(os.environ.get('FLASK_CONFIG', 'production'))